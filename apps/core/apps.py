@@ -3,4 +3,12 @@ from django.apps import AppConfig
 
 class CoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
-    name = 'apps.core'
\ No newline at end of file
+    name = 'apps.core'
+
+    def ready(self):
+        from utils.instrumentation import install_db_instrumentation
+        from utils.queries import install_query_inspection
+        from utils.tracing import install_db_tracing
+        install_db_instrumentation()
+        install_query_inspection()
+        install_db_tracing()
\ No newline at end of file
@@ -0,0 +1,135 @@
+"""
+Batched read-only API requests.
+
+    POST /api/v1/batch/
+    {"requests": [
+        {"path": "/api/v1/orders/cart-count/"},
+        {"path": "/api/v1/products/categories/"},
+        {"path": "/api/v1/products/products/?ids=4,8,15"}
+    ]}
+
+runs each GET in-process, in order, and answers with one response per
+sub-request:
+
+    {"responses": [{"path": "...", "status": 200, "body": {...}}, ...]}
+
+The caller is authenticated once, for the batch; DRF views reuse that
+user rather than authenticating again. Sub-requests run on the batch's
+thread, so they share its database connection, and skip the middleware
+stack the batch itself already went through. Async views (ASYNC_VIEWS)
+are run with async_to_sync. A failing sub-request only fails its own
+entry.
+"""
+
+import asyncio
+import json
+import logging
+from urllib.parse import urlsplit
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.http import Http404, HttpRequest, QueryDict
+from django.urls import Resolver404, resolve
+from rest_framework import serializers
+from rest_framework.permissions import AllowAny
+from rest_framework.renderers import BrowsableAPIRenderer
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from utils import tracing
+from utils.renderers import MessagePackRenderer, ORJSONRenderer
+
+logger = logging.getLogger(__name__)
+
+
+class SubRequestSerializer(serializers.Serializer):
+    method = serializers.ChoiceField(choices=['GET'], default='GET')
+    path = serializers.CharField()
+
+    def validate_path(self, value):
+        if not value.startswith('/api/'):
+            raise serializers.ValidationError('Only /api/ paths can be batched.')
+        return value
+
+
+class BatchSerializer(serializers.Serializer):
+    requests = SubRequestSerializer(many=True)
+
+    def validate_requests(self, value):
+        if not value:
+            raise serializers.ValidationError('At least one request is required.')
+        if len(value) > settings.API_BATCH_MAX_REQUESTS:
+            raise serializers.ValidationError(f'At most {settings.API_BATCH_MAX_REQUESTS} requests per batch.')
+        return value
+
+
+class BatchView(APIView):
+    # Each sub-request enforces its own view's permissions
+    permission_classes = [AllowAny]
+    renderer_classes = [ORJSONRenderer, BrowsableAPIRenderer, MessagePackRenderer]
+
+    def post(self, request):
+        serializer = BatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        responses = [
+            {'path': item['path'], **self.run(request, item['path'])}
+            for item in serializer.validated_data['requests']
+        ]
+        return Response({'responses': responses})
+
+    def run(self, request, path):
+        url = urlsplit(path)
+        try:
+            match = resolve(url.path)
+        except Resolver404:
+            return {'status': 404, 'body': {'detail': 'Not found.'}}
+        if getattr(match.func, 'view_class', None) is BatchView:
+            return {'status': 400, 'body': {'detail': 'Batches cannot be nested.'}}
+
+        with tracing.span(f'batch {url.path}', **{'http.target': path}):
+            try:
+                view = match.func
+                if asyncio.iscoroutinefunction(view):
+                    view = async_to_sync(view)
+                response = view(self.sub_request(request, url), *match.args, **match.kwargs)
+            except Http404:
+                return {'status': 404, 'body': {'detail': 'Not found.'}}
+            except Exception:
+                logger.exception("Batched request to %s failed", path)
+                return {'status': 500, 'body': {'detail': 'Server error.'}}
+        return {'status': response.status_code, 'body': self.body(response)}
+
+    def sub_request(self, request, url):
+        original = request._request
+        sub = HttpRequest()
+        sub.method = 'GET'
+        sub.path = sub.path_info = url.path
+        sub.META = {
+            **original.META,
+            'REQUEST_METHOD': 'GET',
+            'PATH_INFO': url.path,
+            'QUERY_STRING': url.query,
+        }
+        sub.META.pop('CONTENT_TYPE', None)
+        sub.META.pop('CONTENT_LENGTH', None)
+        sub.GET = QueryDict(url.query)
+        sub.COOKIES = original.COOKIES
+        if hasattr(original, 'session'):
+            sub.session = original.session
+        sub.user = request.user
+        if request.user.is_authenticated:
+            # DRF skips its authenticators for a forced user: one auth pass per batch
+            sub._force_auth_user = request.user
+            sub._force_auth_token = request.auth
+        return sub
+
+    def body(self, response):
+        # DRF responses are embedded unrendered; plain Django views are decoded
+        if hasattr(response, 'data'):
+            return response.data
+        if getattr(response, 'streaming', False):
+            return None
+        content = response.content
+        if response.get('Content-Type', '').startswith('application/json'):
+            return json.loads(content)
+        return content.decode(response.charset)
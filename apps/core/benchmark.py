@@ -0,0 +1,247 @@
+"""
+In-process storefront benchmark.
+
+Seeds a synthetic catalog, then has virtual users walk the real shopping
+flow through the Django test client: home -> product list (search and
+filters) -> product detail -> add to cart -> checkout -> pay. Stripe is the
+offline emulator, so nothing leaves the machine. Every request is timed and
+its SQL counted; results are summarised per endpoint and can be saved as
+JSON and compared with an earlier run.
+
+SQLite serialises writers, so checkout errors under concurrency there are
+lock contention; point PRIMARY_SQL_URL at Postgres for meaningful numbers.
+"""
+
+import json
+import random
+import statistics
+import threading
+import time
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.db import connections
+from django.test import Client
+
+from apps.accounts.models import User
+from apps.products.models import Category, Product
+from utils.queries import QueryRecorder
+
+CHECKOUT_FORM = {
+    'billing_first_name': 'Bench', 'billing_last_name': 'User',
+    'billing_address_1': '1 Load Test Way', 'billing_city': 'Seattle',
+    'billing_state': 'WA', 'billing_postal_code': '98101', 'billing_country': 'US',
+    'shipping_first_name': 'Bench', 'shipping_last_name': 'User',
+    'shipping_address_1': '1 Load Test Way', 'shipping_city': 'Seattle',
+    'shipping_state': 'WA', 'shipping_postal_code': '98101', 'shipping_country': 'US',
+}
+
+SEARCH_TERMS = ['widget', 'pro', 'mini', 'deluxe', 'classic']
+SORTS = ['name', 'price', '-price', '-created_at']
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of an unsorted list"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered) + 0.5) - 1))
+    return ordered[index]
+
+
+def seed_catalog(categories=10, products=500, users=50, seed=0):
+    """
+    Create a synthetic catalog and user base with bulk inserts.
+
+    Returns ((id, slug) per product, category slugs, user emails). Slugs are
+    set explicitly because bulk_create bypasses the models' save().
+    """
+    rng = random.Random(seed)
+    cats = Category.objects.bulk_create([
+        Category(name=f'Bench Category {i}', slug=f'bench-category-{i}')
+        for i in range(categories)
+    ])
+    adjectives = ['Classic', 'Deluxe', 'Mini', 'Pro', 'Eco', 'Smart']
+    Product.objects.bulk_create([
+        Product(
+            name=f'{rng.choice(adjectives)} Widget {i}',
+            slug=f'bench-widget-{i}',
+            sku=f'BENCH-{i:06d}',
+            category=rng.choice(cats),
+            description='Synthetic product for benchmarking',
+            price=Decimal(rng.randint(500, 50000)) / 100,
+            inventory_quantity=rng.randint(0, 500),
+            is_featured=rng.random() < 0.05,
+        )
+        for i in range(products)
+    ], batch_size=1000)
+
+    password = make_password('bench-password')
+    emails = [f'bench{i}@example.com' for i in range(users)]
+    User.objects.bulk_create([
+        User(username=f'bench{i}', email=email, password=password)
+        for i, email in enumerate(emails)
+    ], batch_size=1000)
+
+    products = list(Product.objects.filter(sku__startswith='BENCH-').values_list('id', 'slug'))
+    return products, [c.slug for c in cats], emails
+
+
+class Recorder:
+    """Thread-safe per-endpoint samples"""
+
+    def __init__(self):
+        self.samples = {}
+        self._lock = threading.Lock()
+
+    def add(self, endpoint, seconds, queries, ok):
+        with self._lock:
+            entry = self.samples.setdefault(endpoint, {'latency': [], 'queries': [], 'errors': 0})
+            entry['latency'].append(seconds)
+            entry['queries'].append(queries)
+            if not ok:
+                entry['errors'] += 1
+
+
+class VirtualUser:
+    """One shopper with its own client/session walking the storefront"""
+
+    def __init__(self, email, products, categories, recorder, rng, gateway):
+        self.client = Client()
+        self.client.force_login(User.objects.get(email=email))
+        self.products = products
+        self.categories = categories
+        self.recorder = recorder
+        self.rng = rng
+        self.gateway = gateway
+
+    def request(self, endpoint, method, path, expect=(200, 302), redirect_to=None, **kwargs):
+        queries = QueryRecorder()
+        start = time.perf_counter()
+        with queries.record():
+            response = getattr(self.client, method)(path, secure=True, **kwargs)
+        elapsed = time.perf_counter() - start
+        ok = response.status_code in expect
+        if redirect_to is not None:
+            # Form views redirect back to themselves on failure
+            ok = response.status_code == 302 and response['Location'] == redirect_to
+        self.recorder.add(endpoint, elapsed, queries.count, ok)
+        return response
+
+    def journey(self):
+        rng = self.rng
+        self.request('home', 'get', '/')
+        self.request('product_list', 'get', '/products/', data={
+            'search': rng.choice(SEARCH_TERMS),
+            'sort': rng.choice(SORTS),
+        })
+        self.request('product_list_filtered', 'get', '/products/', data={
+            'category': rng.choice(self.categories),
+            'min_price': 10,
+            'max_price': 300,
+        })
+
+        for product_id, slug in rng.sample(self.products, k=min(2, len(self.products))):
+            self.request('product_detail', 'get', f'/products/{slug}/')
+            self.request('add_to_cart', 'post', '/orders/cart/add/', data=json.dumps({
+                'product_id': product_id, 'quantity': rng.randint(1, 3),
+            }), content_type='application/json')
+
+        self.request('cart', 'get', '/orders/cart/')
+        self.request('checkout', 'get', '/orders/checkout/')
+        response = self.request('checkout_submit', 'post', '/orders/checkout/', data=CHECKOUT_FORM,
+                                redirect_to='/payments/process/')
+        if response['Location'] != '/payments/process/':
+            return
+
+        response = self.request('create_intent', 'post', '/payments/create-intent/',
+                                data='{}', content_type='application/json')
+        if response.status_code != 200:
+            return
+        intent_id = response.json()['client_secret'].split('_secret_')[0]
+        # Stand-in for Stripe.js confirming the card in the browser
+        self.gateway.confirm_payment_intent(intent_id, payment_method='pm_card_visa')
+        self.request('confirm_payment', 'post', '/payments/confirm/',
+                     data=json.dumps({'payment_intent_id': intent_id}),
+                     content_type='application/json')
+
+
+def run(emails, products, categories, journeys=1, concurrency=4, seed=0):
+    """Run ``journeys`` journeys per user on ``concurrency`` threads; returns results dict"""
+    from apps.payments import gateway
+
+    recorder = Recorder()
+    queue = [email for email in emails for _ in range(journeys)]
+    lock = threading.Lock()
+
+    def worker(index):
+        rng = random.Random(seed + index)
+        try:
+            while True:
+                with lock:
+                    if not queue:
+                        return
+                    email = queue.pop()
+                VirtualUser(email, products, categories, recorder, rng, gateway).journey()
+        finally:
+            connections.close_all()
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - started
+
+    return summarise(recorder, wall, concurrency)
+
+
+def summarise(recorder, wall, concurrency):
+    endpoints = {}
+    total = 0
+    for endpoint, entry in sorted(recorder.samples.items()):
+        latency = entry['latency']
+        total += len(latency)
+        endpoints[endpoint] = {
+            'requests': len(latency),
+            'errors': entry['errors'],
+            'p50_ms': round(percentile(latency, 50) * 1000, 2),
+            'p95_ms': round(percentile(latency, 95) * 1000, 2),
+            'p99_ms': round(percentile(latency, 99) * 1000, 2),
+            'mean_ms': round(statistics.fmean(latency) * 1000, 2),
+            'queries_per_request': round(statistics.fmean(entry['queries']), 2),
+            'max_queries': max(entry['queries']),
+            'throughput_rps': round(len(latency) / wall, 2),
+        }
+    return {
+        'concurrency': concurrency,
+        'wall_seconds': round(wall, 3),
+        'total_requests': total,
+        'throughput_rps': round(total / wall, 2) if wall else None,
+        'endpoints': endpoints,
+    }
+
+
+COMPARED_METRICS = ('p50_ms', 'p95_ms', 'p99_ms', 'queries_per_request')
+
+
+def compare(baseline, current, threshold=10.0):
+    """
+    Diff two result dicts per endpoint.
+
+    Returns a list of rows (endpoint, metric, before, after, change %, regressed)
+    where regressed means the metric got worse by more than ``threshold`` percent.
+    """
+    rows = []
+    for endpoint, after in current['endpoints'].items():
+        before = baseline.get('endpoints', {}).get(endpoint)
+        if before is None:
+            continue
+        for metric in COMPARED_METRICS:
+            old, new = before.get(metric), after.get(metric)
+            if old is None or new is None:
+                continue
+            change = ((new - old) / old * 100) if old else (0.0 if new == old else float('inf'))
+            rows.append((endpoint, metric, old, new, round(change, 1), change > threshold))
+    return rows
@@ -0,0 +1,387 @@
+"""
+Deterministic synthetic data at scale.
+
+Rows are generated in fixed-size shards. Every shard draws from its own
+NumPy generator seeded with (seed, entity, shard index), and primary keys
+are assigned up front from the current max id, so the output depends only
+on the seed and the requested counts -- never on how many worker processes
+did the inserting.
+
+Skew is modelled the way real shops look: category sizes and product
+popularity follow Zipf distributions (a few bestsellers, a long tail), a
+minority of customers place most orders, and order dates lean recent.
+"""
+
+import uuid
+from contextlib import contextmanager
+from datetime import timedelta
+from decimal import Decimal
+from functools import lru_cache
+
+import numpy as np
+from django.contrib.auth.hashers import make_password
+from django.core.management.color import no_style
+from django.db import connections
+from django.db.models import Max
+from django.utils import timezone
+
+from apps.accounts.models import User
+from apps.orders.models import Order, OrderItem
+from apps.payments.models import Payment
+from apps.products.models import Category, Product, ProductImage, ProductVariant, Review
+
+# Stable per-entity stream ids for the seed sequence
+ENTITY_CATEGORY = 1
+ENTITY_USER = 2
+ENTITY_PRODUCT = 3
+ENTITY_CATALOG_EXTRAS = 4
+ENTITY_REVIEW = 5
+ENTITY_ORDER = 6
+ENTITY_PRODUCT_RANK = 7
+ENTITY_USER_RANK = 8
+
+CATEGORY_ZIPF = 1.2
+PRODUCT_ZIPF = 1.1
+CUSTOMER_ZIPF = 0.9
+
+ADJECTIVES = np.array([
+    'Classic', 'Deluxe', 'Compact', 'Premium', 'Eco', 'Smart', 'Vintage', 'Ultra',
+    'Portable', 'Handmade', 'Organic', 'Wireless', 'Heavy-Duty', 'Essential', 'Pro',
+])
+NOUNS = np.array([
+    'Backpack', 'Lamp', 'Kettle', 'Headphones', 'Jacket', 'Mug', 'Blender', 'Notebook',
+    'Sneakers', 'Watch', 'Speaker', 'Chair', 'Candle', 'Tent', 'Camera', 'Scarf',
+])
+DEPARTMENTS = np.array([
+    'Home', 'Kitchen', 'Outdoor', 'Electronics', 'Fashion', 'Toys', 'Garden', 'Office',
+    'Sports', 'Beauty', 'Books', 'Pets', 'Automotive', 'Music', 'Travel',
+])
+VARIANT_NAMES = np.array(['Small', 'Medium', 'Large', 'Red', 'Blue', 'Black', 'White'])
+CITIES = np.array([
+    ('Seattle', 'WA', '98101'), ('Austin', 'TX', '73301'), ('Denver', 'CO', '80202'),
+    ('Boston', 'MA', '02108'), ('Chicago', 'IL', '60601'), ('Portland', 'OR', '97201'),
+    ('Miami', 'FL', '33101'), ('Phoenix', 'AZ', '85001'),
+])
+FIRST_NAMES = np.array(['Alex', 'Sam', 'Jordan', 'Taylor', 'Morgan', 'Casey', 'Riley', 'Jamie'])
+LAST_NAMES = np.array(['Smith', 'Nguyen', 'Garcia', 'Kim', 'Patel', 'Brown', 'Lopez', 'Chen'])
+
+ORDER_STATUSES = np.array(['delivered', 'shipped', 'confirmed', 'processing', 'pending', 'cancelled', 'refunded'])
+ORDER_STATUS_P = np.array([0.55, 0.10, 0.08, 0.05, 0.07, 0.10, 0.05])
+PAYMENT_STATUS_FOR_ORDER = {
+    'delivered': 'succeeded', 'shipped': 'succeeded', 'confirmed': 'succeeded',
+    'processing': 'succeeded', 'pending': 'pending', 'cancelled': 'failed', 'refunded': 'refunded',
+}
+RATING_P = np.array([0.05, 0.07, 0.13, 0.30, 0.45])
+
+# Timestamp fields that would otherwise be overwritten with "now" on insert
+HISTORIC_FIELDS = [
+    (Category, 'created_at'), (Product, 'created_at'), (Review, 'created_at'),
+    (User, 'created_at'), (Order, 'created_at'), (Payment, 'created_at'),
+]
+
+
+def rng_for(seed, entity, shard=0):
+    return np.random.default_rng([seed, entity, shard])
+
+
+@lru_cache(maxsize=16)
+def zipf_cdf(n, exponent):
+    weights = 1.0 / np.arange(1, n + 1) ** exponent
+    cdf = np.cumsum(weights)
+    return cdf / cdf[-1]
+
+
+@lru_cache(maxsize=16)
+def rank_permutation(seed, entity, n):
+    """Which row holds each popularity rank (so popularity isn't tied to id order)"""
+    return rng_for(seed, entity).permutation(n)
+
+
+def zipf_choice(rng, n, exponent, size, permutation=None):
+    """Draw ``size`` indices in [0, n) with Zipf(exponent) popularity"""
+    ranks = np.searchsorted(zipf_cdf(n, exponent), rng.random(size))
+    ranks = np.minimum(ranks, n - 1)
+    return permutation[ranks] if permutation is not None else ranks
+
+
+def money(values):
+    return [Decimal(f'{v:.2f}') for v in values]
+
+
+def past_datetimes(rng, size, days, now, recent_bias=1.0):
+    """Datetimes up to ``days`` ago; recent_bias > 1 leans them towards now"""
+    ago = rng.beta(1.0, recent_bias, size) * days * 86400
+    return [now - timedelta(seconds=float(s)) for s in ago]
+
+
+@contextmanager
+def historic_timestamps():
+    """Let bulk_create keep generated created_at values instead of auto_now_add"""
+    fields = [model._meta.get_field(name) for model, name in HISTORIC_FIELDS]
+    saved = [field.auto_now_add for field in fields]
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, value in zip(fields, saved):
+            field.auto_now_add = value
+
+
+def make_plan(counts, seed, batch_size=2000):
+    """
+    Reserve id ranges and fix everything the shards need to agree on.
+
+    The plan is a plain dict so it can be pickled to worker processes.
+    """
+    def next_id(model):
+        return (model.objects.using('default').aggregate(m=Max('id'))['m'] or 0) + 1
+
+    return {
+        'seed': seed,
+        'counts': counts,
+        'batch_size': batch_size,
+        'now': timezone.now(),
+        'category_start': next_id(Category),
+        'user_start': next_id(User),
+        'product_start': next_id(Product),
+        'password': make_password('seeded-password'),
+    }
+
+
+def shards(total, shard_size):
+    """(shard index, start, stop) offsets covering ``total`` rows"""
+    return [(i, start, min(start + shard_size, total)) for i, start in enumerate(range(0, total, shard_size))]
+
+
+def reset_sequences():
+    """Move Postgres sequences past the explicitly assigned ids"""
+    connection = connections['default']
+    statements = connection.ops.sequence_reset_sql(no_style(), [Category, User, Product])
+    if statements:
+        with connection.cursor() as cursor:
+            for sql in statements:
+                cursor.execute(sql)
+
+
+# Shard generators: each takes (plan, shard, start, stop) and returns rows written
+
+def generate_categories(plan, shard, start, stop):
+    rng = rng_for(plan['seed'], ENTITY_CATEGORY, shard)
+    ids = np.arange(start, stop) + plan['category_start']
+    departments = rng.choice(DEPARTMENTS, stop - start)
+    created = past_datetimes(rng, stop - start, 3 * 365, plan['now'])
+    Category.objects.bulk_create([
+        Category(
+            id=int(pk), name=f'{department} {pk}', slug=f'{department.lower()}-{pk}',
+            description=f'Everything {department.lower()}', created_at=created[i],
+        )
+        for i, (pk, department) in enumerate(zip(ids, departments))
+    ], batch_size=plan['batch_size'])
+    return len(ids)
+
+
+def generate_users(plan, shard, start, stop):
+    rng = rng_for(plan['seed'], ENTITY_USER, shard)
+    size = stop - start
+    ids = np.arange(start, stop) + plan['user_start']
+    first = rng.choice(FIRST_NAMES, size)
+    last = rng.choice(LAST_NAMES, size)
+    cities = rng.integers(0, len(CITIES), size)
+    joined = past_datetimes(rng, size, 3 * 365, plan['now'])
+    User.objects.bulk_create([
+        User(
+            id=int(pk), username=f'shopper{pk}', email=f'shopper{pk}@example.test',
+            password=plan['password'], first_name=first[i], last_name=last[i],
+            city=CITIES[cities[i]][0], state=CITIES[cities[i]][1],
+            postal_code=CITIES[cities[i]][2], country='US',
+            date_joined=joined[i], created_at=joined[i],
+        )
+        for i, pk in enumerate(ids)
+    ], batch_size=plan['batch_size'])
+    return size
+
+
+def generate_products(plan, shard, start, stop):
+    rng = rng_for(plan['seed'], ENTITY_PRODUCT, shard)
+    size = stop - start
+    ids = np.arange(start, stop) + plan['product_start']
+    categories = zipf_choice(rng, plan['counts']['categories'], CATEGORY_ZIPF, size) + plan['category_start']
+
+    prices = np.clip(rng.lognormal(3.4, 0.9, size), 1, 9999)
+    on_sale = rng.random(size) < 0.2
+    compare = prices * rng.uniform(1.1, 1.6, size)
+    inventory = np.where(rng.random(size) < 0.08, 0, rng.poisson(40, size))
+    featured = rng.random(size) < 0.01
+    adjectives = rng.choice(ADJECTIVES, size)
+    nouns = rng.choice(NOUNS, size)
+    created = past_datetimes(rng, size, 2 * 365, plan['now'])
+
+    price_values = money(prices)
+    compare_values = money(compare)
+    Product.objects.bulk_create([
+        Product(
+            id=int(pk), name=f'{adjectives[i]} {nouns[i]} {pk}',
+            slug=f'{adjectives[i].lower()}-{nouns[i].lower()}-{pk}', sku=f'SEED-{pk:09d}',
+            category_id=int(categories[i]),
+            description=f'A {adjectives[i].lower()} {nouns[i].lower()} for everyday use.',
+            short_description=f'{adjectives[i]} {nouns[i].lower()}',
+            price=price_values[i], compare_price=compare_values[i] if on_sale[i] else None,
+            inventory_quantity=int(inventory[i]), is_featured=bool(featured[i]),
+            created_at=created[i],
+        )
+        for i, pk in enumerate(ids)
+    ], batch_size=plan['batch_size'])
+    return size
+
+
+def generate_catalog_extras(plan, shard, start, stop):
+    """Variants and images for a shard of the products just generated"""
+    rng = rng_for(plan['seed'], ENTITY_CATALOG_EXTRAS, shard)
+    size = stop - start
+    ids = np.arange(start, stop) + plan['product_start']
+    variant_counts = np.minimum(rng.poisson(0.6, size), len(VARIANT_NAMES))
+    image_counts = rng.integers(1, 4, size)
+
+    variants = []
+    images = []
+    for i, pk in enumerate(ids):
+        names = rng.choice(VARIANT_NAMES, variant_counts[i], replace=False)
+        for k, name in enumerate(names):
+            variants.append(ProductVariant(
+                product_id=int(pk), name=str(name), sku=f'SEED-{pk:09d}-{k}',
+                price_adjustment=Decimal(int(rng.integers(0, 4)) * 5),
+                inventory_quantity=int(rng.poisson(15)),
+            ))
+        for k in range(image_counts[i]):
+            images.append(ProductImage(
+                product_id=int(pk), image=f'products/seed/{pk}_{k}.jpg',
+                alt_text=f'Product {pk} image {k + 1}', is_primary=k == 0, sort_order=k,
+            ))
+    ProductVariant.objects.bulk_create(variants, batch_size=plan['batch_size'])
+    ProductImage.objects.bulk_create(images, batch_size=plan['batch_size'])
+    return len(variants) + len(images)
+
+
+def generate_reviews(plan, shard, start, stop):
+    counts = plan['counts']
+    rng = rng_for(plan['seed'], ENTITY_REVIEW, shard)
+    size = stop - start
+    products = zipf_choice(
+        rng, counts['products'], PRODUCT_ZIPF, size,
+        rank_permutation(plan['seed'], ENTITY_PRODUCT_RANK, counts['products']),
+    ) + plan['product_start']
+    users = rng.integers(0, counts['users'], size) + plan['user_start']
+
+    # One review per (product, user); collisions across shards are ignored on insert
+    _, unique = np.unique(products * (counts['users'] + plan['user_start']) + users, return_index=True)
+    ratings = rng.choice(np.arange(1, 6), size, p=RATING_P)
+    approved = rng.random(size) < 0.9
+    verified = rng.random(size) < 0.6
+    created = past_datetimes(rng, size, 2 * 365, plan['now'], recent_bias=1.5)
+
+    Review.objects.bulk_create([
+        Review(
+            product_id=int(products[i]), user_id=int(users[i]), rating=int(ratings[i]),
+            title=f'{ratings[i]} stars', content='Synthetic review text.',
+            is_approved=bool(approved[i]), is_verified_purchase=bool(verified[i]),
+            created_at=created[i],
+        )
+        for i in sorted(unique)
+    ], batch_size=plan['batch_size'], ignore_conflicts=True)
+    return len(unique)
+
+
+def _product_snapshots(product_ids):
+    """id -> (price, name, sku) for the products an order shard references"""
+    snapshots = {}
+    ids = [int(pk) for pk in product_ids]
+    for i in range(0, len(ids), 5000):
+        rows = Product.objects.using('default').filter(id__in=ids[i:i + 5000]).values_list('id', 'price', 'name', 'sku')
+        for pk, price, name, sku in rows:
+            snapshots[pk] = (price, name, sku)
+    return snapshots
+
+
+def generate_orders(plan, shard, start, stop):
+    """Orders with their items and payments"""
+    counts = plan['counts']
+    now = plan['now']
+    rng = rng_for(plan['seed'], ENTITY_ORDER, shard)
+    size = stop - start
+
+    users = zipf_choice(
+        rng, counts['users'], CUSTOMER_ZIPF, size,
+        rank_permutation(plan['seed'], ENTITY_USER_RANK, counts['users']),
+    ) + plan['user_start']
+    statuses = rng.choice(ORDER_STATUSES, size, p=ORDER_STATUS_P)
+    item_counts = 1 + rng.poisson(1.5, size)
+    created = past_datetimes(rng, size, 365, now, recent_bias=2.0)
+    cities = rng.integers(0, len(CITIES), size)
+    first = rng.choice(FIRST_NAMES, size)
+    last = rng.choice(LAST_NAMES, size)
+    free_shipping = rng.random(size) < 0.4
+    uuids = rng.bytes(32 * size)
+
+    item_products = zipf_choice(
+        rng, counts['products'], PRODUCT_ZIPF, int(item_counts.sum()),
+        rank_permutation(plan['seed'], ENTITY_PRODUCT_RANK, counts['products']),
+    ) + plan['product_start']
+    quantities = 1 + rng.poisson(0.3, len(item_products))
+    snapshots = _product_snapshots(np.unique(item_products))
+
+    orders, items, payments = [], [], []
+    cursor = 0
+    for i in range(size):
+        order_id = uuid.UUID(bytes=uuids[32 * i:32 * i + 16], version=4)
+        payment_id = uuid.UUID(bytes=uuids[32 * i + 16:32 * i + 32], version=4)
+        status = str(statuses[i])
+        city, state, postal = CITIES[cities[i]]
+
+        subtotal = Decimal('0')
+        for k in range(cursor, cursor + item_counts[i]):
+            price, name, sku = snapshots[int(item_products[k])]
+            subtotal += price * int(quantities[k])
+            items.append(OrderItem(
+                order_id=order_id, product_id=int(item_products[k]), product_name=name,
+                product_sku=sku, unit_price=price, quantity=int(quantities[k]),
+            ))
+        cursor += item_counts[i]
+
+        tax = (subtotal * Decimal('0.08')).quantize(Decimal('0.01'))
+        shipping = Decimal('0') if free_shipping[i] else Decimal('5.99')
+        total = subtotal + tax + shipping
+        placed = created[i]
+        address = dict(
+            first_name=first[i], last_name=last[i], address_1=f'{100 + i % 900} Market St',
+            city=city, state=state, postal_code=postal, country='US',
+        )
+        orders.append(Order(
+            id=order_id, order_number=f'ORD-{placed:%Y%m%d}-{order_id.hex[:10].upper()}',
+            user_id=int(users[i]), email=f'shopper{users[i]}@example.test',
+            **{f'billing_{key}': value for key, value in address.items()},
+            **{f'shipping_{key}': value for key, value in address.items()},
+            subtotal=subtotal, tax_amount=tax, shipping_cost=shipping, total=total,
+            status=status, created_at=placed,
+            tracking_number=f'1Z{order_id.hex[:16].upper()}' if status in ('shipped', 'delivered') else '',
+            shipped_at=placed + timedelta(days=1) if status in ('shipped', 'delivered') else None,
+            delivered_at=placed + timedelta(days=4) if status == 'delivered' else None,
+        ))
+
+        payment_status = PAYMENT_STATUS_FOR_ORDER[status]
+        payments.append(Payment(
+            id=payment_id, order_id=order_id, user_id=int(users[i]), amount=total,
+            status=payment_status,
+            payment_method='stripe_card' if rng.random() < 0.9 else 'stripe_wallet',
+            stripe_payment_intent_id=f'pi_seed_{payment_id.hex}',
+            stripe_charge_id=f'ch_seed_{payment_id.hex}' if payment_status in ('succeeded', 'refunded') else '',
+            failure_reason='Your card was declined.' if payment_status == 'failed' else '',
+            created_at=placed,
+            processed_at=placed + timedelta(seconds=5) if payment_status != 'pending' else None,
+        ))
+
+    batch_size = plan['batch_size']
+    Order.objects.bulk_create(orders, batch_size=batch_size)
+    OrderItem.objects.bulk_create(items, batch_size=batch_size)
+    Payment.objects.bulk_create(payments, batch_size=batch_size)
+    return len(orders) + len(items) + len(payments)
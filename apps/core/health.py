@@ -0,0 +1,165 @@
+"""
+Deep health check: probes the databases, Redis and Blob storage in parallel.
+
+Each probe has a hard timeout and reports its latency. Results are cached
+per process for HEALTH_CHECK_CACHE_SECONDS and concurrent callers share
+one in-flight check, so a burst of load balancer probes can't stampede the
+dependencies it is checking.
+"""
+
+import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from django.conf import settings
+from django.db import connections
+from django.utils import timezone
+from django_redis import get_redis_connection
+
+from utils.db import ReplicaMonitor
+
+OK = 'ok'
+DEGRADED = 'degraded'
+UNHEALTHY = 'unhealthy'
+SKIPPED = 'skipped'
+
+# Probes outlive their timeout if the dependency hangs; a small dedicated
+# pool keeps them from piling up without bound
+_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix='health-probe')
+_lock = threading.Lock()
+_cached = None
+_cached_at = 0.0
+_in_flight = None  # {"done": Event, "result": ...} of the check being run
+
+# Driver option bounding how long opening a connection may take, by vendor
+CONNECT_TIMEOUT_OPTIONS = {'postgresql': 'connect_timeout', 'mysql': 'connect_timeout'}
+
+
+def probe_connection(alias):
+    """A private connection to ``alias`` that gives up connecting after HEALTH_CHECK_TIMEOUT"""
+    connection = connections.create_connection(alias)
+    option = CONNECT_TIMEOUT_OPTIONS.get(connection.vendor)
+    if option:
+        # Both drivers take whole seconds
+        timeout = max(1, math.ceil(settings.HEALTH_CHECK_TIMEOUT))
+        options = {**connection.settings_dict['OPTIONS'], option: timeout}
+        connection.settings_dict = {**connection.settings_dict, 'OPTIONS': options}
+    return connection
+
+
+def probe_database(alias):
+    connection = probe_connection(alias)
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1')
+            cursor.fetchone()
+        details = {}
+        if alias != 'default':
+            lag = ReplicaMonitor().measure_lag(alias, connection)
+            details['lag_seconds'] = round(lag, 3)
+            if lag > settings.DATABASE_REPLICA_MAX_LAG_SECONDS:
+                details['status'] = DEGRADED
+        return details
+    finally:
+        # Probe connections are never reused across checks
+        connection.close()
+
+
+def probe_cache():
+    get_redis_connection('default').ping()
+    return {}
+
+
+def probe_blob():
+    if not getattr(settings, 'AZURE_ACCOUNT_NAME', None):
+        # USE_AZURE_STORAGE is off: media is on local disk
+        return {'status': SKIPPED}
+    from apps.core.storage import AzureMediaStorage
+
+    # The media backend's own client, so the probe checks the endpoint
+    # and container that uploads and downloads actually use
+    AzureMediaStorage().client.get_container_properties(timeout=settings.HEALTH_CHECK_TIMEOUT)
+    return {}
+
+
+def _timed(probe, *args):
+    start = time.perf_counter()
+    try:
+        result = probe(*args)
+    except Exception as e:
+        return {'status': UNHEALTHY, 'error': f'{type(e).__name__}: {e}', 'latency_ms': _ms(start)}
+    result.setdefault('status', OK)
+    result['latency_ms'] = _ms(start)
+    if result['status'] == OK and result['latency_ms'] > settings.HEALTH_CHECK_SLOW_MS:
+        result['status'] = DEGRADED
+    return result
+
+
+def _ms(start):
+    return round((time.perf_counter() - start) * 1000, 2)
+
+
+def probes():
+    checks = {alias: (probe_database, alias) for alias in settings.DATABASES}
+    checks['cache'] = (probe_cache,)
+    checks['blob'] = (probe_blob,)
+    return checks
+
+
+def run_checks():
+    """Run every probe in parallel and summarise the result"""
+    start = time.perf_counter()
+    timeout = settings.HEALTH_CHECK_TIMEOUT
+    futures = {name: _executor.submit(_timed, *check) for name, check in probes().items()}
+    wait(futures.values(), timeout=timeout)
+
+    dependencies = {}
+    for name, future in futures.items():
+        if future.done():
+            dependencies[name] = future.result()
+        else:
+            dependencies[name] = {'status': UNHEALTHY, 'error': f'timed out after {timeout}s'}
+
+    critical = settings.HEALTH_CHECK_CRITICAL
+    status = OK
+    for name, result in dependencies.items():
+        if result['status'] == UNHEALTHY and name in critical:
+            status = UNHEALTHY
+            break
+        if result['status'] in (UNHEALTHY, DEGRADED):
+            status = DEGRADED
+
+    return {
+        'status': status,
+        'checked_at': timezone.now().isoformat(),
+        'duration_ms': _ms(start),
+        'dependencies': dependencies,
+    }
+
+
+def deep_health():
+    """Cached run_checks(); returns (result, served_from_cache)"""
+    global _cached, _cached_at, _in_flight
+
+    with _lock:
+        if _cached is not None and time.monotonic() - _cached_at < settings.HEALTH_CHECK_CACHE_SECONDS:
+            return _cached, True
+        flight = _in_flight
+        owner = flight is None
+        if owner:
+            flight = _in_flight = {'done': threading.Event(), 'result': None}
+
+    if not owner:
+        flight['done'].wait()
+        return flight['result'], True
+
+    try:
+        result = flight['result'] = run_checks()
+        with _lock:
+            _cached, _cached_at = result, time.monotonic()
+        return result, False
+    finally:
+        with _lock:
+            _in_flight = None
+        flight['done'].set()
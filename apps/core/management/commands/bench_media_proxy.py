@@ -0,0 +1,152 @@
+"""
+Management command to compare the sync and async media proxy under slow Blob Storage
+Usage: python manage.py bench_media_proxy [--latency-ms 100] [--requests 200] [--threads 8] [--concurrency 100]
+
+Serves blobs from a local stand-in for Blob Storage that answers every
+download after --latency-ms, then fetches the same paths through
+serve_azure_media with the test Client (a pool of --threads, as WSGI
+workers would) and serve_azure_media_async with AsyncClient (--concurrency
+requests on one event loop, as under ASGI). Both go through the full
+middleware stack. Needs no Azure account and touches no database.
+"""
+
+import asyncio
+import base64
+import logging
+import os
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+from django.core.management.base import BaseCommand
+from django.test import AsyncClient, Client, override_settings
+from django.urls import path
+
+from apps.core import views
+
+# Both variants side by side; the project's URLconf routes neither (private container)
+urlpatterns = [
+    path('sync/media-proxy/<path:path>', views.serve_azure_media),
+    path('async/media-proxy/<path:path>', views.serve_azure_media_async),
+]
+
+
+class FakeBlobHandler(BaseHTTPRequestHandler):
+    """Answers any blob GET with the same body after the server's latency"""
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        time.sleep(self.server.latency)
+        body = self.server.body
+        self.send_response(206 if self.headers.get('x-ms-range') or self.headers.get('Range') else 200)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Content-Range', f'bytes 0-{len(body) - 1}/{len(body)}')
+        self.send_header('Content-Type', 'application/octet-stream')
+        self.send_header('ETag', '"0x8DB0000000000"')
+        self.send_header('Last-Modified', formatdate(usegmt=True))
+        self.send_header('x-ms-blob-type', 'BlockBlob')
+        self.send_header('x-ms-version', self.headers.get('x-ms-version', '2021-08-06'))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeBlobServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 256  # The default backlog of 5 drops connection bursts
+
+
+class Command(BaseCommand):
+    help = 'Benchmark serve_azure_media (threads) against serve_azure_media_async (event loop)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--latency-ms', type=float, default=100, help='Injected Blob Storage latency')
+        parser.add_argument('--size', type=int, default=32 * 1024, help='Blob size in bytes')
+        parser.add_argument('--requests', type=int, default=200, help='Requests per variant')
+        parser.add_argument('--threads', type=int, default=8, help='Worker threads for the sync view')
+        parser.add_argument('--concurrency', type=int, default=100, help='In-flight requests for the async view')
+
+    def handle(self, *args, **options):
+        # The SDK logs every request and response at INFO
+        logging.getLogger('azure').setLevel(logging.WARNING)
+        server = FakeBlobServer(('127.0.0.1', 0), FakeBlobHandler)
+        server.latency = options['latency_ms'] / 1000
+        server.body = os.urandom(options['size'])
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+
+        environment = {
+            'USE_AZURE_STORAGE': 'True',
+            'AZURE_ACCOUNT_NAME': 'benchaccount',
+            'AZURE_BLOB_KEY': base64.b64encode(b'bench-key').decode(),
+            'AZURE_CONTAINER': 'media',
+            'AZURE_BLOB_ACCOUNT_URL': f'http://127.0.0.1:{server.server_port}/benchaccount',
+        }
+        paths = [f'products/bench-{i}.jpg' for i in range(options['requests'])]
+        self.stdout.write(
+            f"{len(paths)} requests per variant, {options['latency_ms']:.0f} ms blob latency, "
+            f"{options['size']} byte blobs"
+        )
+        try:
+            with mock.patch.dict(os.environ, environment), override_settings(ROOT_URLCONF=__name__):
+                self.report(f"sync, {options['threads']} threads", *self.run_sync(paths, options['threads']))
+                self.report(
+                    f"async, {options['concurrency']} in flight",
+                    *asyncio.run(self.run_async(paths, options['concurrency'])),
+                )
+        finally:
+            server.shutdown()
+        self.stdout.write(self.style.SUCCESS('Done'))
+
+    def run_sync(self, paths, threads):
+        local = threading.local()
+
+        def fetch(path):
+            # The test client isn't thread-safe: one per worker thread
+            client = getattr(local, 'client', None)
+            if client is None:
+                client = local.client = Client()
+            start = time.perf_counter()
+            response = client.get(f'/sync/media-proxy/{path}')
+            assert response.status_code == 200
+            b''.join(response.streaming_content if response.streaming else [response.content])
+            return time.perf_counter() - start
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            latencies = list(pool.map(fetch, paths))
+        return latencies, time.perf_counter() - start
+
+    async def run_async(self, paths, concurrency):
+        client = AsyncClient()
+        limit = asyncio.Semaphore(concurrency)
+
+        async def fetch(path):
+            async with limit:
+                start = time.perf_counter()
+                response = await client.get(f'/async/media-proxy/{path}')
+                assert response.status_code == 200
+                if response.streaming:
+                    async for _ in response.streaming_content:
+                        pass
+                return time.perf_counter() - start
+
+        start = time.perf_counter()
+        latencies = await asyncio.gather(*(fetch(path) for path in paths))
+        elapsed = time.perf_counter() - start
+        await views.async_blob_service().close()
+        return latencies, elapsed
+
+    def report(self, name, latencies, elapsed):
+        latencies = sorted(latencies)
+        p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+        self.stdout.write(
+            f'  {name:<24} {len(latencies) / elapsed:8.1f} req/s   '
+            f'p50 {statistics.median(latencies) * 1000:7.1f} ms   p95 {p95 * 1000:7.1f} ms'
+        )
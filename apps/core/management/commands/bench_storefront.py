@@ -0,0 +1,135 @@
+"""
+Management command to benchmark the storefront end to end
+Usage: python manage.py bench_storefront [--products 500] [--concurrency 4] [--output results.json] [--compare baseline.json]
+
+Runs against throwaway test databases (never the configured ones) and the
+offline Stripe emulator, so it is safe to run anywhere Redis is available.
+"""
+
+import json
+import os
+import tempfile
+
+import stripe
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test.utils import setup_databases, setup_test_environment, teardown_databases, teardown_test_environment
+
+from apps.core import benchmark
+from apps.payments.emulator import StripeEmulator
+
+
+class Command(BaseCommand):
+    help = 'Seed a synthetic catalog and benchmark the shopping flow per endpoint'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--categories', type=int, default=10, help='Categories to seed')
+        parser.add_argument('--products', type=int, default=500, help='Products to seed')
+        parser.add_argument('--users', type=int, default=20, help='Virtual users (one session each)')
+        parser.add_argument('--journeys', type=int, default=1, help='Shopping journeys per user')
+        parser.add_argument('--concurrency', type=int, default=4, help='Concurrent virtual users')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed for data and behaviour')
+        parser.add_argument('--stripe-latency-ms', type=float, default=0, help='Simulated Stripe latency')
+        parser.add_argument('--output', help='Write results as JSON to this path')
+        parser.add_argument('--compare', help='Compare with a previous JSON result')
+        parser.add_argument(
+            '--threshold',
+            type=float,
+            default=10.0,
+            help='Percent worsening that counts as a regression when comparing',
+        )
+        parser.add_argument(
+            '--fail-on-regression',
+            action='store_true',
+            help='Exit with an error if --compare finds a regression',
+        )
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options['compare']:
+            with open(options['compare']) as f:
+                baseline = json.load(f)
+
+        setup_test_environment()
+        self.use_file_sqlite()
+        old_config = setup_databases(verbosity=0, interactive=False)
+        emulator = StripeEmulator(latency=options['stripe_latency_ms'] / 1000, seed=options['seed'])
+        old_api_base, old_api_key = stripe.api_base, stripe.api_key
+        try:
+            stripe.api_base = emulator.start()
+            stripe.api_key = stripe.api_key or 'sk_test_emulator'
+
+            self.stdout.write('Seeding catalog...')
+            products, categories, emails = benchmark.seed_catalog(
+                categories=options['categories'],
+                products=options['products'],
+                users=options['users'],
+                seed=options['seed'],
+            )
+            self.stdout.write(f'Running {options["users"] * options["journeys"]} journeys...')
+            results = benchmark.run(
+                emails, products, categories,
+                journeys=options['journeys'],
+                concurrency=max(options['concurrency'], 1),
+                seed=options['seed'],
+            )
+        finally:
+            stripe.api_base, stripe.api_key = old_api_base, old_api_key
+            emulator.stop()
+            teardown_databases(old_config, verbosity=0)
+            teardown_test_environment()
+
+        results['options'] = {
+            key: options[key]
+            for key in ('categories', 'products', 'users', 'journeys', 'concurrency', 'seed', 'stripe_latency_ms')
+        }
+        self.report(results)
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(results, f, indent=2, sort_keys=True)
+            self.stdout.write(f'Results written to {options["output"]}')
+
+        if baseline is not None:
+            regressions = self.report_comparison(baseline, results, options['threshold'])
+            if regressions and options['fail_on_regression']:
+                raise CommandError(f'{regressions} metrics regressed by more than {options["threshold"]}%')
+
+    def use_file_sqlite(self):
+        """
+        Put SQLite test databases in a temp file instead of shared-cache memory.
+
+        In-memory shared-cache SQLite fails concurrent writers immediately with
+        "table is locked"; a file database makes them wait on the busy timeout.
+        """
+        connection = connections['default']
+        if connection.vendor != 'sqlite':
+            return
+        path = os.path.join(tempfile.mkdtemp(prefix='bench_storefront_'), 'bench.sqlite3')
+        connection.settings_dict['TEST']['NAME'] = path
+        connection.settings_dict.setdefault('OPTIONS', {}).setdefault('timeout', 30)
+
+    def report(self, results):
+        header = f'{"endpoint":<24}{"reqs":>6}{"err":>5}{"p50 ms":>9}{"p95 ms":>9}{"p99 ms":>9}{"queries":>9}{"rps":>8}'
+        self.stdout.write(header)
+        self.stdout.write('-' * len(header))
+        for endpoint, row in results['endpoints'].items():
+            self.stdout.write(
+                f'{endpoint:<24}{row["requests"]:>6}{row["errors"]:>5}{row["p50_ms"]:>9}'
+                f'{row["p95_ms"]:>9}{row["p99_ms"]:>9}{row["queries_per_request"]:>9}{row["throughput_rps"]:>8}'
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f'{results["total_requests"]} requests in {results["wall_seconds"]}s '
+            f'({results["throughput_rps"]} req/s, concurrency {results["concurrency"]})'
+        ))
+
+    def report_comparison(self, baseline, results, threshold):
+        regressions = 0
+        for endpoint, metric, old, new, change, regressed in benchmark.compare(baseline, results, threshold):
+            line = f'{endpoint:<24}{metric:<22}{old:>10} -> {new:<10} {change:+.1f}%'
+            if regressed:
+                regressions += 1
+                self.stdout.write(self.style.ERROR(line))
+            else:
+                self.stdout.write(line)
+        return regressions
@@ -0,0 +1,95 @@
+"""
+Management command to generate large volumes of realistic synthetic data
+Usage: python manage.py seed_scale_data [--products 1000000] [--orders 2000000] [--workers 8] [--seed 42]
+
+Output is deterministic for a given seed and set of counts, whatever the
+number of workers. Rows are added next to existing data; run it against a
+scratch database. Use --workers > 1 with Postgres only: SQLite allows a
+single writer.
+"""
+
+import multiprocessing
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from apps.core import datagen
+
+
+def _run_shard(job):
+    func, plan, shard, start, stop = job
+    try:
+        with datagen.historic_timestamps():
+            return func(plan, shard, start, stop)
+    finally:
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    help = 'Generate a large, skewed, deterministic synthetic dataset'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--categories', type=int, default=200)
+        parser.add_argument('--users', type=int, default=50000)
+        parser.add_argument('--products', type=int, default=100000)
+        parser.add_argument('--reviews', type=int, default=300000)
+        parser.add_argument('--orders', type=int, default=200000)
+        parser.add_argument('--seed', type=int, default=42, help='Random seed')
+        parser.add_argument('--workers', type=int, default=1, help='Worker processes')
+        parser.add_argument('--shard-size', type=int, default=10000, help='Rows generated per shard')
+        parser.add_argument('--batch-size', type=int, default=2000, help='Rows per INSERT')
+
+    def handle(self, *args, **options):
+        counts = {key: options[key] for key in ('categories', 'users', 'products', 'reviews', 'orders')}
+        if counts['products'] and not counts['categories']:
+            raise CommandError('Products need at least one category')
+        if (counts['reviews'] or counts['orders']) and not (counts['products'] and counts['users']):
+            raise CommandError('Reviews and orders need products and users')
+
+        workers = max(options['workers'], 1)
+        if workers > 1 and connections['default'].vendor == 'sqlite':
+            raise CommandError('SQLite allows a single writer; use --workers 1')
+
+        plan = datagen.make_plan(counts, options['seed'], options['batch_size'])
+        shard_size = options['shard_size']
+        phases = [
+            ('categories and users', [
+                (datagen.generate_categories, counts['categories']),
+                (datagen.generate_users, counts['users']),
+            ]),
+            ('products', [
+                (datagen.generate_products, counts['products']),
+            ]),
+            ('variants, images, reviews and orders', [
+                (datagen.generate_catalog_extras, counts['products']),
+                (datagen.generate_reviews, counts['reviews']),
+                (datagen.generate_orders, counts['orders']),
+            ]),
+        ]
+
+        # Children must open their own connections, never share the parent's
+        connections.close_all()
+        pool = multiprocessing.get_context('fork').Pool(workers) if workers > 1 else None
+        try:
+            for label, steps in phases:
+                jobs = [
+                    (func, plan, shard, start, stop)
+                    for func, total in steps
+                    for shard, start, stop in datagen.shards(total, shard_size)
+                ]
+                started = time.monotonic()
+                results = pool.imap_unordered(_run_shard, jobs) if pool else map(_run_shard, jobs)
+                rows = 0
+                for done, written in enumerate(results, start=1):
+                    rows += written
+                    self.stdout.write(f'  {label}: {done}/{len(jobs)} shards', ending='\r')
+                elapsed = time.monotonic() - started
+                self.stdout.write(f'{label}: {rows} rows in {elapsed:.1f}s ({rows / max(elapsed, 1e-9):,.0f} rows/s)')
+        finally:
+            if pool:
+                pool.close()
+                pool.join()
+
+        datagen.reset_sequences()
+        self.stdout.write(self.style.SUCCESS(f'Seeded {counts} with seed {options["seed"]}'))
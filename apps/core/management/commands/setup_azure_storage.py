@@ -10,6 +10,7 @@ from azure.core.exceptions import ResourceExistsError
 import os
 import environ
 from pathlib import Path
+from utils import tracing
 
 # Initialize environment and read .env file
 env = environ.Env()
@@ -42,7 +43,8 @@ class Command(BaseCommand):
             # Create BlobServiceClient
             blob_service_client = BlobServiceClient(
                 account_url=f"https://{account_name}.blob.core.windows.net",
-                credential=account_key
+                credential=account_key,
+                **tracing.blob_client_options()
             )
 
             self.stdout.write(f"Connecting to Azure Storage account: {account_name}")
@@ -2,10 +2,14 @@
 Custom Azure Storage backend that uses SAS tokens for private containers
 """
 
-from storages.backends.azure_storage import AzureStorage
+from azure.storage.blob import BlobServiceClient
+from storages.backends.azure_storage import AzureStorage, AzureStorageFile
+from storages.utils import setting
 from django.conf import settings
 import environ
 from urllib.parse import urlencode
+from utils import tracing
+from utils.instrumentation import BLOB_LATENCY
 
 # Initialize environment and read .env file
 env = environ.Env()
@@ -14,12 +18,42 @@ BASE_DIR = Path(__file__).resolve().parent.parent.parent
 environ.Env.read_env(BASE_DIR / '.env')
 
 
+class TimedAzureStorageFile(AzureStorageFile):
+    """Records blob download latency when the file is first read"""
+    
+    def _get_file(self):
+        if self._file is not None:
+            return self._file
+        with BLOB_LATENCY.time(operation='storage_open'):
+            return super()._get_file()
+    
+    file = property(_get_file, AzureStorageFile._set_file)
+
+
 class AzureMediaStorage(AzureStorage):
     """
     Custom Azure Storage backend that generates SAS token URLs
     for private containers that don't allow public access
     """
     
+    def __init__(self, **settings):
+        super().__init__(**settings)
+        # Trace every Blob Storage call this backend makes
+        self.client_options = {**self.client_options, **tracing.blob_client_options()}
+    
+    def get_default_settings(self):
+        return {**super().get_default_settings(), 'account_url': setting('AZURE_BLOB_ACCOUNT_URL')}
+    
+    def _get_service_client(self):
+        """Talk to AZURE_BLOB_ACCOUNT_URL rather than the endpoint django-storages derives"""
+        if self.connection_string is not None or not self.account_url:
+            return super()._get_service_client()
+        if self.account_key:
+            credential = {'account_name': self.account_name, 'account_key': self.account_key}
+        else:
+            credential = self.sas_token or self.token_credential
+        return BlobServiceClient(self.account_url, credential=credential, **self.client_options)
+    
     def url(self, name):
         """
         Override URL generation to use SAS token URLs for private Azure Storage
@@ -29,8 +63,11 @@ class AzureMediaStorage(AzureStorage):
         
         if sas_token:
             # Generate URL with SAS token
-            base_url = f"https://{settings.AZURE_ACCOUNT_NAME}.blob.core.windows.net/{settings.AZURE_CONTAINER}/{name}"
+            base_url = f"{self.account_url}/{settings.AZURE_CONTAINER}/{name}"
             return f"{base_url}?{sas_token}"
         else:
             # Fall back to default behavior
-            return super().url(name)
\ No newline at end of file
+            return super().url(name)
+    
+    def _open(self, name, mode="rb"):
+        return TimedAzureStorageFile(name, mode, self)
@@ -0,0 +1,195 @@
+import os
+import time
+from unittest import mock
+
+from asgiref.sync import async_to_sync, sync_to_async
+from django.db import connections, router, transaction
+from django.http import Http404, HttpResponse
+from django.template import Context, Template
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import NoReverseMatch, path, reverse
+
+from apps.core import health, views
+from apps.core.batch import BatchView
+from apps.orders.api.views import AsyncCartCountView
+from apps.products.models import Category, Product
+from utils import db
+from utils.queries import max_queries
+
+# /api/v1/orders/cart-count/ as ASYNC_VIEWS routes it
+urlpatterns = [
+    path('api/v1/orders/cart-count/', AsyncCartCountView.as_view()),
+    path('api/v1/batch/', BatchView.as_view()),
+]
+
+
+@override_settings(ASYNC_VIEWS=True, ROOT_URLCONF=__name__)
+class BatchViewTests(TestCase):
+    def test_async_sub_request(self):
+        response = self.client.post(
+            '/api/v1/batch/',
+            {'requests': [{'path': '/api/v1/orders/cart-count/'}, {'path': '/api/v1/missing/'}]},
+            content_type='application/json',
+            secure=True,  # SECURE_SSL_REDIRECT is on by default
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['responses'], [
+            {'path': '/api/v1/orders/cart-count/', 'status': 200, 'body': {'success': True, 'cart_total': 0}},
+            {'path': '/api/v1/missing/', 'status': 404, 'body': {'detail': 'Not found.'}},
+        ])
+
+
+class NPlusOneOriginTests(TestCase):
+    def setUp(self):
+        category = Category.objects.create(name='Board games')
+        for i in range(3):
+            Product.objects.create(name=f'Product {i}', category=category, description='', price=10, sku=f'SKU-{i}')
+
+    def test_origin_is_the_app_code_under_the_test(self):
+        with max_queries(100, threshold=3) as recorder:
+            for product in Product.objects.all():
+                product.featured_image
+        origins = {entry['origin'].split(':')[0] for entry in recorder.n_plus_one}
+        self.assertEqual(origins, {'apps/products/models.py'})
+
+    def test_queries_run_by_the_test_itself(self):
+        with max_queries(100, threshold=3) as recorder:
+            for product in Product.objects.all():
+                list(product.images.all())
+        [entry] = recorder.n_plus_one
+        self.assertEqual(entry['origin'], 'test code')
+
+    def test_templates_rendered_by_the_test(self):
+        template = Template('{% for product in products %}{{ product.images.count }}{% endfor %}')
+        with max_queries(100, threshold=3) as recorder:
+            template.render(Context({'products': Product.objects.all()}))
+        [entry] = recorder.n_plus_one
+        self.assertEqual(entry['origin'], 'template rendering')
+
+
+@mock.patch.dict(os.environ, {'USE_AZURE_STORAGE': 'True'})
+class MediaProxyTests(SimpleTestCase):
+    def test_not_routed(self):
+        with self.assertRaises(NoReverseMatch):
+            reverse('core:media_proxy', args=['products/a.jpg'])
+
+    def test_only_catalogue_images_are_served(self):
+        request = RequestFactory().get('/')
+        for path in ('avatars/a.jpg', 'orders/export.csv', 'products/../avatars/a.jpg'):
+            with self.subTest(path=path):
+                with self.assertRaises(Http404):
+                    views.serve_azure_media(request, path)
+                with self.assertRaises(Http404):
+                    async_to_sync(views.serve_azure_media_async)(request, path)
+
+
+@override_settings(DATABASE_REPLICA_MAX_LAG_SECONDS=5, DATABASE_READ_YOUR_WRITES_SECONDS=5)
+class ReplicaAwareRouterTests(TransactionTestCase):
+    """Not a TestCase: its open transaction pins every read to the primary"""
+
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        [self.router] = router.routers
+        self.assertIsInstance(self.router, db.ReplicaAwareRouter)
+        monitor = self.router.monitor
+        monitor.lag.clear()
+        # Measured just now: no lag probe during the test unless forced
+        monitor.checked_at = time.monotonic()
+        self.addCleanup(monitor.lag.clear)
+
+    def read_db(self):
+        return Category.objects.all().db
+
+    def request(self, read_before=False, write=False, cookies=None):
+        """Runs a request through ReadYourWritesMiddleware; returns (response, dbs its reads went to)"""
+        reads = []
+
+        def view(request):
+            if read_before:
+                reads.append(self.read_db())
+            if write:
+                Category.objects.create(name=f'Category {time.monotonic()}')
+            reads.append(self.read_db())
+            return HttpResponse()
+
+        request = RequestFactory().get('/')
+        request.COOKIES.update(cookies or {})
+        return db.ReadYourWritesMiddleware(view)(request), reads
+
+    def test_reads_go_to_the_replica(self):
+        Category.objects.create(name='Board games')
+        with CaptureQueriesContext(connections['replica']) as replica:
+            self.assertEqual([category.name for category in Category.objects.all()], ['Board games'])
+        self.assertEqual(len(replica), 1)
+
+    def test_reads_in_a_transaction_use_the_primary(self):
+        with transaction.atomic():
+            self.assertEqual(self.read_db(), 'default')
+        self.assertEqual(self.read_db(), 'replica')
+
+    def test_write_pins_the_rest_of_the_request_and_the_window_after(self):
+        response, reads = self.request(read_before=True, write=True)
+        self.assertEqual(reads, ['replica', 'default'])
+        cookie = response.cookies[db.PIN_COOKIE_NAME]
+        self.assertEqual(cookie['max-age'], 5)
+
+        _, reads = self.request(cookies={db.PIN_COOKIE_NAME: cookie.value})
+        self.assertEqual(reads, ['default'])
+        _, reads = self.request(cookies={db.PIN_COOKIE_NAME: str(time.time() - 1)})
+        self.assertEqual(reads, ['replica'])
+        # Outside a request nothing stays pinned
+        self.assertEqual(self.read_db(), 'replica')
+
+    def test_write_in_an_async_request_pins_its_later_reads(self):
+        reads = []
+
+        async def view(request):
+            await sync_to_async(Category.objects.create)(name='Board games')
+            reads.append(await sync_to_async(self.read_db)())
+            return HttpResponse()
+
+        response = async_to_sync(db.ReadYourWritesMiddleware(view))(RequestFactory().get('/'))
+        self.assertEqual(reads, ['default'])
+        self.assertIn(db.PIN_COOKIE_NAME, response.cookies)
+
+    def test_lagging_replica_falls_back_to_the_primary(self):
+        self.router.monitor.record_lag('replica', 60)
+        self.assertEqual(self.read_db(), 'default')
+        self.router.monitor.record_lag('replica', 1)
+        self.assertEqual(self.read_db(), 'replica')
+
+    def test_unreachable_replica_falls_back_to_the_primary(self):
+        with mock.patch.object(self.router.monitor, 'measure_lag', side_effect=ConnectionError('refused')):
+            self.router.monitor.refresh(['replica'], force=True)
+        self.assertEqual(self.read_db(), 'default')
+
+
+@override_settings(HEALTH_CHECK_TIMEOUT=1.5)
+class HealthProbeTests(TestCase):
+    def test_database_probe_uses_its_own_connection(self):
+        self.assertEqual(health.probe_database('default'), {})
+
+    def test_database_probe_connect_timeout(self):
+        from django.db.backends.postgresql.base import DatabaseWrapper
+
+        replica = DatabaseWrapper({
+            'ENGINE': 'django.db.backends.postgresql', 'NAME': 'shop', 'USER': '', 'PASSWORD': '',
+            'HOST': 'replica.internal', 'PORT': '', 'OPTIONS': {'sslmode': 'require'},
+        }, 'replica')
+        with mock.patch.object(connections, 'create_connection', return_value=replica):
+            params = health.probe_connection('replica').get_connection_params()
+        self.assertEqual((params['connect_timeout'], params['sslmode']), (2, 'require'))
+
+    @override_settings(
+        AZURE_ACCOUNT_NAME='devstoreaccount1', AZURE_ACCOUNT_KEY='a2V5', AZURE_CONTAINER='media',
+        AZURE_BLOB_ACCOUNT_URL='http://127.0.0.1:10000/devstoreaccount1',
+    )
+    def test_blob_probe_checks_the_storage_endpoint(self):
+        target = 'azure.storage.blob.ContainerClient.get_container_properties'
+        with mock.patch(target, autospec=True) as get_properties:
+            self.assertEqual(health.probe_blob(), {})
+        container = get_properties.call_args.args[0]
+        self.assertEqual(container.url, 'http://127.0.0.1:10000/devstoreaccount1/media')
+        self.assertEqual(get_properties.call_args.kwargs, {'timeout': 1.5})
@@ -6,4 +6,5 @@ app_name = 'core'
 urlpatterns = [
     path('', views.HomeView.as_view(), name='home'),
     path('health/', views.health_check, name='health'),
+    path('metrics', views.metrics_view, name='metrics'),
 ]
\ No newline at end of file
@@ -1,10 +1,18 @@
 from django.shortcuts import render
-from django.http import HttpResponse, Http404
+from django.http import HttpResponse, Http404, JsonResponse, StreamingHttpResponse
 from django.conf import settings
 from django.views.generic import TemplateView
+from azure.core.exceptions import ResourceNotFoundError
 from azure.storage.blob import BlobServiceClient
+from azure.storage.blob.aio import BlobServiceClient as AsyncBlobServiceClient
+from utils import metrics, tracing
+from . import health
+from utils.instrumentation import BLOB_LATENCY
+import asyncio
+import logging
 import mimetypes
 import os
+import weakref
 import environ
 
 # Initialize environment and read .env file
@@ -13,6 +21,8 @@ from pathlib import Path
 BASE_DIR = Path(__file__).resolve().parent.parent.parent
 environ.Env.read_env(BASE_DIR / '.env')
 
+logger = logging.getLogger(__name__)
+
 
 class HomeView(TemplateView):
     """Home page view"""
@@ -20,17 +30,50 @@ class HomeView(TemplateView):
 
 
 def health_check(request):
-    """Health check endpoint"""
-    return HttpResponse("OK", content_type="text/plain")
+    """
+    Health check endpoint
+
+    Plain "OK" for liveness; ?deep=1 probes every dependency and returns
+    JSON, with a 503 when a critical dependency is unhealthy.
+    """
+    if not request.GET.get('deep'):
+        return HttpResponse("OK", content_type="text/plain")
+
+    result, cached = health.deep_health()
+    status = 503 if result['status'] == health.UNHEALTHY else 200
+    response = JsonResponse({**result, 'cached': cached}, status=status)
+    response['Cache-Control'] = 'no-store'
+    return response
+
+
+def metrics_view(request):
+    """Prometheus scrape endpoint (all workers when METRICS_MULTIPROC_DIR is set)"""
+    token = settings.METRICS_TOKEN
+    if token and request.headers.get('Authorization') != f'Bearer {token}':
+        return HttpResponse(status=401)
+    body = metrics.exposition(metrics.registry.collect())
+    return HttpResponse(body, content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+# Blobs the media views may serve: catalogue images, public anyway. The
+# container is private, so anything else (avatars, say) stays unreachable
+PUBLIC_MEDIA_PREFIXES = ('products/', 'categories/')
+
+
+def check_media_path(path):
+    if not path.startswith(PUBLIC_MEDIA_PREFIXES) or '..' in path.split('/'):
+        raise Http404("File not found")
 
 
 def serve_azure_media(request, path):
     """
     Serve media files from Azure Blob Storage with authentication
-    This handles private storage containers
+    This handles private storage containers; only PUBLIC_MEDIA_PREFIXES
+    are served, and the views are not routed by default
     """
     if not env.bool('USE_AZURE_STORAGE', default=False):
         raise Http404("Azure Storage not configured")
+    check_media_path(path)
     
     try:
         # Get Azure credentials
@@ -40,8 +83,9 @@ def serve_azure_media(request, path):
         
         # Create blob service client
         blob_service_client = BlobServiceClient(
-            account_url=f"https://{account_name}.blob.core.windows.net",
-            credential=account_key
+            account_url=blob_account_url(account_name),
+            credential=account_key,
+            **tracing.blob_client_options()
         )
         
         # Get blob client
@@ -51,8 +95,9 @@ def serve_azure_media(request, path):
         )
         
         # Download blob content
-        blob_data = blob_client.download_blob()
-        content = blob_data.readall()
+        with BLOB_LATENCY.time(operation='serve_media'):
+            blob_data = blob_client.download_blob()
+            content = blob_data.readall()
         
         # Determine content type
         content_type, _ = mimetypes.guess_type(path)
@@ -69,4 +114,55 @@ def serve_azure_media(request, path):
         
     except Exception as e:
         print(f"Error serving media file {path}: {e}")
-        raise Http404("File not found")
\ No newline at end of file
+        raise Http404("File not found")
+
+
+def blob_account_url(account_name):
+    """Blob endpoint; AZURE_BLOB_ACCOUNT_URL points elsewhere (e.g. Azurite)"""
+    return env('AZURE_BLOB_ACCOUNT_URL', default='') or f"https://{account_name}.blob.core.windows.net"
+
+
+# One pooled async client per event loop; aiohttp sessions can't cross loops
+_async_blob_services = weakref.WeakKeyDictionary()
+
+
+def async_blob_service():
+    loop = asyncio.get_running_loop()
+    service = _async_blob_services.get(loop)
+    if service is None:
+        account_name = env('AZURE_ACCOUNT_NAME')
+        service = _async_blob_services[loop] = AsyncBlobServiceClient(
+            account_url=blob_account_url(account_name),
+            credential=env('AZURE_BLOB_KEY'),
+            **tracing.blob_client_options()
+        )
+    return service
+
+
+async def serve_azure_media_async(request, path):
+    """
+    serve_azure_media for ASGI deployments (ASYNC_VIEWS): the download is
+    awaited and streamed, so a slow blob holds no worker thread
+    """
+    if not env.bool('USE_AZURE_STORAGE', default=False):
+        raise Http404("Azure Storage not configured")
+    check_media_path(path)
+    
+    blob_client = async_blob_service().get_blob_client(
+        container=env('AZURE_CONTAINER', default='media'),
+        blob=path
+    )
+    try:
+        with BLOB_LATENCY.time(operation='serve_media'):
+            downloader = await blob_client.download_blob()
+    except ResourceNotFoundError:
+        raise Http404("File not found")
+    except Exception as e:
+        logger.warning("Error serving media file %s: %s", path, e)
+        raise Http404("File not found")
+    
+    content_type, _ = mimetypes.guess_type(path)
+    response = StreamingHttpResponse(downloader.chunks(), content_type=content_type or 'application/octet-stream')
+    response['Content-Length'] = str(downloader.size)
+    response['Cache-Control'] = 'public, max-age=3600'  # 1 hour cache
+    return response
@@ -1,5 +1,7 @@
+from django import forms
 from django.contrib import admin
 from .models import Order, OrderItem, OrderStatusHistory, Cart, CartItem, ShippingMethod
+from . import state_machine
 
 
 class OrderItemInline(admin.TabularInline):
@@ -14,13 +16,30 @@ class OrderStatusHistoryInline(admin.TabularInline):
     readonly_fields = ['created_at']
 
 
+class OrderAdminForm(forms.ModelForm):
+    class Meta:
+        model = Order
+        fields = '__all__'
+    
+    def clean_status(self):
+        status = self.cleaned_data['status']
+        old_status = self.instance.status
+        if self.instance._state.adding or status == old_status:
+            return status
+        if not state_machine.can_transition(old_status, status):
+            raise forms.ValidationError(f"An order cannot go from {old_status} to {status}.")
+        return status
+
+
 @admin.register(Order)
 class OrderAdmin(admin.ModelAdmin):
+    form = OrderAdminForm
     list_display = ['order_number', 'user', 'email', 'status', 'total', 'created_at']
     list_filter = ['status', 'created_at', 'updated_at']
-    search_fields = ['order_number', 'user__email', 'email']
+    search_fields = ['order_number', 'user__email', 'email', 'tracking_number']
     readonly_fields = ['id', 'order_number', 'created_at', 'updated_at']
     inlines = [OrderItemInline, OrderStatusHistoryInline]
+    actions = ['mark_processing', 'mark_shipped', 'mark_delivered', 'mark_cancelled']
     
     fieldsets = (
         ('Order Information', {
@@ -40,13 +59,50 @@ class OrderAdmin(admin.ModelAdmin):
             'fields': ('subtotal', 'tax_amount', 'shipping_cost', 'discount_amount', 'total')
         }),
         ('Fulfillment', {
-            'fields': ('tracking_number', 'shipped_at', 'delivered_at')
+            'fields': ('tracking_number', 'carrier', 'shipped_at', 'delivered_at')
         }),
         ('Timestamps', {
             'fields': ('created_at', 'updated_at'),
             'classes': ('collapse',)
         })
     )
+    
+    def save_model(self, request, obj, form, change):
+        new_status = obj.status
+        if change and 'status' in form.changed_data:
+            # The state machine moves the status, with history
+            obj.status = form.initial['status']
+        super().save_model(request, obj, form, change)
+        if obj.status != new_status:
+            # A timestamp filled in on the form wins over the current time
+            timestamp = state_machine.TIMESTAMP_FIELDS.get(new_status)
+            at = getattr(obj, timestamp) if timestamp else None
+            state_machine.transition(obj, new_status, user=request.user, notes='Changed in admin', at=at)
+    
+    def move_selected(self, request, queryset, new_status):
+        result = state_machine.bulk_transition(
+            queryset.values_list('id', flat=True), new_status, user=request.user, notes='Changed in admin'
+        )
+        message = f"{len(result.changed)} orders marked {new_status}."
+        if result.rejected:
+            message += f" {len(result.rejected)} could not be (already {new_status} or past it)."
+        self.message_user(request, message)
+    
+    def mark_processing(self, request, queryset):
+        self.move_selected(request, queryset, 'processing')
+    mark_processing.short_description = "Mark selected orders processing"
+    
+    def mark_shipped(self, request, queryset):
+        self.move_selected(request, queryset, 'shipped')
+    mark_shipped.short_description = "Mark selected orders shipped"
+    
+    def mark_delivered(self, request, queryset):
+        self.move_selected(request, queryset, 'delivered')
+    mark_delivered.short_description = "Mark selected orders delivered"
+    
+    def mark_cancelled(self, request, queryset):
+        self.move_selected(request, queryset, 'cancelled')
+    mark_cancelled.short_description = "Cancel selected orders"
 
 
 class CartItemInline(admin.TabularInline):
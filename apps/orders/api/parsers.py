@@ -0,0 +1,35 @@
+"""
+Parsers for FulfillmentView's streamed bodies.
+
+request.data comes back as a lazy iterator of rows, so the body is read
+(and its rows applied) as it arrives instead of being loaded whole.
+"""
+
+import codecs
+import csv
+
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+
+from .. import fulfillment
+
+
+class CSVParser(BaseParser):
+    """text/csv with a header row"""
+
+    media_type = 'text/csv'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return fulfillment.read_csv(codecs.iterdecode(stream, 'utf-8-sig', errors='replace'))
+        except (ValueError, csv.Error) as e:
+            raise ParseError(f'CSV parse error - {e}')
+
+
+class JSONLinesParser(BaseParser):
+    """application/x-ndjson: one JSON object per line"""
+
+    media_type = 'application/x-ndjson'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        return fulfillment.read_ndjson(codecs.iterdecode(stream, 'utf-8', errors='replace'))
@@ -1,15 +1,17 @@
 from rest_framework import serializers
+from utils.serializers import DynamicFieldsMixin
 from ..models import Order, OrderItem, Cart, CartItem
 from apps.products.api.serializers import ProductSerializer
 
 
-class OrderItemSerializer(serializers.ModelSerializer):
+class OrderItemSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = OrderItem
         fields = ['id', 'product_name', 'product_sku', 'unit_price', 'quantity', 'subtotal']
+        field_dependencies = {'subtotal': ['unit_price', 'quantity']}
 
 
-class OrderSerializer(serializers.ModelSerializer):
+class OrderSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     items = OrderItemSerializer(many=True, read_only=True)
     status_display = serializers.CharField(source='get_status_display', read_only=True)
     
@@ -20,20 +22,30 @@ class OrderSerializer(serializers.ModelSerializer):
             'billing_first_name', 'billing_last_name', 'full_billing_address',
             'shipping_first_name', 'shipping_last_name', 'full_shipping_address',
             'subtotal', 'tax_amount', 'shipping_cost', 'discount_amount', 'total',
-            'tracking_number', 'items', 'created_at', 'updated_at'
+            'tracking_number', 'carrier', 'items', 'created_at', 'updated_at'
         ]
+        expandable = ['items']
+        default_expand = ['items']
+        field_dependencies = {
+            'status_display': ['status'],
+            'full_billing_address': ['billing_address_1', 'billing_city', 'billing_state', 'billing_postal_code'],
+            'full_shipping_address': ['shipping_address_1', 'shipping_city', 'shipping_state', 'shipping_postal_code'],
+        }
 
 
-class CartItemSerializer(serializers.ModelSerializer):
+class CartItemSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     product = ProductSerializer(read_only=True)
     subtotal = serializers.ReadOnlyField()
     
     class Meta:
         model = CartItem
         fields = ['id', 'product', 'variant', 'quantity', 'price', 'subtotal']
+        expandable = ['product']
+        default_expand = ['product']
+        field_dependencies = {'subtotal': ['price', 'quantity']}
 
 
-class CartSerializer(serializers.ModelSerializer):
+class CartSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     items = CartItemSerializer(many=True, read_only=True)
     total_items = serializers.ReadOnlyField()
     subtotal = serializers.ReadOnlyField()
@@ -41,6 +53,12 @@ class CartSerializer(serializers.ModelSerializer):
     class Meta:
         model = Cart
         fields = ['id', 'items', 'total_items', 'subtotal', 'created_at', 'updated_at']
+        expandable = ['items']
+        default_expand = ['items']
+        field_dependencies = {
+            'total_items': ['items__quantity'],
+            'subtotal': ['items__price', 'items__quantity'],
+        }
 
 
 class AddToCartSerializer(serializers.Serializer):
@@ -1,6 +1,7 @@
+from django.conf import settings
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import OrderViewSet, CartViewSet, CartCountView, UpdateCartAPIView
+from .views import OrderViewSet, CartViewSet, CartCountView, AsyncCartCountView, UpdateCartAPIView, FulfillmentView
 
 router = DefaultRouter()
 router.register(r'orders', OrderViewSet)
@@ -8,6 +9,7 @@ router.register(r'cart', CartViewSet, basename='cart')
 
 urlpatterns = [
     path('', include(router.urls)),
-    path('cart-count/', CartCountView.as_view(), name='cart-count'),
+    path('cart-count/', (AsyncCartCountView if settings.ASYNC_VIEWS else CartCountView).as_view(), name='cart-count'),
     path('update-cart/', UpdateCartAPIView.as_view(), name='update-cart'),
+    path('fulfillment/', FulfillmentView.as_view(), name='fulfillment'),
 ]
\ No newline at end of file
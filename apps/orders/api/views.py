@@ -1,19 +1,30 @@
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.authentication import BasicAuthentication, SessionAuthentication
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import BrowsableAPIRenderer
+from rest_framework.views import APIView
 from django.shortcuts import get_object_or_404
+from django.db.models import Sum
 from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
 from django.views import View
+from .. import fulfillment
 from ..models import Order, Cart, CartItem
 from apps.products.models import Product, ProductVariant
+from .parsers import CSVParser, JSONLinesParser
 from .serializers import OrderSerializer, CartSerializer, CartItemSerializer, AddToCartSerializer
+from utils import aio
+from utils.renderers import MessagePackRenderer, ORJSONRenderer
+from utils.serializers import DynamicFieldsViewMixin, QueryPlan, Selection
 import json
+from collections.abc import Iterator
 
 
-class OrderViewSet(viewsets.ReadOnlyModelViewSet):
+class OrderViewSet(DynamicFieldsViewMixin, viewsets.ReadOnlyModelViewSet):
     queryset = Order.objects.all()  # Base queryset (will be filtered in get_queryset)
     serializer_class = OrderSerializer
     permission_classes = [IsAuthenticated]
@@ -22,13 +33,47 @@ class OrderViewSet(viewsets.ReadOnlyModelViewSet):
         return Order.objects.filter(user=self.request.user).prefetch_related('items')
 
 
+class FulfillmentView(APIView):
+    """
+    Bulk shipping updates for the warehouse (see apps/orders/fulfillment.py).
+    
+    POST rows of order_number, tracking_number, carrier, shipped_at as
+    text/csv (with a header row), application/x-ndjson or a JSON array.
+    CSV and JSON lines bodies are read and applied as they stream in
+    (parsers.py). Answers with per-row results and their counts:
+    
+        {"summary": {"shipped": 2, "error": 1},
+         "results": [{"row": 1, "order_number": "...", "result": "shipped"}, ...]}
+    """
+    # Basic auth lets warehouse scripts post as a staff account without CSRF
+    authentication_classes = [SessionAuthentication, BasicAuthentication]
+    permission_classes = [IsAdminUser]
+    parser_classes = [JSONParser, CSVParser, JSONLinesParser]
+    renderer_classes = [ORJSONRenderer, BrowsableAPIRenderer, MessagePackRenderer]
+    
+    def post(self, request):
+        rows = request.data
+        if isinstance(rows, dict):
+            rows = rows.get('rows')
+        if not isinstance(rows, (list, Iterator)):
+            return Response(
+                {'detail': 'Expected a list of rows (a JSON array, {"rows": [...]}, CSV or JSON lines)'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        results = list(fulfillment.apply(rows, user=request.user, notes='Shipped (fulfillment API)'))
+        return Response({'summary': fulfillment.summarize(results), 'results': results})
+
+
 class CartViewSet(viewsets.ViewSet):
     permission_classes = [IsAuthenticated]
     
     def list(self, request):
         """Get user's cart"""
         cart, created = Cart.objects.get_or_create(user=request.user)
-        serializer = CartSerializer(cart)
+        serializer = CartSerializer(cart, selection=Selection.from_request(request))
+        # Items, products and images in a few queries rather than a few per line
+        QueryPlan.for_serializer(serializer, Cart).prefetch([cart])
         return Response(serializer.data)
     
     @action(detail=False, methods=['post'])
@@ -163,6 +208,31 @@ class CartCountView(View):
             }, status=400)
 
 
+class AsyncCartCountView(View):
+    """CartCountView for ASGI deployments (ASYNC_VIEWS)"""
+    
+    async def get(self, request):
+        try:
+            user = await aio.get_user(request)
+            if user.is_authenticated:
+                cart, created = await Cart.objects.aget_or_create(user=user)
+            else:
+                session_key = await aio.get_session_key(request, create=True)
+                cart, created = await Cart.objects.aget_or_create(session_key=session_key)
+            
+            # Cart.total_items, summed in the database instead of over loaded items
+            totals = await cart.items.aaggregate(total=Sum('quantity'))
+            return JsonResponse({
+                'success': True,
+                'cart_total': totals['total'] or 0
+            })
+        except Exception as e:
+            return JsonResponse({
+                'success': False,
+                'message': str(e)
+            }, status=400)
+
+
 @method_decorator(csrf_exempt, name='dispatch')
 class UpdateCartAPIView(View):
     """Update cart item via AJAX for both authenticated and anonymous users"""
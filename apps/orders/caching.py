@@ -0,0 +1,24 @@
+"""
+Shipping options for checkout, served from the two-tier cache
+(utils/cache.py) and invalidated when a method is edited.
+"""
+
+from django.conf import settings
+
+from utils.cache import invalidate_on_change, tiered_cache
+
+from .models import ShippingMethod
+
+SHIPPING_METHODS_KEY = 'orders:shipping_methods'
+
+
+def active_shipping_methods():
+    return tiered_cache().get_or_set(
+        SHIPPING_METHODS_KEY,
+        lambda: list(ShippingMethod.objects.filter(is_active=True).order_by('cost')),
+        ttl=settings.CATALOG_CACHE_TTL,
+    )
+
+
+def connect_invalidation():
+    invalidate_on_change([ShippingMethod], SHIPPING_METHODS_KEY)
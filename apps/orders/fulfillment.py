@@ -0,0 +1,226 @@
+"""
+Bulk shipping updates from the warehouse.
+
+Rows of (order_number, tracking_number, carrier, shipped_at) arrive as CSV,
+JSON lines or a JSON array, through FulfillmentView or the
+import_fulfillment command. They are read lazily and applied CHUNK_SIZE at
+a time, so an import of any size holds one chunk in memory and costs a
+handful of queries per chunk:
+
+- one lookup of the chunk's orders by order_number
+- confirmed/processing orders are shipped with
+  state_machine.bulk_transition (tracking details set in the same UPDATE,
+  status history written in bulk)
+- orders already shipped or delivered only get their tracking details
+  corrected, with one bulk_update
+
+Each row gets a result: shipped, updated, unchanged or error.
+"""
+
+import csv
+import json
+from collections import Counter
+from datetime import datetime, time
+from itertools import islice
+
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from . import state_machine
+from .models import Order
+
+CHUNK_SIZE = state_machine.CHUNK_SIZE
+
+# Orders a shipment can be recorded for
+SHIPPABLE_STATUSES = state_machine.sources('shipped')
+
+# Orders whose tracking details may still be corrected
+SHIPPED_STATUSES = ('shipped', 'delivered')
+
+
+class RowError(ValueError):
+    """A row that can't be applied; readers yield these for unparseable lines"""
+
+
+def read_csv(lines):
+    """
+    Rows from CSV text lines with a header naming at least order_number
+    and tracking_number. Checks the header before returning.
+    """
+    reader = csv.DictReader(lines)
+    missing = [name for name in ('order_number', 'tracking_number') if name not in (reader.fieldnames or ())]
+    if missing:
+        raise ValueError(f"CSV header is missing {', '.join(missing)}")
+    return _csv_rows(reader)
+
+
+def _csv_rows(reader):
+    """The reader's rows, with a RowError in place of each malformed line"""
+    while True:
+        try:
+            row = next(reader)
+        except StopIteration:
+            return
+        except csv.Error as e:
+            # e.g. a field over csv.field_size_limit(); the reader carries on
+            # from the next line
+            yield RowError(f'Invalid CSV: {e}')
+            continue
+        yield row
+
+
+def read_ndjson(lines):
+    """Rows from JSON lines, one object per line"""
+    for number, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError as e:
+            yield RowError(f'Invalid JSON on line {number}: {e}')
+
+
+def clean(row):
+    """(order_number, {field: value}) for one row; blank optional fields are left out"""
+    if isinstance(row, RowError):
+        raise row
+    if not isinstance(row, dict):
+        raise RowError('Expected an object')
+
+    def text(name, max_length):
+        value = row.get(name)
+        value = '' if value is None else str(value).strip()
+        if len(value) > max_length:
+            raise RowError(f'{name} is longer than {max_length} characters')
+        return value
+
+    order_number = text('order_number', Order._meta.get_field('order_number').max_length)
+    if not order_number:
+        raise RowError('order_number is required')
+    fields = {'tracking_number': text('tracking_number', Order._meta.get_field('tracking_number').max_length)}
+    if not fields['tracking_number']:
+        raise RowError('tracking_number is required')
+
+    carrier = text('carrier', Order._meta.get_field('carrier').max_length)
+    if carrier:
+        fields['carrier'] = carrier
+
+    shipped_at = text('shipped_at', 64)
+    if shipped_at:
+        fields['shipped_at'] = parse_shipped_at(shipped_at)
+    return order_number, fields
+
+
+def parse_shipped_at(value):
+    """An ISO 8601 datetime or date; naive values are in the site's time zone"""
+    try:
+        parsed = parse_datetime(value)
+        if parsed is None:
+            date = parse_date(value)
+            if date is not None:
+                parsed = datetime.combine(date, time.min)
+    except ValueError:
+        parsed = None
+    if parsed is None:
+        raise RowError(f'shipped_at is not an ISO 8601 date or datetime: {value}')
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def apply(rows, user=None, notes='Shipped (fulfillment import)', chunk_size=CHUNK_SIZE):
+    """
+    Apply ``rows`` (an iterable of dicts) chunk by chunk, yielding one
+    result per row in row order:
+
+        {'row': 1, 'order_number': '...', 'result': 'shipped'}
+        {'row': 2, 'order_number': '...', 'result': 'error', 'error': '...'}
+
+    Rows are numbered from 1. If an order appears twice in one chunk, the
+    later row wins and the earlier one is reported as an error.
+    """
+    rows = iter(enumerate(rows, 1))
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            return
+        yield from _apply_chunk(chunk, user, notes)
+
+
+def summarize(results):
+    """{result: count} over ``results``"""
+    return dict(Counter(result['result'] for result in results))
+
+
+def _result(number, order_number, outcome, error=None):
+    result = {'row': number, 'order_number': order_number, 'result': outcome}
+    if error:
+        result['error'] = error
+    return result
+
+
+def _apply_chunk(chunk, user, notes):
+    results = {}
+    wanted = {}  # order_number -> (row number, fields)
+    for number, row in chunk:
+        try:
+            order_number, fields = clean(row)
+        except RowError as e:
+            order_number = row.get('order_number') if isinstance(row, dict) else None
+            results[number] = _result(number, order_number, 'error', str(e))
+            continue
+        if order_number in wanted:
+            earlier = wanted[order_number][0]
+            results[earlier] = _result(earlier, order_number, 'error', f'Superseded by row {number}')
+        wanted[order_number] = (number, fields)
+
+    # From the primary: the rows are about to be updated
+    orders = {
+        order['order_number']: order
+        for order in Order.objects.using('default')
+        .filter(order_number__in=list(wanted))
+        .values('id', 'order_number', 'status', 'tracking_number', 'carrier', 'shipped_at')
+    }
+
+    to_ship = {}  # order id -> (row number, order_number, fields)
+    to_update = []
+    now = timezone.now()
+    for order_number, (number, fields) in wanted.items():
+        order = orders.get(order_number)
+        if order is None:
+            results[number] = _result(number, order_number, 'error', 'Unknown order')
+        elif order['status'] in SHIPPABLE_STATUSES:
+            to_ship[order['id']] = (number, order_number, fields)
+        elif order['status'] in SHIPPED_STATUSES:
+            if all(order[name] == value for name, value in fields.items()):
+                results[number] = _result(number, order_number, 'unchanged')
+            else:
+                current = {name: order[name] for name in ('tracking_number', 'carrier', 'shipped_at')}
+                to_update.append(Order(id=order['id'], updated_at=now, **{**current, **fields}))
+                results[number] = _result(number, order_number, 'updated')
+        else:
+            results[number] = _result(number, order_number, 'error', f"Can't ship a {order['status']} order")
+
+    if to_ship:
+        outcome = state_machine.bulk_transition(
+            list(to_ship), 'shipped', user=user, notes=notes,
+            values={order_id: fields for order_id, (_, _, fields) in to_ship.items()},
+            from_statuses=SHIPPABLE_STATUSES, chunk_size=len(chunk),
+        )
+        for order_id, (number, order_number, _) in to_ship.items():
+            if order_id in outcome.changed:
+                results[number] = _result(number, order_number, 'shipped')
+            elif order_id in outcome.rejected:
+                # Changed since the lookup (cancelled, say)
+                results[number] = _result(
+                    number, order_number, 'error', f"Can't ship a {outcome.rejected[order_id]} order"
+                )
+            else:
+                results[number] = _result(number, order_number, 'error', 'Unknown order')
+
+    if to_update:
+        Order.objects.bulk_update(to_update, ['tracking_number', 'carrier', 'shipped_at', 'updated_at'])
+
+    for number in sorted(results):
+        yield results[number]
@@ -0,0 +1,116 @@
+"""
+Management command to apply warehouse shipping updates
+Usage: python manage.py import_fulfillment shipments.csv [--format csv|ndjson|json] [--results-file results.csv]
+
+Reads rows of order_number, tracking_number, carrier, shipped_at (a CSV
+file with a header row, JSON lines or a JSON array; '-' reads stdin) and
+applies them in chunks: confirmed/processing orders are marked shipped,
+with status history, and orders already shipped get their tracking
+details corrected. See apps/orders/fulfillment.py.
+"""
+
+import csv
+import json
+import sys
+import time
+from collections import Counter
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.orders import fulfillment
+
+
+class Command(BaseCommand):
+    help = 'Mark orders shipped and set tracking details from a warehouse file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="CSV, JSON lines or JSON file ('-' for stdin)")
+        parser.add_argument(
+            '--format',
+            choices=['csv', 'ndjson', 'json'],
+            help='Input format (default: from the file extension, else csv)',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=fulfillment.CHUNK_SIZE,
+            help='Rows applied per transaction',
+        )
+        parser.add_argument(
+            '--user',
+            help='Username recorded on the status history',
+        )
+        parser.add_argument(
+            '--results-file',
+            help='Write every row\'s result as CSV to this path',
+        )
+
+    def handle(self, *args, **options):
+        user = None
+        if options['user']:
+            try:
+                user = get_user_model().objects.get(username=options['user'])
+            except get_user_model().DoesNotExist:
+                raise CommandError(f"Unknown user {options['user']}")
+
+        path = options['path']
+        input_format = options['format'] or self.guess_format(path)
+        source = sys.stdin if path == '-' else open(path, encoding='utf-8-sig', newline='')
+        try:
+            try:
+                rows = self.read(source, input_format)
+            except ValueError as e:
+                raise CommandError(str(e))
+
+            writer = None
+            if options['results_file']:
+                results_file = open(options['results_file'], 'w', newline='')
+                writer = csv.DictWriter(results_file, ['row', 'order_number', 'result', 'error'])
+                writer.writeheader()
+
+            counts = Counter()
+            start = time.perf_counter()
+            try:
+                for result in fulfillment.apply(rows, user=user, chunk_size=max(options['chunk_size'], 1)):
+                    counts[result['result']] += 1
+                    if writer:
+                        writer.writerow(result)
+                    if result['result'] == 'error':
+                        self.stderr.write(f"Row {result['row']} ({result['order_number']}): {result['error']}")
+            finally:
+                if writer:
+                    results_file.close()
+            elapsed = time.perf_counter() - start
+        finally:
+            if source is not sys.stdin:
+                source.close()
+
+        for key in sorted(counts):
+            self.stdout.write(f'{key}: {counts[key]}')
+        total = sum(counts.values())
+        rate = total / elapsed * 60 if elapsed else 0
+        message = f'Applied {total} rows in {elapsed:.1f}s ({rate:,.0f} rows/min)'
+        if counts['error']:
+            self.stdout.write(self.style.WARNING(f"{message} with {counts['error']} errors"))
+        else:
+            self.stdout.write(self.style.SUCCESS(message))
+
+    def guess_format(self, path):
+        if path.endswith(('.ndjson', '.jsonl')):
+            return 'ndjson'
+        if path.endswith('.json'):
+            return 'json'
+        return 'csv'
+
+    def read(self, source, input_format):
+        if input_format == 'csv':
+            return fulfillment.read_csv(source)
+        if input_format == 'ndjson':
+            return fulfillment.read_ndjson(source)
+        data = json.load(source)
+        if isinstance(data, dict):
+            data = data.get('rows')
+        if not isinstance(data, list):
+            raise ValueError('Expected a JSON array of rows (or {"rows": [...]})')
+        return data
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.23 on 2026-10-19 05:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0003_alter_order_order_number'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='carrier',
+            field=models.CharField(blank=True, max_length=50),
+        ),
+    ]
@@ -98,6 +98,7 @@ class Order(models.Model):
     # Order status and tracking
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
     tracking_number = models.CharField(max_length=100, blank=True)
+    carrier = models.CharField(max_length=50, blank=True)
     notes = models.TextField(blank=True)
     
     # Timestamps
@@ -0,0 +1,216 @@
+"""
+Order status transitions.
+
+Every change of Order.status goes through here, so that:
+
+- only the transitions in TRANSITIONS are possible
+- each change writes an OrderStatusHistory row
+- shipped_at / delivered_at are stamped when an order gets there
+- confirmed orders reach the leaderboards and status listeners are told
+
+transition() moves one order with a compare-and-set UPDATE, so a
+concurrent change (say, a webhook and the confirm view racing) can't be
+overwritten. bulk_transition() moves thousands of orders in chunks: one
+locking read, one UPDATE and one bulk_create of history rows per chunk,
+instead of a save() per order.
+"""
+
+import logging
+from collections import namedtuple
+
+from django.db import transaction
+from django.db.models import Case, F, Value, When
+from django.utils import timezone
+
+from apps.products import leaderboards
+from . import status_events
+from .models import Order, OrderStatusHistory
+
+logger = logging.getLogger(__name__)
+
+TRANSITIONS = {
+    'pending': {'confirmed', 'processing', 'cancelled'},
+    # Payment still settling (e.g. a bank debit)
+    'processing': {'confirmed', 'shipped', 'cancelled'},
+    'confirmed': {'processing', 'shipped', 'cancelled', 'refunded'},
+    'shipped': {'delivered', 'refunded'},
+    'delivered': {'refunded'},
+    'cancelled': set(),
+    'refunded': set(),
+}
+
+# Statuses whose arrival is timestamped on the order
+TIMESTAMP_FIELDS = {
+    'shipped': 'shipped_at',
+    'delivered': 'delivered_at',
+}
+
+# Orders a successful payment confirms; later ones already went past it
+PAYABLE_STATUSES = ('pending', 'processing')
+
+CHUNK_SIZE = 1000
+
+
+class InvalidTransition(Exception):
+    def __init__(self, order, old_status, new_status):
+        super().__init__(f"Order {order.order_number} cannot go from {old_status} to {new_status}")
+        self.old_status = old_status
+        self.new_status = new_status
+
+
+def can_transition(old_status, new_status):
+    return new_status in TRANSITIONS.get(old_status, ())
+
+
+def sources(new_status):
+    """Statuses an order may move to ``new_status`` from"""
+    return [status for status, targets in TRANSITIONS.items() if new_status in targets]
+
+
+def _after_commit(order_ids, new_status):
+    if new_status == 'confirmed':
+        leaderboards.record_orders_on_commit(order_ids)
+    status_events.publish_on_commit(order_ids)
+
+
+def transition(order, new_status, user=None, notes='', at=None):
+    """
+    Move ``order`` to ``new_status``, returning False if it was already
+    there. Raises InvalidTransition if the move isn't allowed from the
+    order's current status.
+    """
+    now = timezone.now()
+    while True:
+        old_status = order.status
+        if old_status == new_status:
+            return False
+        if not can_transition(old_status, new_status):
+            raise InvalidTransition(order, old_status, new_status)
+
+        fields = {'status': new_status, 'updated_at': now}
+        if new_status in TIMESTAMP_FIELDS:
+            fields[TIMESTAMP_FIELDS[new_status]] = at or now
+        with transaction.atomic():
+            # Only if nobody moved it since we read it
+            if Order.objects.filter(pk=order.pk, status=old_status).update(**fields):
+                OrderStatusHistory.objects.create(
+                    order=order, old_status=old_status, new_status=new_status, notes=notes, created_by=user
+                )
+                break
+        # Lost a race: validate against the status it has now
+        order.status = Order.objects.using('default').values_list('status', flat=True).get(pk=order.pk)
+
+    for name, value in fields.items():
+        setattr(order, name, value)
+    _after_commit([order.pk], new_status)
+    return True
+
+
+def mark_paid(order, notes='Payment succeeded'):
+    """
+    Confirm an order whose payment succeeded. Returns False, without
+    raising, if the order has already moved on (a late or duplicate event).
+    """
+    if order.status not in PAYABLE_STATUSES:
+        if order.status in ('cancelled', 'refunded'):
+            logger.warning("Payment succeeded for %s order %s", order.status, order.order_number)
+        return False
+    try:
+        return transition(order, 'confirmed', notes=notes)
+    except InvalidTransition:
+        # Moved on concurrently
+        return False
+
+
+class BulkResult(namedtuple('BulkResult', ['changed', 'rejected', 'missing'])):
+    """
+    changed: {order_id: old_status} of the orders moved
+    rejected: {order_id: status} of those that couldn't be (including any
+    already in the new status)
+    missing: ids that matched no order
+    """
+
+
+def bulk_transition(order_ids, new_status, user=None, notes='', values=None, from_statuses=None,
+                    chunk_size=CHUNK_SIZE):
+    """
+    Move many orders to ``new_status``, ``chunk_size`` per transaction.
+
+    ``values`` maps order ids to extra fields to set along with the status
+    ({order_id: {'tracking_number': ..., 'shipped_at': ...}}); a timestamp
+    given there wins over the current time. ``from_statuses`` narrows the
+    statuses orders may be moved from.
+    """
+    allowed = sources(new_status)
+    if from_statuses is not None:
+        allowed = [status for status in allowed if status in from_statuses]
+    to_pk = Order._meta.pk.to_python
+    values = {to_pk(order_id): fields for order_id, fields in (values or {}).items()}
+    order_ids = list(dict.fromkeys(to_pk(order_id) for order_id in order_ids))
+    changed, rejected, missing = {}, {}, []
+
+    for start in range(0, len(order_ids), chunk_size):
+        chunk = order_ids[start:start + chunk_size]
+        with transaction.atomic():
+            current = dict(
+                Order.objects.select_for_update()
+                .filter(id__in=chunk)
+                .values_list('id', 'status')
+            )
+            movable = {}
+            for order_id in chunk:
+                status = current.get(order_id)
+                if status is None:
+                    missing.append(order_id)
+                elif status in allowed:
+                    movable[order_id] = status
+                else:
+                    rejected[order_id] = status
+            if not movable:
+                continue
+
+            Order.objects.filter(id__in=list(movable)).update(
+                status=new_status,
+                updated_at=timezone.now(),
+                **_field_updates(new_status, movable, values),
+            )
+            OrderStatusHistory.objects.bulk_create([
+                OrderStatusHistory(
+                    order_id=order_id, old_status=old_status, new_status=new_status, notes=notes, created_by=user
+                )
+                for order_id, old_status in movable.items()
+            ], batch_size=chunk_size)
+            changed.update(movable)
+            _after_commit(list(movable), new_status)
+
+    return BulkResult(changed, rejected, missing)
+
+
+def _field_updates(new_status, order_ids, values):
+    """UPDATE kwargs setting each order's own ``values`` (and the status timestamp)"""
+    now = timezone.now()
+    names = {name for order_id in order_ids for name in values.get(order_id, ())}
+    timestamp = TIMESTAMP_FIELDS.get(new_status)
+    if timestamp:
+        names.add(timestamp)
+
+    updates = {}
+    for name in names:
+        # One WHEN per distinct value: imports mostly share a carrier and
+        # ship date, and each WHEN is costly for Django to build
+        by_value = {}
+        for order_id in order_ids:
+            if name in values.get(order_id, ()):
+                by_value.setdefault(values[order_id][name], []).append(order_id)
+        whens = [When(id__in=ids, then=Value(value)) for value, ids in by_value.items()]
+        if name == timestamp:
+            default = Value(now)
+        else:
+            # Orders without a value for this field keep theirs
+            default = F(name)
+        if not whens:
+            updates[name] = default
+        else:
+            field = Order._meta.get_field(name)
+            updates[name] = Case(*whens, default=default, output_field=field)
+    return updates
@@ -0,0 +1,181 @@
+"""
+Live order and payment status.
+
+Whenever an order's status or its payment's status changes, the order's
+current status is published on its own Redis pub/sub channel once the
+change commits. The payment page listens there instead of asking the
+server (and the server asking Stripe) whether the payment went through:
+
+- OrderStatusStreamView relays the channel as server-sent events; it is
+  async, so it is only routed under ASGI (ASYNC_VIEWS)
+- OrderStatusView answers long polls, returning as soon as the status
+  differs from the version the client already has
+
+Each message is the full snapshot() of the order, so clients never need
+to merge updates and a missed message is made up by the next one.
+"""
+
+import asyncio
+import json
+import logging
+import time
+import weakref
+
+import redis.asyncio
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django_redis import get_redis_connection
+
+from apps.payments.models import Payment
+from .models import Order
+
+logger = logging.getLogger(__name__)
+
+CHANNEL_PREFIX = 'order_status:'
+
+# A payment in one of these will not change again
+SETTLED_PAYMENT_STATUSES = ('succeeded', 'failed', 'cancelled', 'refunded')
+
+
+def channel(order_id):
+    return f'{CHANNEL_PREFIX}{order_id}'
+
+
+def snapshots(order_ids):
+    """{order_id: snapshot} for the given orders, read from the primary"""
+    # Published right after the commit: a replica may not have it yet
+    orders = Order.objects.using('default').filter(id__in=order_ids).values('id', 'order_number', 'status')
+    payments = {}
+    for payment in (
+        Payment.objects.using('default')
+        .filter(order_id__in=order_ids)
+        .order_by('order_id', '-created_at')
+        .values('order_id', 'status', 'failure_reason')
+    ):
+        # The latest attempt is the one the customer is waiting on
+        payments.setdefault(payment['order_id'], payment)
+
+    result = {}
+    for order in orders:
+        payment = payments.get(order['id'])
+        result[order['id']] = {
+            'order': order['order_number'],
+            'status': order['status'],
+            'payment': {
+                'status': payment['status'],
+                'failure_reason': payment['failure_reason'],
+            } if payment else None,
+            'version': f"{order['status']}:{payment['status'] if payment else ''}",
+        }
+    return result
+
+
+def snapshot(order_id):
+    return snapshots([order_id]).get(order_id)
+
+
+def publish(order_ids):
+    """Publish the current status of ``order_ids`` on their channels"""
+    current = snapshots(order_ids)
+    if not current:
+        return
+    pipe = get_redis_connection('default').pipeline(transaction=False)
+    for order_id, data in current.items():
+        pipe.publish(channel(order_id), json.dumps(data))
+    pipe.execute()
+
+
+def publish_on_commit(order_ids):
+    """publish() once the current transaction commits; never raises"""
+    order_ids = list(order_ids)
+    if not order_ids:
+        return
+
+    def send():
+        try:
+            publish(order_ids)
+        except Exception as e:
+            # Listeners fall back to asking the server once their wait times out
+            logger.warning("Publishing status of orders %s failed: %s", order_ids, e)
+
+    transaction.on_commit(send)
+
+
+def is_settled(data):
+    return bool(data and data['payment'] and data['payment']['status'] in SETTLED_PAYMENT_STATUSES)
+
+
+def wait_for_change(order_id, version, timeout):
+    """
+    The order's snapshot once its version differs from ``version``, or the
+    unchanged snapshot after ``timeout`` seconds. Blocks the calling thread.
+    """
+    pubsub = get_redis_connection('default').pubsub(ignore_subscribe_messages=True)
+    try:
+        # Subscribe before reading, so a change in between isn't missed
+        pubsub.subscribe(channel(order_id))
+        data = snapshot(order_id)
+        deadline = time.monotonic() + timeout
+        while data is not None and data['version'] == version:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            message = pubsub.get_message(timeout=remaining)
+            if message is not None:
+                data = json.loads(message['data'])
+        return data
+    finally:
+        pubsub.close()
+
+
+# One async client per event loop; its connections can't cross loops
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def async_redis():
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = _async_clients[loop] = redis.asyncio.from_url(settings.CACHES['default']['LOCATION'])
+    return client
+
+
+def sse(event, data):
+    return f'event: {event}\ndata: {json.dumps(data)}\n\n'
+
+
+async def stream(order_id):
+    """
+    Server-sent events for one order: its current status, then every change,
+    until the payment settles or ORDER_STATUS_STREAM_SECONDS pass
+    """
+    deadline = time.monotonic() + settings.ORDER_STATUS_STREAM_SECONDS
+    keepalive = settings.ORDER_STATUS_KEEPALIVE_SECONDS
+    pubsub = async_redis().pubsub(ignore_subscribe_messages=True)
+    try:
+        await pubsub.subscribe(channel(order_id))
+        # Tells EventSource how long to wait before reconnecting
+        yield f'retry: {keepalive * 1000}\n\n'
+        # Read after subscribing, so a change in between isn't missed
+        data = await sync_to_async(snapshot)(order_id)
+        if data is None:
+            return
+        yield sse('status', data)
+        version = data['version']
+
+        while not is_settled(data):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            message = await pubsub.get_message(timeout=min(keepalive, remaining))
+            if message is None:
+                # Comment line: keeps proxies from closing an idle stream
+                yield ': keepalive\n\n'
+                continue
+            data = json.loads(message['data'])
+            if data['version'] != version:
+                version = data['version']
+                yield sse('status', data)
+    finally:
+        await pubsub.aclose()
@@ -0,0 +1,253 @@
+import csv
+import json
+import uuid
+from datetime import datetime, timedelta
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from . import state_machine
+from .models import Order, OrderStatusHistory
+
+User = get_user_model()
+
+ADDRESS = {
+    f'{kind}_{name}': value
+    for kind in ('billing', 'shipping')
+    for name, value in {
+        'first_name': 'Ada', 'last_name': 'Lovelace', 'address_1': '1 Main St', 'city': 'London',
+        'state': 'London', 'postal_code': 'N1 1AA', 'country': 'GB',
+    }.items()
+}
+
+
+def make_order(user, **fields):
+    return Order.objects.create(user=user, email=user.email, subtotal=10, total=10, **{**ADDRESS, **fields})
+
+
+class OrderTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email='ada@example.com', username='ada', password='pw')
+
+
+@override_settings(ORDER_STATUS_LONG_POLL_SECONDS=5)
+class OrderStatusLongPollTests(OrderTestCase):
+    def setUp(self):
+        super().setUp()
+        self.order = make_order(self.user)
+        self.client.force_login(self.user)
+
+    def waited(self, **params):
+        url = reverse('orders:status', args=[self.order.pk])
+        with mock.patch('apps.orders.status_events.wait_for_change', return_value={}) as wait:
+            response = self.client.get(url, {'wait': 1, 'version': 'pending:', **params}, secure=True)
+        self.assertEqual(response.status_code, 200)
+        return wait.call_args.args[2]
+
+    def test_waits_no_longer_than_the_client_will(self):
+        self.assertEqual(self.waited(timeout='2.5'), 2.5)
+        self.assertEqual(self.waited(timeout='-1'), 0)
+
+    def test_never_waits_past_the_ceiling(self):
+        self.assertEqual(self.waited(timeout='60'), 5)
+        self.assertEqual(self.waited(timeout='nan'), 5)
+        self.assertEqual(self.waited(), 5)
+
+
+class StateMachineTests(OrderTestCase):
+    def history(self, order):
+        return list(
+            OrderStatusHistory.objects.filter(order=order).order_by('id').values_list('old_status', 'new_status')
+        )
+
+    def test_rejected_transition_raises(self):
+        order = make_order(self.user)
+        with self.assertRaises(state_machine.InvalidTransition):
+            state_machine.transition(order, 'delivered')
+        order.refresh_from_db()
+        self.assertEqual(order.status, 'pending')
+        self.assertEqual(self.history(order), [])
+
+    def test_transitions_write_history_and_timestamps(self):
+        order = make_order(self.user)
+        delivered_at = timezone.now() - timedelta(hours=1)
+        self.assertTrue(state_machine.transition(order, 'confirmed'))
+        self.assertTrue(state_machine.transition(order, 'shipped'))
+        self.assertTrue(state_machine.transition(order, 'delivered', at=delivered_at))
+        self.assertFalse(state_machine.transition(order, 'delivered'))
+
+        order.refresh_from_db()
+        self.assertEqual(order.status, 'delivered')
+        self.assertIsNotNone(order.shipped_at)
+        self.assertEqual(order.delivered_at, delivered_at)
+        self.assertEqual(self.history(order), [
+            ('pending', 'confirmed'), ('confirmed', 'shipped'), ('shipped', 'delivered'),
+        ])
+
+    def test_concurrent_change_is_validated_against_the_new_status(self):
+        order = make_order(self.user)
+        # Moved on behind this copy's back
+        Order.objects.filter(pk=order.pk).update(status='processing')
+        self.assertTrue(state_machine.transition(order, 'confirmed'))
+        self.assertEqual(self.history(order), [('processing', 'confirmed')])
+
+        stale = make_order(self.user)
+        Order.objects.filter(pk=stale.pk).update(status='cancelled')
+        with self.assertRaises(state_machine.InvalidTransition):
+            state_machine.transition(stale, 'confirmed')
+        self.assertEqual(Order.objects.get(pk=stale.pk).status, 'cancelled')
+
+    def test_mark_paid_ignores_orders_past_payment(self):
+        order = make_order(self.user, status='cancelled')
+        self.assertFalse(state_machine.mark_paid(order))
+        order = make_order(self.user, status='processing')
+        self.assertTrue(state_machine.mark_paid(order))
+        self.assertEqual(Order.objects.get(pk=order.pk).status, 'confirmed')
+
+    def test_bulk_transition(self):
+        confirmed = make_order(self.user, status='confirmed')
+        processing = make_order(self.user, status='processing')
+        cancelled = make_order(self.user, status='cancelled')
+        unknown = uuid.uuid4()
+        shipped_at = timezone.now() - timedelta(days=1)
+
+        result = state_machine.bulk_transition(
+            [confirmed.pk, str(processing.pk), cancelled.pk, unknown, confirmed.pk],
+            'shipped',
+            values={
+                confirmed.pk: {'tracking_number': 'TRACK-1', 'carrier': 'UPS'},
+                str(processing.pk): {'tracking_number': 'TRACK-2', 'shipped_at': shipped_at},
+            },
+            chunk_size=2,
+        )
+        self.assertEqual(result.changed, {confirmed.pk: 'confirmed', processing.pk: 'processing'})
+        self.assertEqual(result.rejected, {cancelled.pk: 'cancelled'})
+        self.assertEqual(result.missing, [unknown])
+
+        confirmed.refresh_from_db()
+        self.assertEqual((confirmed.status, confirmed.tracking_number, confirmed.carrier), ('shipped', 'TRACK-1', 'UPS'))
+        self.assertIsNotNone(confirmed.shipped_at)
+        processing.refresh_from_db()
+        self.assertEqual((processing.status, processing.tracking_number, processing.carrier), ('shipped', 'TRACK-2', ''))
+        self.assertEqual(processing.shipped_at, shipped_at)
+        self.assertEqual(Order.objects.get(pk=cancelled.pk).status, 'cancelled')
+        self.assertEqual(self.history(confirmed), [('confirmed', 'shipped')])
+        self.assertEqual(self.history(processing), [('processing', 'shipped')])
+
+    def test_bulk_transition_honours_from_statuses(self):
+        confirmed = make_order(self.user, status='confirmed')
+        processing = make_order(self.user, status='processing')
+        result = state_machine.bulk_transition(
+            [confirmed.pk, processing.pk], 'shipped', from_statuses=['confirmed']
+        )
+        self.assertEqual(result.changed, {confirmed.pk: 'confirmed'})
+        self.assertEqual(result.rejected, {processing.pk: 'processing'})
+
+
+class FulfillmentTests(OrderTestCase):
+    url = '/api/v1/orders/fulfillment/'
+
+    def setUp(self):
+        super().setUp()
+        self.staff = User.objects.create_user(email='ops@example.com', username='ops', password='pw', is_staff=True)
+        self.client.force_login(self.staff)
+        self.confirmed = make_order(self.user, status='confirmed')
+        self.processing = make_order(self.user, status='processing')
+        self.shipped = make_order(self.user, status='shipped', tracking_number='OLD-1', carrier='UPS')
+        self.delivered = make_order(self.user, status='delivered', tracking_number='DONE-1', carrier='UPS')
+        self.cancelled = make_order(self.user, status='cancelled')
+
+    def post(self, body, content_type):
+        response = self.client.post(self.url, body, content_type=content_type, secure=True)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def outcomes(self, data):
+        return [(result['row'], result['result']) for result in data['results']]
+
+    def test_csv(self):
+        data = self.post(
+            'order_number,tracking_number,carrier,shipped_at\n'
+            f'{self.confirmed.order_number},TRACK-1,DHL,2026-01-02\n'
+            f'{self.processing.order_number},TRACK-X,,\n'
+            f'{self.processing.order_number},TRACK-2,,2026-01-03T10:00:00+00:00\n'
+            f'{self.shipped.order_number},NEW-1,UPS,\n'
+            f'{self.delivered.order_number},DONE-1,UPS,\n'
+            f'{self.cancelled.order_number},TRACK-3,,\n'
+            'ORD-MISSING,TRACK-4,,\n'
+            f'{self.confirmed.order_number.lower()}-x,TRACK-5,,yesterday\n'
+            ',TRACK-6,,\n',
+            'text/csv',
+        )
+        self.assertEqual(self.outcomes(data), [
+            (1, 'shipped'), (2, 'error'), (3, 'shipped'), (4, 'updated'), (5, 'unchanged'),
+            (6, 'error'), (7, 'error'), (8, 'error'), (9, 'error'),
+        ])
+        errors = {result['row']: result['error'] for result in data['results'] if result['result'] == 'error'}
+        self.assertEqual(errors[2], 'Superseded by row 3')
+        self.assertEqual(errors[6], "Can't ship a cancelled order")
+        self.assertEqual(errors[7], 'Unknown order')
+        self.assertIn('not an ISO 8601 date', errors[8])
+        self.assertEqual(errors[9], 'order_number is required')
+        self.assertEqual(data['summary'], {'shipped': 2, 'updated': 1, 'unchanged': 1, 'error': 5})
+
+        self.confirmed.refresh_from_db()
+        self.assertEqual((self.confirmed.status, self.confirmed.tracking_number, self.confirmed.carrier),
+                         ('shipped', 'TRACK-1', 'DHL'))
+        self.assertEqual(self.confirmed.shipped_at, timezone.make_aware(datetime(2026, 1, 2)))
+        self.processing.refresh_from_db()
+        self.assertEqual((self.processing.status, self.processing.tracking_number), ('shipped', 'TRACK-2'))
+        self.shipped.refresh_from_db()
+        self.assertEqual((self.shipped.tracking_number, self.shipped.carrier), ('NEW-1', 'UPS'))
+        self.assertEqual(Order.objects.get(pk=self.cancelled.pk).status, 'cancelled')
+
+    def test_csv_without_required_columns_is_rejected(self):
+        response = self.client.post(self.url, 'order_number,carrier\n', content_type='text/csv', secure=True)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('tracking_number', response.json()['detail'])
+
+    def test_malformed_csv_line_is_a_row_error(self):
+        limit = csv.field_size_limit()
+        self.addCleanup(csv.field_size_limit, limit)
+        csv.field_size_limit(100)
+        data = self.post(
+            'order_number,tracking_number\n'
+            f'{self.confirmed.order_number},{"X" * 200}\n'
+            f'{self.processing.order_number},TRACK-2\n',
+            'text/csv',
+        )
+        self.assertEqual(self.outcomes(data), [(1, 'error'), (2, 'shipped')])
+        self.assertEqual(data['results'][0]['error'], 'Invalid CSV: field larger than field limit (100)')
+
+    def test_json_lines(self):
+        data = self.post(
+            json.dumps({'order_number': self.confirmed.order_number, 'tracking_number': 'TRACK-1'}) + '\n'
+            '{not json\n'
+            '\n'
+            + json.dumps({'order_number': self.processing.order_number, 'tracking_number': 'TRACK-2'}) + '\n',
+            'application/x-ndjson',
+        )
+        self.assertEqual(self.outcomes(data), [(1, 'shipped'), (2, 'error'), (3, 'shipped')])
+        self.assertIn('Invalid JSON on line 2', data['results'][1]['error'])
+
+    def test_json(self):
+        rows = [
+            {'order_number': self.confirmed.order_number, 'tracking_number': 'TRACK-1'},
+            'not an object',
+        ]
+        for body in (rows, {'rows': rows}):
+            with self.subTest(body=type(body).__name__):
+                data = self.post(body, 'application/json')
+                self.assertEqual(self.outcomes(data)[1], (2, 'error'))
+        self.assertEqual(Order.objects.get(pk=self.confirmed.pk).status, 'shipped')
+
+        response = self.client.post(self.url, {'rows': 'nope'}, content_type='application/json', secure=True)
+        self.assertEqual(response.status_code, 400)
+
+    def test_staff_only(self):
+        self.client.force_login(self.user)
+        response = self.client.post(self.url, [], content_type='application/json', secure=True)
+        self.assertEqual(response.status_code, 403)
@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.urls import path
 from . import views
 
@@ -6,10 +7,15 @@ app_name = 'orders'
 urlpatterns = [
     path('', views.OrderListView.as_view(), name='list'),
     path('<uuid:pk>/', views.OrderDetailView.as_view(), name='detail'),
+    path('<uuid:pk>/status/', views.OrderStatusView.as_view(), name='status'),
     path('cart/', views.CartView.as_view(), name='cart'),
     path('cart/add/', views.AddToCartView.as_view(), name='add_to_cart'),
     path('cart/update/', views.UpdateCartView.as_view(), name='update_cart'),
     path('cart/remove/<int:item_id>/', views.RemoveFromCartView.as_view(), name='remove_from_cart'),
     path('checkout/', views.CheckoutView.as_view(), name='checkout'),
     path('checkout/success/', views.OrderSuccessView.as_view(), name='success'),
-]
\ No newline at end of file
+]
+
+# An event stream holds its connection open: only worth it without a thread per request
+if settings.ASYNC_VIEWS:
+    urlpatterns.append(path('<uuid:pk>/status/stream/', views.OrderStatusStreamView.as_view(), name='status_stream'))
@@ -1,12 +1,19 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.views.generic import ListView, DetailView, TemplateView, View
-from django.http import JsonResponse
+from django.conf import settings
+from django.http import Http404, JsonResponse, StreamingHttpResponse
 from django.contrib import messages
 from django.db import transaction
+from django.db.models import Prefetch
 from .models import Order, Cart, CartItem, OrderItem
+from .caching import active_shipping_methods
+from . import status_events
+from apps.products.recommendations import recommended_for
 from apps.products.models import Product, ProductVariant
+from utils import aio
 import json
+import math
 
 
 class OrderListView(LoginRequiredMixin, ListView):
@@ -31,6 +38,13 @@ class OrderDetailView(LoginRequiredMixin, DetailView):
         )
 
 
+def carts():
+    """Carts with their items, products and images loaded, for rendering"""
+    return Cart.objects.prefetch_related(Prefetch(
+        'items', CartItem.objects.select_related('product', 'variant').prefetch_related('product__images')
+    ))
+
+
 class CartView(TemplateView):
     template_name = 'orders/cart.html'
     
@@ -42,13 +56,13 @@ class CartView(TemplateView):
     
     def get_cart(self):
         if self.request.user.is_authenticated:
-            cart, created = Cart.objects.get_or_create(user=self.request.user)
+            cart, created = carts().get_or_create(user=self.request.user)
         else:
             session_key = self.request.session.session_key
             if not session_key:
                 self.request.session.create()
                 session_key = self.request.session.session_key
-            cart, created = Cart.objects.get_or_create(session_key=session_key)
+            cart, created = carts().get_or_create(session_key=session_key)
         return cart
 
 
@@ -197,11 +211,12 @@ class CheckoutView(LoginRequiredMixin, TemplateView):
         
         # Get user's cart
         try:
-            cart = Cart.objects.get(user=self.request.user)
+            cart = carts().get(user=self.request.user)
             context['cart'] = cart
         except Cart.DoesNotExist:
             context['cart'] = None
         
+        context['shipping_methods'] = active_shipping_methods()
         return context
     
     def post(self, request):
@@ -286,32 +301,15 @@ class OrderSuccessView(LoginRequiredMixin, TemplateView):
     
     def get_recommended_products(self, order):
         """Get recommended products based on the order"""
-        from django.db.models import Count, Q
-        
-        # Get categories from ordered products
-        ordered_categories = set()
-        for item in order.items.all():
-            if item.product and item.product.category:
-                ordered_categories.add(item.product.category)
+        ordered_product_ids = list(order.items.values_list('product_id', flat=True))
         
-        # Get product IDs from the order to exclude them
-        ordered_product_ids = [item.product.id for item in order.items.all() if item.product]
-        
-        recommended_products = []
-        
-        if ordered_categories:
-            # Get products from the same categories (excluding already ordered products)
-            category_products = Product.objects.filter(
-                category__in=ordered_categories,
-                is_active=True,
-                inventory_quantity__gt=0
-            ).exclude(
-                id__in=ordered_product_ids
-            ).select_related('category')[:8]
-            
-            recommended_products.extend(category_products)
+        # Precomputed neighbours of everything in the order (build_recommendations)
+        recommended_products = recommended_for(
+            ordered_product_ids, 8, exclude=ordered_product_ids, in_stock=True
+        )
         
-        # If we don't have enough products, add some popular/featured products
+        # If we don't have enough products (new catalogue, index not built yet),
+        # add the newest in-stock products
         if len(recommended_products) < 8:
             additional_products = Product.objects.filter(
                 is_active=True,
@@ -322,4 +320,53 @@ class OrderSuccessView(LoginRequiredMixin, TemplateView):
             
             recommended_products.extend(additional_products)
         
-        return recommended_products[:8]
\ No newline at end of file
+        return recommended_products[:8]
+
+
+def long_poll_timeout(requested):
+    """
+    Seconds a long poll may hold its thread: the ?timeout= the client has
+    left, at most ORDER_STATUS_LONG_POLL_SECONDS
+    """
+    ceiling = settings.ORDER_STATUS_LONG_POLL_SECONDS
+    try:
+        requested = float(requested)
+    except (TypeError, ValueError):
+        return ceiling
+    if not math.isfinite(requested):
+        return ceiling
+    return max(0.0, min(requested, ceiling))
+
+
+class OrderStatusView(LoginRequiredMixin, View):
+    """
+    Long poll for an order's status (see status_events). With ?wait=1 and
+    the ?version= of the last snapshot, answers once the status changes or
+    after long_poll_timeout(); otherwise answers at once.
+    """
+    
+    def get(self, request, pk):
+        if not Order.objects.using('default').filter(pk=pk, user=request.user).exists():
+            raise Http404("Order not found")
+        
+        if request.GET.get('wait'):
+            data = status_events.wait_for_change(
+                pk, request.GET.get('version', ''), long_poll_timeout(request.GET.get('timeout'))
+            )
+        else:
+            data = status_events.snapshot(pk)
+        return JsonResponse(data)
+
+
+class OrderStatusStreamView(aio.LoginRequiredMixin, View):
+    """Server-sent events for an order's status; ASGI only (ASYNC_VIEWS)"""
+    
+    async def get(self, request, pk):
+        if not await Order.objects.using('default').filter(pk=pk, user=request.user).aexists():
+            raise Http404("Order not found")
+        
+        response = StreamingHttpResponse(status_events.stream(pk), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        # Stop nginx buffering the stream
+        response['X-Accel-Buffering'] = 'no'
+        return response
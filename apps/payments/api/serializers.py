@@ -1,8 +1,12 @@
 from rest_framework import serializers
+from apps.orders.api.serializers import OrderSerializer
+from utils.serializers import DynamicFieldsMixin
 from ..models import Payment, PaymentRefund, PaymentMethod
 
 
-class PaymentSerializer(serializers.ModelSerializer):
+class PaymentSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+    # The order's id unless ?expand=order
+    order = OrderSerializer(read_only=True)
     order_number = serializers.CharField(source='order.order_number', read_only=True)
     status_display = serializers.CharField(source='get_status_display', read_only=True)
     
@@ -14,9 +18,11 @@ class PaymentSerializer(serializers.ModelSerializer):
             'created_at', 'updated_at', 'processed_at'
         ]
         read_only_fields = ['id', 'created_at', 'updated_at', 'processed_at']
+        expandable = ['order']
+        field_dependencies = {'status_display': ['status']}
 
 
-class PaymentRefundSerializer(serializers.ModelSerializer):
+class PaymentRefundSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = PaymentRefund
         fields = [
@@ -26,7 +32,7 @@ class PaymentRefundSerializer(serializers.ModelSerializer):
         ]
 
 
-class PaymentMethodSerializer(serializers.ModelSerializer):
+class PaymentMethodSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     display_name = serializers.SerializerMethodField()
     
     class Meta:
@@ -36,6 +42,7 @@ class PaymentMethodSerializer(serializers.ModelSerializer):
             'card_exp_month', 'card_exp_year', 'is_default', 
             'display_name', 'created_at'
         ]
+        field_dependencies = {'display_name': ['method_type', 'card_brand', 'card_last4']}
     
     def get_display_name(self, obj):
         return str(obj)
@@ -5,18 +5,18 @@ from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from django.conf import settings
 from django.shortcuts import get_object_or_404
+from apps.orders import state_machine, status_events
 from apps.orders.models import Order
+from utils.serializers import DynamicFieldsViewMixin, Selection, optimize_queryset
+from .. import gateway
 from ..models import Payment, PaymentMethod
 from .serializers import (
     PaymentSerializer, PaymentMethodSerializer, 
     CreatePaymentIntentSerializer, ConfirmPaymentSerializer
 )
 
-# Initialize Stripe
-stripe.api_key = settings.STRIPE_SECRET_KEY
 
-
-class PaymentViewSet(viewsets.ReadOnlyModelViewSet):
+class PaymentViewSet(DynamicFieldsViewMixin, viewsets.ReadOnlyModelViewSet):
     queryset = Payment.objects.all()  # Base queryset (will be filtered in get_queryset)
     serializer_class = PaymentSerializer
     permission_classes = [IsAuthenticated]
@@ -51,7 +51,7 @@ class PaymentViewSet(viewsets.ReadOnlyModelViewSet):
                     intent_data['confirmation_method'] = 'manual'
                     intent_data['confirm'] = True
                 
-                intent = stripe.PaymentIntent.create(**intent_data)
+                intent = gateway.create_payment_intent(**intent_data)
                 
                 # Create Payment record
                 payment = Payment.objects.create(
@@ -75,8 +75,8 @@ class PaymentViewSet(viewsets.ReadOnlyModelViewSet):
                 elif intent.status == 'succeeded':
                     payment.status = 'succeeded'
                     payment.save()
-                    order.status = 'confirmed'
-                    order.save()
+                    if not state_machine.mark_paid(order):
+                        status_events.publish_on_commit([order.id])
                     response_data['payment_succeeded'] = True
                 
                 return Response(response_data)
@@ -109,20 +109,19 @@ class PaymentViewSet(viewsets.ReadOnlyModelViewSet):
                 )
                 
                 # Retrieve and confirm PaymentIntent
-                intent = stripe.PaymentIntent.retrieve(payment_intent_id)
+                intent = gateway.retrieve_payment_intent(payment_intent_id, expand=['latest_charge'])
                 
                 if intent.status == 'requires_confirmation':
-                    intent = stripe.PaymentIntent.confirm(payment_intent_id)
+                    intent = gateway.confirm_payment_intent(payment_intent_id, expand=['latest_charge'])
                 
                 if intent.status == 'succeeded':
                     payment.status = 'succeeded'
-                    payment.stripe_charge_id = intent.charges.data[0].id if intent.charges.data else ''
+                    payment.stripe_charge_id = gateway.charge_id(intent)
                     payment.save()
                     
                     # Update order
-                    order = payment.order
-                    order.status = 'confirmed'
-                    order.save()
+                    if not state_machine.mark_paid(payment.order):
+                        status_events.publish_on_commit([payment.order_id])
                     
                     return Response({
                         'payment_succeeded': True,
@@ -139,6 +138,7 @@ class PaymentViewSet(viewsets.ReadOnlyModelViewSet):
                     payment.status = 'failed'
                     payment.failure_reason = intent.last_payment_error.message if intent.last_payment_error else 'Payment failed'
                     payment.save()
+                    status_events.publish_on_commit([payment.order_id])
                     
                     return Response(
                         {'error': 'Payment failed'},
@@ -161,9 +161,11 @@ class PaymentViewSet(viewsets.ReadOnlyModelViewSet):
     @action(detail=False, methods=['get'])
     def payment_methods(self, request):
         """Get user's saved payment methods"""
+        selection = Selection.from_request(request)
         payment_methods = PaymentMethod.objects.filter(
             user=request.user,
             is_active=True
         )
-        serializer = PaymentMethodSerializer(payment_methods, many=True)
+        payment_methods = optimize_queryset(payment_methods, PaymentMethodSerializer(selection=selection))
+        serializer = PaymentMethodSerializer(payment_methods, many=True, selection=selection)
         return Response(serializer.data)
\ No newline at end of file
@@ -0,0 +1,587 @@
+"""
+Offline Stripe stand-in for load and integration tests.
+
+Implements the slice of the Stripe API this project uses (PaymentIntents,
+Customers, PaymentMethods and Refunds) in memory, with configurable latency
+and failure injection, and emits signed webhook events to StripeWebhookView.
+
+Point the app at it by setting STRIPE_API_BASE (e.g. http://127.0.0.1:12111)
+and any STRIPE_SECRET_KEY. Start it with ``python manage.py run_stripe_emulator``
+or use the ``stripe_emulator`` fixture from ``apps.payments.pytest_plugin``.
+
+Test payment methods follow Stripe's conventions: ``pm_card_visa`` succeeds,
+``pm_card_chargeDeclined`` is declined and ``pm_card_authenticationRequired``
+requires 3D Secure.
+"""
+
+import json
+import logging
+import random
+import re
+import threading
+import time
+import urllib.request
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+import stripe
+
+logger = logging.getLogger(__name__)
+
+# Magic payment method tokens -> (brand, last4, outcome)
+TEST_PAYMENT_METHODS = {
+    'pm_card_visa': ('visa', '4242', 'succeeded'),
+    'pm_card_mastercard': ('mastercard', '4444', 'succeeded'),
+    'pm_card_amex': ('amex', '8431', 'succeeded'),
+    'pm_card_chargeDeclined': ('visa', '0002', 'declined'),
+    'pm_card_insufficientFunds': ('visa', '9995', 'declined'),
+    'pm_card_authenticationRequired': ('visa', '3184', 'requires_action'),
+}
+
+# Test card numbers accepted by POST /v1/payment_methods
+TEST_CARD_NUMBERS = {
+    '4242424242424242': 'pm_card_visa',
+    '5555555555554444': 'pm_card_mastercard',
+    '378282246310005': 'pm_card_amex',
+    '4000000000000002': 'pm_card_chargeDeclined',
+    '4000000000009995': 'pm_card_insufficientFunds',
+    '4000002500003155': 'pm_card_authenticationRequired',
+}
+
+
+class EmulatorError(Exception):
+    """An error rendered in Stripe's error format"""
+
+    def __init__(self, status, error_type, message, code=None, param=None, extra=None):
+        super().__init__(message)
+        self.status = status
+        self.body = {'type': error_type, 'message': message}
+        if code:
+            self.body['code'] = code
+        if param:
+            self.body['param'] = param
+        if extra:
+            self.body.update(extra)
+
+
+def _new_id(prefix):
+    return f"{prefix}_{uuid.uuid4().hex[:24]}"
+
+
+def decode_form(pairs):
+    """Decode Stripe's bracketed form encoding (metadata[key]=v, expand[0]=x)"""
+    root = {}
+    for key, value in pairs:
+        parts = re.findall(r'[^\[\]]+|\[\]', key)
+        node = root
+        for i, part in enumerate(parts):
+            last = i == len(parts) - 1
+            if part == '[]':
+                part = str(len(node))
+            if last:
+                node[part] = value
+            else:
+                node = node.setdefault(part, {})
+
+    def listify(node):
+        if isinstance(node, dict):
+            node = {k: listify(v) for k, v in node.items()}
+            if node and all(k.isdigit() for k in node):
+                return [node[k] for k in sorted(node, key=int)]
+        return node
+
+    return listify(root)
+
+
+def _as_bool(value):
+    return value in (True, 'true', 'True', '1')
+
+
+class StripeEmulator:
+    """In-memory Stripe API state plus the HTTP server that exposes it"""
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, jitter=0.0, failure_rate=0.0,
+                 webhook_url=None, webhook_secret=None, webhook_callback=None, webhook_async=True,
+                 seed=None):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.webhook_url = webhook_url
+        self.webhook_secret = webhook_secret
+        # callable(payload_bytes, headers) used instead of HTTP delivery, e.g. a Django test client
+        self.webhook_callback = webhook_callback
+        self.webhook_async = webhook_async
+        self.random = random.Random(seed)
+
+        self.lock = threading.RLock()
+        self.objects = {}
+        self.idempotency = {}
+        self.request_count = 0
+        self.events = []
+        self.server = None
+        self.thread = None
+
+    # Server lifecycle
+
+    @property
+    def url(self):
+        return f"http://{self.host}:{self.port}"
+
+    def _make_server(self):
+        handler = type('EmulatorRequestHandler', (EmulatorRequestHandler,), {'emulator': self})
+        self.server = ThreadingHTTPServer((self.host, self.port), handler)
+        self.server.daemon_threads = True
+        self.port = self.server.server_address[1]
+        return self.server
+
+    def start(self):
+        """Start serving in a background thread; returns the base URL"""
+        server = self._make_server()
+        self.thread = threading.Thread(target=server.serve_forever, daemon=True)
+        self.thread.start()
+        return self.url
+
+    def serve_forever(self):
+        self._make_server().serve_forever()
+
+    def stop(self):
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+    def reset(self):
+        with self.lock:
+            self.objects.clear()
+            self.idempotency.clear()
+            self.events.clear()
+            self.request_count = 0
+
+    # Request dispatch
+
+    ROUTES = [
+        ('POST', r'/v1/payment_intents', 'create_payment_intent'),
+        ('GET', r'/v1/payment_intents', 'list_payment_intents'),
+        ('GET', r'/v1/payment_intents/(?P<id>[^/]+)', 'retrieve_payment_intent'),
+        ('POST', r'/v1/payment_intents/(?P<id>[^/]+)', 'update_payment_intent'),
+        ('POST', r'/v1/payment_intents/(?P<id>[^/]+)/confirm', 'confirm_payment_intent'),
+        ('POST', r'/v1/payment_intents/(?P<id>[^/]+)/cancel', 'cancel_payment_intent'),
+        ('POST', r'/v1/customers', 'create_customer'),
+        ('GET', r'/v1/customers/(?P<id>[^/]+)', 'retrieve_customer'),
+        ('POST', r'/v1/payment_methods', 'create_payment_method'),
+        ('GET', r'/v1/payment_methods/(?P<id>[^/]+)', 'retrieve_payment_method'),
+        ('POST', r'/v1/payment_methods/(?P<id>[^/]+)/attach', 'attach_payment_method'),
+        ('POST', r'/v1/payment_methods/(?P<id>[^/]+)/detach', 'detach_payment_method'),
+        ('POST', r'/v1/refunds', 'create_refund'),
+        ('GET', r'/v1/refunds/(?P<id>[^/]+)', 'retrieve_refund'),
+        ('POST', r'/_emulator/config', 'configure'),
+        ('POST', r'/_emulator/reset', 'reset_state'),
+    ]
+
+    def dispatch(self, method, path, params, idempotency_key=None):
+        """Return (status, body) for an API request"""
+        with self.lock:
+            self.request_count += 1
+
+        if not path.startswith('/_emulator/'):
+            delay = self.latency + (self.random.uniform(0, self.jitter) if self.jitter else 0)
+            if delay:
+                time.sleep(delay)
+            if self.failure_rate and self.random.random() < self.failure_rate:
+                return 500, {'error': {'type': 'api_error', 'message': 'Injected failure (Stripe emulator)'}}
+
+        for route_method, pattern, name in self.ROUTES:
+            match = re.fullmatch(pattern, path)
+            if match and route_method == method:
+                break
+        else:
+            return 404, {'error': {'type': 'invalid_request_error', 'message': f'Unrecognized request URL ({method}: {path})'}}
+
+        cache_key = (idempotency_key, path) if idempotency_key and method == 'POST' else None
+        if cache_key:
+            with self.lock:
+                if cache_key in self.idempotency:
+                    return self.idempotency[cache_key]
+
+        try:
+            with self.lock:
+                result = 200, getattr(self, name)(params, **match.groupdict())
+        except EmulatorError as e:
+            result = e.status, {'error': e.body}
+
+        if cache_key:
+            with self.lock:
+                self.idempotency[cache_key] = result
+        return result
+
+    def _get(self, object_type, object_id, param='id'):
+        obj = self.objects.get(object_id)
+        if obj is None or obj['object'] != object_type:
+            raise EmulatorError(
+                404, 'invalid_request_error', f"No such {object_type}: '{object_id}'",
+                code='resource_missing', param=param,
+            )
+        return obj
+
+    def _expand(self, obj, params):
+        expand = params.get('expand') or []
+        obj = dict(obj)
+        if obj.get('object') == 'payment_intent':
+            charge_id = obj.get('latest_charge')
+            charge = self.objects.get(charge_id) if charge_id else None
+            # latest_charge is an id unless expanded; the charges list is gone
+            # since API version 2022-11-15
+            if 'latest_charge' in expand and charge:
+                obj['latest_charge'] = charge
+        return obj
+
+    # Payment methods
+
+    def _payment_method(self, payment_method_id):
+        if payment_method_id in TEST_PAYMENT_METHODS and payment_method_id not in self.objects:
+            brand, last4, _ = TEST_PAYMENT_METHODS[payment_method_id]
+            self.objects[payment_method_id] = {
+                'id': payment_method_id, 'object': 'payment_method', 'type': 'card',
+                'created': int(time.time()), 'customer': None, 'livemode': False, 'metadata': {},
+                'card': {'brand': brand, 'last4': last4, 'exp_month': 12, 'exp_year': time.gmtime().tm_year + 3,
+                         'funding': 'credit', 'country': 'US'},
+                '_outcome': TEST_PAYMENT_METHODS[payment_method_id][2],
+            }
+        return self._get('payment_method', payment_method_id, param='payment_method')
+
+    def create_payment_method(self, params):
+        card = params.get('card') or {}
+        token = TEST_CARD_NUMBERS.get(str(card.get('number', '')).replace(' ', ''), 'pm_card_visa')
+        template = dict(self._payment_method(token))
+        template['id'] = _new_id('pm')
+        template['created'] = int(time.time())
+        template['customer'] = None
+        template['metadata'] = params.get('metadata') or {}
+        self.objects[template['id']] = template
+        return self._public(template)
+
+    def retrieve_payment_method(self, params, id):
+        return self._public(self._payment_method(id))
+
+    def attach_payment_method(self, params, id):
+        pm = self._payment_method(id)
+        customer_id = params.get('customer')
+        self._get('customer', customer_id, param='customer')
+        pm['customer'] = customer_id
+        return self._public(pm)
+
+    def detach_payment_method(self, params, id):
+        pm = self._payment_method(id)
+        pm['customer'] = None
+        return self._public(pm)
+
+    # Customers
+
+    def create_customer(self, params):
+        customer = {
+            'id': _new_id('cus'), 'object': 'customer', 'created': int(time.time()), 'livemode': False,
+            'email': params.get('email'), 'name': params.get('name'),
+            'metadata': params.get('metadata') or {},
+        }
+        self.objects[customer['id']] = customer
+        return customer
+
+    def retrieve_customer(self, params, id):
+        return self._get('customer', id)
+
+    # Payment intents
+
+    def create_payment_intent(self, params):
+        try:
+            amount = int(params['amount'])
+        except (KeyError, ValueError):
+            raise EmulatorError(400, 'invalid_request_error', 'Missing required param: amount.', param='amount')
+
+        intent_id = _new_id('pi')
+        intent = {
+            'id': intent_id, 'object': 'payment_intent', 'amount': amount,
+            'amount_received': 0, 'currency': params.get('currency', 'usd'),
+            'created': int(time.time()), 'livemode': False,
+            'client_secret': f"{intent_id}_secret_{uuid.uuid4().hex[:24]}",
+            'customer': params.get('customer'), 'description': params.get('description'),
+            'metadata': params.get('metadata') or {},
+            'payment_method': params.get('payment_method'),
+            'confirmation_method': params.get('confirmation_method', 'automatic'),
+            'status': 'requires_payment_method', 'latest_charge': None,
+            'last_payment_error': None, 'next_action': None, 'canceled_at': None,
+        }
+        if intent['payment_method']:
+            self._payment_method(intent['payment_method'])
+            intent['status'] = 'requires_confirmation'
+        self.objects[intent_id] = intent
+
+        if _as_bool(params.get('confirm')):
+            return self._confirm(intent, params)
+        return self._expand(intent, params)
+
+    def list_payment_intents(self, params):
+        """Newest first, with created[gt|gte|lt|lte], customer, limit and cursor pagination"""
+        created = params.get('created') or {}
+        if not isinstance(created, dict):
+            created = {'eq': created}
+        bounds = {op: int(value) for op, value in created.items()}
+
+        intents = [
+            obj for obj in self.objects.values()
+            if obj['object'] == 'payment_intent'
+            and ('customer' not in params or obj['customer'] == params['customer'])
+            and ('eq' not in bounds or obj['created'] == bounds['eq'])
+            and ('gt' not in bounds or obj['created'] > bounds['gt'])
+            and ('gte' not in bounds or obj['created'] >= bounds['gte'])
+            and ('lt' not in bounds or obj['created'] < bounds['lt'])
+            and ('lte' not in bounds or obj['created'] <= bounds['lte'])
+        ]
+        # Insertion order breaks ties between intents created in the same second
+        order = {key: i for i, key in enumerate(self.objects)}
+        intents.sort(key=lambda obj: (obj['created'], order[obj['id']]), reverse=True)
+
+        if params.get('starting_after'):
+            ids = [obj['id'] for obj in intents]
+            cursor = params['starting_after']
+            intents = intents[ids.index(cursor) + 1:] if cursor in ids else []
+
+        limit = min(max(int(params.get('limit', 10)), 1), 100)
+        return {
+            'object': 'list', 'url': '/v1/payment_intents',
+            'data': [self._expand(obj, params) for obj in intents[:limit]],
+            'has_more': len(intents) > limit,
+        }
+
+    def retrieve_payment_intent(self, params, id):
+        return self._expand(self._get('payment_intent', id), params)
+
+    def update_payment_intent(self, params, id):
+        intent = self._get('payment_intent', id)
+        for field in ('amount', 'currency', 'description', 'customer', 'payment_method'):
+            if field in params:
+                intent[field] = int(params[field]) if field == 'amount' else params[field]
+        if 'metadata' in params:
+            intent['metadata'].update(params['metadata'] or {})
+        return self._expand(intent, params)
+
+    def confirm_payment_intent(self, params, id):
+        return self._confirm(self._get('payment_intent', id), params)
+
+    def _confirm(self, intent, params):
+        if intent['status'] in ('succeeded', 'canceled'):
+            raise EmulatorError(
+                400, 'invalid_request_error',
+                f"This PaymentIntent's status is {intent['status']} and cannot be confirmed.",
+                code='payment_intent_unexpected_state',
+            )
+
+        if params.get('payment_method'):
+            intent['payment_method'] = params['payment_method']
+        if not intent['payment_method']:
+            raise EmulatorError(
+                400, 'invalid_request_error',
+                'You cannot confirm this PaymentIntent because it\'s missing a payment method.',
+                code='payment_intent_unexpected_state',
+            )
+
+        pm = self._payment_method(intent['payment_method'])
+        outcome = pm.get('_outcome', 'succeeded')
+
+        if outcome == 'requires_action' and intent['status'] != 'requires_action':
+            intent['status'] = 'requires_action'
+            intent['next_action'] = {
+                'type': 'use_stripe_sdk',
+                'use_stripe_sdk': {'type': 'three_d_secure_redirect', 'stripe_js': f"{self.url}/3ds/{intent['id']}"},
+            }
+            return self._expand(intent, params)
+
+        charge = {
+            'id': _new_id('ch'), 'object': 'charge', 'amount': intent['amount'],
+            'amount_refunded': 0, 'currency': intent['currency'], 'created': int(time.time()),
+            'payment_intent': intent['id'], 'payment_method': pm['id'], 'refunded': False,
+            'customer': intent['customer'], 'livemode': False,
+        }
+        self.objects[charge['id']] = charge
+        intent['latest_charge'] = charge['id']
+        intent['next_action'] = None
+
+        if outcome == 'declined':
+            charge.update({'status': 'failed', 'paid': False, 'failure_code': 'card_declined'})
+            error = {
+                'code': 'card_declined', 'decline_code': 'generic_decline',
+                'message': 'Your card was declined.', 'type': 'card_error',
+            }
+            intent['status'] = 'requires_payment_method'
+            intent['last_payment_error'] = error
+            self.emit_event('payment_intent.payment_failed', self._expand(intent, {}))
+            raise EmulatorError(
+                402, 'card_error', error['message'], code='card_declined',
+                extra={'decline_code': 'generic_decline', 'payment_intent': self._expand(intent, {}), 'charge': charge['id']},
+            )
+
+        charge.update({'status': 'succeeded', 'paid': True})
+        intent['status'] = 'succeeded'
+        intent['amount_received'] = intent['amount']
+        intent['last_payment_error'] = None
+        self.emit_event('payment_intent.succeeded', self._expand(intent, {}))
+        return self._expand(intent, params)
+
+    def cancel_payment_intent(self, params, id):
+        intent = self._get('payment_intent', id)
+        if intent['status'] == 'succeeded':
+            raise EmulatorError(
+                400, 'invalid_request_error',
+                'You cannot cancel this PaymentIntent because it has a status of succeeded.',
+                code='payment_intent_unexpected_state',
+            )
+        intent['status'] = 'canceled'
+        intent['canceled_at'] = int(time.time())
+        intent['cancellation_reason'] = params.get('cancellation_reason')
+        self.emit_event('payment_intent.canceled', self._expand(intent, {}))
+        return self._expand(intent, params)
+
+    # Refunds
+
+    def create_refund(self, params):
+        intent_id = params.get('payment_intent')
+        charge_id = params.get('charge')
+        if intent_id:
+            intent = self._get('payment_intent', intent_id, param='payment_intent')
+            charge_id = intent['latest_charge']
+        if not charge_id:
+            raise EmulatorError(400, 'invalid_request_error', 'This PaymentIntent does not have a successful charge to refund.')
+        charge = self._get('charge', charge_id, param='charge')
+
+        amount = int(params.get('amount') or charge['amount'] - charge['amount_refunded'])
+        if amount > charge['amount'] - charge['amount_refunded']:
+            raise EmulatorError(
+                400, 'invalid_request_error',
+                f"Refund amount ({amount}) is greater than unrefunded amount on charge.",
+                code='amount_too_large', param='amount',
+            )
+
+        refund = {
+            'id': _new_id('re'), 'object': 'refund', 'amount': amount, 'currency': charge['currency'],
+            'charge': charge['id'], 'payment_intent': charge['payment_intent'], 'created': int(time.time()),
+            'reason': params.get('reason'), 'metadata': params.get('metadata') or {}, 'status': 'succeeded',
+        }
+        self.objects[refund['id']] = refund
+        charge['amount_refunded'] += amount
+        charge['refunded'] = charge['amount_refunded'] >= charge['amount']
+        self.emit_event('charge.refunded', dict(charge))
+        return refund
+
+    def retrieve_refund(self, params, id):
+        return self._get('refund', id)
+
+    # Control plane
+
+    def configure(self, params):
+        """Change latency/failure injection at runtime (POST /_emulator/config)"""
+        for field in ('latency', 'jitter', 'failure_rate'):
+            if field in params:
+                setattr(self, field, float(params[field]))
+        for field in ('webhook_url', 'webhook_secret'):
+            if field in params:
+                setattr(self, field, params[field] or None)
+        return {
+            'latency': self.latency, 'jitter': self.jitter, 'failure_rate': self.failure_rate,
+            'webhook_url': self.webhook_url, 'requests': self.request_count,
+        }
+
+    def reset_state(self, params):
+        self.reset()
+        return {'reset': True}
+
+    def _public(self, obj):
+        return {k: v for k, v in obj.items() if not k.startswith('_')}
+
+    # Webhooks
+
+    def emit_event(self, event_type, obj):
+        """Build a Stripe event for ``obj`` and deliver it signed to the webhook endpoint"""
+        event = {
+            'id': _new_id('evt'), 'object': 'event', 'type': event_type,
+            'api_version': stripe.api_version, 'created': int(time.time()),
+            'livemode': False, 'pending_webhooks': 1,
+            'data': {'object': self._public(obj)},
+            'request': {'id': None, 'idempotency_key': None},
+        }
+        self.events.append(event)
+
+        if not (self.webhook_url or self.webhook_callback) or not self.webhook_secret:
+            return event
+
+        if self.webhook_async:
+            threading.Thread(target=self.deliver_event, args=(event,), daemon=True).start()
+        else:
+            self.deliver_event(event)
+        return event
+
+    def deliver_event(self, event):
+        payload = json.dumps(event)
+        headers = {
+            'Content-Type': 'application/json',
+            'Stripe-Signature': stripe.WebhookSignature.generate_signature_header(payload, self.webhook_secret),
+        }
+        try:
+            if self.webhook_callback:
+                return self.webhook_callback(payload.encode('utf-8'), headers)
+            request = urllib.request.Request(self.webhook_url, data=payload.encode('utf-8'), headers=headers, method='POST')
+            with urllib.request.urlopen(request, timeout=10) as response:
+                return response.status
+        except Exception as e:
+            logger.warning("Stripe emulator could not deliver %s: %s", event['id'], e)
+
+
+class EmulatorRequestHandler(BaseHTTPRequestHandler):
+    emulator = None
+    protocol_version = 'HTTP/1.1'
+
+    def _handle(self, method):
+        url = urlsplit(self.path)
+        params = decode_form(parse_qsl(url.query, keep_blank_values=True))
+
+        length = int(self.headers.get('Content-Length') or 0)
+        if length:
+            body = self.rfile.read(length).decode('utf-8')
+            if self.headers.get('Content-Type', '').startswith('application/json'):
+                params.update(json.loads(body or '{}'))
+            else:
+                params.update(decode_form(parse_qsl(body, keep_blank_values=True)))
+
+        status, body = self.emulator.dispatch(method, url.path, params, self.headers.get('Idempotency-Key'))
+        payload = json.dumps(body).encode('utf-8')
+
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.send_header('Request-Id', _new_id('req'))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        self._handle('GET')
+
+    def do_POST(self):
+        self._handle('POST')
+
+    def do_DELETE(self):
+        self._handle('DELETE')
+
+    def log_message(self, format, *args):
+        logger.debug("Stripe emulator: " + format, *args)
+
+
+def django_client_webhook_callback(client, path='/payments/webhook/'):
+    """Deliver emulator webhooks in-process through a Django test client"""
+    def deliver(payload, headers):
+        response = client.post(
+            path, payload, content_type='application/json',
+            HTTP_STRIPE_SIGNATURE=headers['Stripe-Signature'], secure=True,
+        )
+        return response.status_code
+    return deliver
@@ -0,0 +1,393 @@
+"""
+Shared Stripe gateway.
+
+Every PaymentIntent/Customer/PaymentMethod call goes through this module so
+they share one pooled keep-alive HTTP client, per-operation timeouts,
+bounded retries with jitter, a circuit breaker that fails fast during
+Stripe outages, per-call latency histograms and a trace span per call.
+
+The ``*_async`` functions apply the same policies for async views (ASGI,
+ASYNC_VIEWS) over an httpx pool, so views can await Stripe, and run
+independent calls concurrently, without holding a worker thread.
+"""
+
+import asyncio
+import contextvars
+import logging
+import random
+import ssl
+import threading
+import time
+import uuid
+import weakref
+
+import requests
+import stripe
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+from utils import metrics, tracing
+
+logger = logging.getLogger(__name__)
+
+STRIPE_LATENCY = metrics.histogram(
+    'stripe_request_duration_seconds',
+    'Latency of Stripe API calls (including retries)',
+    ['operation', 'outcome'],
+)
+STRIPE_RETRIES = metrics.counter(
+    'stripe_request_retries_total',
+    'Stripe API calls retried after a transient failure',
+    ['operation'],
+)
+STRIPE_SHORT_CIRCUITS = metrics.counter(
+    'stripe_circuit_open_total',
+    'Stripe API calls rejected because the circuit breaker was open',
+    ['operation'],
+)
+
+# Connection errors and 5xx responses: worth retrying and a sign of an outage
+TRANSIENT_ERRORS = (stripe.error.APIConnectionError, stripe.error.APIError)
+# Retried, but a rate limit does not mean Stripe is down
+RETRYABLE_ERRORS = TRANSIENT_ERRORS + (stripe.error.RateLimitError,)
+
+
+class StripeUnavailable(stripe.error.APIConnectionError):
+    """Raised without calling Stripe while the circuit breaker is open"""
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker.
+
+    After ``failure_threshold`` transient failures in a row the circuit opens
+    and calls fail fast for ``reset_timeout`` seconds. Then a single trial call
+    is let through (half-open): success closes the circuit, failure re-opens it.
+    """
+
+    def __init__(self, failure_threshold, reset_timeout):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return 'half-open'
+        return 'open'
+
+    def allow(self):
+        with self._lock:
+            state = self.state
+            if state == 'closed':
+                return True
+            if state == 'half-open' and not self.trial_in_flight:
+                self.trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.trial_in_flight or self.failures >= self.failure_threshold:
+                if self.opened_at is None or self.trial_in_flight:
+                    logger.warning("Stripe circuit breaker opened after %s failures", self.failures)
+                self.opened_at = time.monotonic()
+            self.trial_in_flight = False
+
+
+class PooledRequestsClient(stripe.RequestsClient):
+    """
+    Stripe HTTP client with a keep-alive connection pool per thread and a
+    per-call timeout override (Stripe's client only supports one timeout).
+    """
+
+    def __init__(self, timeout, pool_size, **kwargs):
+        self._local = threading.local()
+        self.pool_size = pool_size
+        super().__init__(timeout=timeout, **kwargs)
+
+    @property
+    def _timeout(self):
+        return getattr(self._local, 'timeout', None) or self._default_timeout
+
+    @_timeout.setter
+    def _timeout(self, value):
+        self._default_timeout = value
+
+    def set_timeout(self, timeout):
+        self._local.timeout = timeout
+
+    def _build_session(self):
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size, max_retries=0)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        return session
+
+    def request(self, method, url, headers, post_data=None):
+        if getattr(self._thread_local, 'session', None) is None:
+            self._thread_local.session = self._build_session()
+        return super().request(method, url, headers, post_data)
+
+
+class PooledHTTPXClient(stripe.HTTPXClient):
+    """
+    Async Stripe HTTP client with a keep-alive httpx pool per event loop
+    (httpx connections can't cross loops) and a per-task timeout override.
+    """
+
+    def __init__(self, timeout, pool_size, **kwargs):
+        self._pools = weakref.WeakKeyDictionary()
+        self._task_timeout = contextvars.ContextVar('stripe_timeout', default=None)
+        self.pool_size = pool_size
+        super().__init__(timeout=timeout, **kwargs)
+
+    @property
+    def _timeout(self):
+        return self._task_timeout.get() or self._default_timeout
+
+    @_timeout.setter
+    def _timeout(self, value):
+        self._default_timeout = value
+
+    def set_timeout(self, timeout):
+        self._task_timeout.set(timeout)
+
+    @property
+    def _client_async(self):
+        loop = asyncio.get_running_loop()
+        client = self._pools.get(loop)
+        if client is None:
+            verify = ssl.create_default_context(cafile=stripe.ca_bundle_path) if self._verify_ssl_certs else False
+            client = self._pools[loop] = self.httpx.AsyncClient(
+                verify=verify,
+                limits=self.httpx.Limits(max_connections=None, max_keepalive_connections=self.pool_size),
+            )
+        return client
+
+    @_client_async.setter
+    def _client_async(self, client):
+        # HTTPXClient builds one client up front; pools are made per loop instead
+        pass
+
+
+async_http_client = PooledHTTPXClient(
+    timeout=settings.STRIPE_TIMEOUTS.get('default', 10),
+    pool_size=settings.STRIPE_ASYNC_HTTP_POOL_SIZE,
+)
+http_client = PooledRequestsClient(
+    timeout=settings.STRIPE_TIMEOUTS.get('default', 10),
+    pool_size=settings.STRIPE_HTTP_POOL_SIZE,
+    # Stripe's *_async methods go through the default client's async fallback
+    async_fallback_client=async_http_client,
+)
+breaker = CircuitBreaker(
+    failure_threshold=settings.STRIPE_CIRCUIT_FAILURE_THRESHOLD,
+    reset_timeout=settings.STRIPE_CIRCUIT_RESET_SECONDS,
+)
+
+stripe.api_key = settings.STRIPE_SECRET_KEY
+if settings.STRIPE_API_BASE:
+    # e.g. the offline emulator (python manage.py run_stripe_emulator)
+    stripe.api_base = settings.STRIPE_API_BASE
+stripe.default_http_client = http_client
+# Retries are handled here so they share the breaker and the metrics
+stripe.max_network_retries = 0
+
+
+def _backoff(attempt):
+    """Full-jitter exponential backoff"""
+    ceiling = min(settings.STRIPE_RETRY_MAX_DELAY, settings.STRIPE_RETRY_BASE_DELAY * (2 ** attempt))
+    return random.uniform(0, ceiling)
+
+
+def _timeout(operation):
+    timeouts = settings.STRIPE_TIMEOUTS
+    return timeouts.get(operation, timeouts.get('default', 10))
+
+
+def _check_breaker(operation):
+    if not breaker.allow():
+        STRIPE_SHORT_CIRCUITS.inc(operation=operation)
+        raise StripeUnavailable("Stripe is temporarily unavailable, please try again shortly")
+
+
+def call(operation, func, *args, idempotent=False, **params):
+    """
+    Run a Stripe API call with the gateway policies applied.
+
+    ``idempotent`` marks mutating calls: an idempotency key is generated once
+    and reused on every retry so a retried create can never double-charge.
+    """
+    _check_breaker(operation)
+
+    if idempotent:
+        params.setdefault('idempotency_key', str(uuid.uuid4()))
+
+    http_client.set_timeout(_timeout(operation))
+
+    start = time.perf_counter()
+    outcome = 'error'
+    attempt = 0
+    trace_span = tracing.start_span(f'stripe {operation}', 'client', **{'stripe.operation': operation})
+    try:
+        while True:
+            try:
+                result = func(*args, **params)
+            except RETRYABLE_ERRORS as e:
+                if isinstance(e, TRANSIENT_ERRORS):
+                    breaker.record_failure()
+                else:
+                    breaker.record_success()
+                if attempt >= settings.STRIPE_MAX_RETRIES or not breaker.allow():
+                    raise
+                STRIPE_RETRIES.inc(operation=operation)
+                time.sleep(_backoff(attempt))
+                attempt += 1
+                continue
+            except stripe.error.StripeError:
+                # Declines, validation errors etc: Stripe is up, the request was just rejected
+                breaker.record_success()
+                outcome = 'rejected'
+                raise
+            except Exception:
+                # Anything else still settles a half-open trial
+                breaker.record_failure()
+                raise
+            breaker.record_success()
+            outcome = 'success'
+            return result
+    finally:
+        http_client.set_timeout(None)
+        STRIPE_LATENCY.observe(time.perf_counter() - start, operation=operation, outcome=outcome)
+        if trace_span is not None:
+            trace_span.set_attribute('stripe.outcome', outcome)
+            trace_span.set_attribute('stripe.retries', attempt)
+            trace_span.finish()
+
+
+def create_payment_intent(**params):
+    return call('payment_intent.create', stripe.PaymentIntent.create, idempotent=True, **params)
+
+
+def retrieve_payment_intent(payment_intent_id, **params):
+    return call('payment_intent.retrieve', stripe.PaymentIntent.retrieve, payment_intent_id, **params)
+
+
+def list_payment_intents(**params):
+    return call('payment_intent.list', stripe.PaymentIntent.list, **params)
+
+
+def confirm_payment_intent(payment_intent_id, **params):
+    return call('payment_intent.confirm', stripe.PaymentIntent.confirm, payment_intent_id, idempotent=True, **params)
+
+
+def charge_id(intent):
+    """Id of a PaymentIntent's latest charge, expanded or not ('' if it has none)"""
+    charge = getattr(intent, 'latest_charge', None)
+    if isinstance(charge, str):
+        return charge
+    return charge.id if charge else ''
+
+
+def create_customer(**params):
+    return call('customer.create', stripe.Customer.create, idempotent=True, **params)
+
+
+def retrieve_payment_method(payment_method_id, **params):
+    return call('payment_method.retrieve', stripe.PaymentMethod.retrieve, payment_method_id, **params)
+
+
+def attach_payment_method(payment_method_id, **params):
+    return call('payment_method.attach', stripe.PaymentMethod.attach, payment_method_id, idempotent=True, **params)
+
+
+def detach_payment_method(payment_method_id, **params):
+    return call('payment_method.detach', stripe.PaymentMethod.detach, payment_method_id, idempotent=True, **params)
+
+
+async def call_async(operation, func, *args, idempotent=False, **params):
+    """call() for Stripe's ``*_async`` methods; retries sleep without blocking the loop"""
+    _check_breaker(operation)
+
+    if idempotent:
+        params.setdefault('idempotency_key', str(uuid.uuid4()))
+
+    # Set in this task's context only, so concurrent calls keep their own timeouts
+    async_http_client.set_timeout(_timeout(operation))
+
+    start = time.perf_counter()
+    outcome = 'error'
+    attempt = 0
+    trace_span = tracing.start_span(f'stripe {operation}', 'client', **{'stripe.operation': operation})
+    try:
+        while True:
+            try:
+                result = await func(*args, **params)
+            except RETRYABLE_ERRORS as e:
+                if isinstance(e, TRANSIENT_ERRORS):
+                    breaker.record_failure()
+                else:
+                    breaker.record_success()
+                if attempt >= settings.STRIPE_MAX_RETRIES or not breaker.allow():
+                    raise
+                STRIPE_RETRIES.inc(operation=operation)
+                await asyncio.sleep(_backoff(attempt))
+                attempt += 1
+                continue
+            except stripe.error.StripeError:
+                breaker.record_success()
+                outcome = 'rejected'
+                raise
+            except (Exception, asyncio.CancelledError):
+                # Including a cancelled trial, which would otherwise hold the breaker half-open
+                breaker.record_failure()
+                raise
+            breaker.record_success()
+            outcome = 'success'
+            return result
+    finally:
+        async_http_client.set_timeout(None)
+        STRIPE_LATENCY.observe(time.perf_counter() - start, operation=operation, outcome=outcome)
+        if trace_span is not None:
+            trace_span.set_attribute('stripe.outcome', outcome)
+            trace_span.set_attribute('stripe.retries', attempt)
+            trace_span.finish()
+
+
+async def create_payment_intent_async(**params):
+    return await call_async('payment_intent.create', stripe.PaymentIntent.create_async, idempotent=True, **params)
+
+
+async def retrieve_payment_intent_async(payment_intent_id, **params):
+    return await call_async(
+        'payment_intent.retrieve', stripe.PaymentIntent.retrieve_async, payment_intent_id, **params
+    )
+
+
+async def create_customer_async(**params):
+    return await call_async('customer.create', stripe.Customer.create_async, idempotent=True, **params)
+
+
+async def retrieve_payment_method_async(payment_method_id, **params):
+    return await call_async(
+        'payment_method.retrieve', stripe.PaymentMethod.retrieve_async, payment_method_id, **params
+    )
+
+
+async def attach_payment_method_async(payment_method_id, **params):
+    return await call_async(
+        'payment_method.attach', stripe.PaymentMethod.attach_async, payment_method_id, idempotent=True, **params
+    )
@@ -0,0 +1,88 @@
+"""
+Management command to process stored Stripe webhook events
+Usage: python manage.py process_webhook_events [--once] [--workers 4]
+
+This is the DB-polling fallback for deployments without a Celery broker.
+Several pollers (or --workers threads) can run side by side: events are
+claimed with SELECT ... FOR UPDATE SKIP LOCKED so no event is handled twice.
+"""
+
+import threading
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connection
+
+from apps.payments.webhooks import duplicate_short_circuit_count, process_pending_events
+
+
+class Command(BaseCommand):
+    help = 'Process pending Stripe webhook events (DB-polling worker)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Drain the queue once and exit instead of polling forever',
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=2.0,
+            help='Seconds to sleep when the queue is empty',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=None,
+            help='Events claimed per transaction (defaults to STRIPE_WEBHOOK_BATCH_SIZE)',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=1,
+            help='Number of polling threads',
+        )
+
+    def handle(self, *args, **options):
+        self.stop = threading.Event()
+        self.lock = threading.Lock()
+        self.total = 0
+
+        threads = [
+            threading.Thread(target=self.poll, args=(options,), daemon=True)
+            for _ in range(max(options['workers'], 1))
+        ]
+        for thread in threads:
+            thread.start()
+
+        try:
+            for thread in threads:
+                while thread.is_alive():
+                    thread.join(timeout=0.5)
+        except KeyboardInterrupt:
+            self.stop.set()
+            for thread in threads:
+                thread.join()
+
+        self.stdout.write(self.style.SUCCESS(f'Processed {self.total} webhook events'))
+        self.stdout.write(f'Duplicate deliveries short-circuited by Redis: {duplicate_short_circuit_count()}')
+
+    def poll(self, options):
+        try:
+            while not self.stop.is_set():
+                close_old_connections()
+                try:
+                    claimed = process_pending_events(options['batch_size'])
+                except Exception as e:
+                    self.stderr.write(f'Error processing webhook events: {e}')
+                    claimed = 0
+
+                with self.lock:
+                    self.total += claimed
+
+                if not claimed:
+                    if options['once']:
+                        break
+                    self.stop.wait(options['interval'])
+        finally:
+            connection.close()
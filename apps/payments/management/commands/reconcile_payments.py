@@ -0,0 +1,84 @@
+"""
+Management command to reconcile stuck payments against Stripe
+Usage: python manage.py reconcile_payments [--dry-run] [--min-age-minutes 15] [--concurrency 4]
+
+Finds payments still pending/processing (e.g. because a webhook was lost),
+fetches their PaymentIntents in batches and applies the resulting status
+changes with set-based updates. Safe to run from cron: rows that a webhook
+settles mid-run are left untouched.
+"""
+
+import json
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from apps.payments.reconciliation import reconcile
+
+
+class Command(BaseCommand):
+    help = 'Reconcile pending/processing payments with their Stripe PaymentIntents'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Report what would change without writing anything',
+        )
+        parser.add_argument(
+            '--min-age-minutes',
+            type=float,
+            default=15,
+            help='Only consider payments older than this (gives webhooks time to arrive)',
+        )
+        parser.add_argument(
+            '--max-age-days',
+            type=float,
+            default=None,
+            help='Ignore payments older than this',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=500,
+            help='Payments read per keyset page',
+        )
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=4,
+            help='Concurrent Stripe fetches',
+        )
+        parser.add_argument(
+            '--window-slack',
+            type=int,
+            default=300,
+            help='Seconds either side of a payment\'s created_at to search on Stripe',
+        )
+        parser.add_argument(
+            '--summary-file',
+            help='Also write the run summary as JSON to this path',
+        )
+
+    def handle(self, *args, **options):
+        max_age = options['max_age_days']
+        summary = reconcile(
+            chunk_size=options['chunk_size'],
+            concurrency=max(options['concurrency'], 1),
+            min_age=timedelta(minutes=options['min_age_minutes']),
+            max_age=timedelta(days=max_age) if max_age is not None else None,
+            slack=options['window_slack'],
+            dry_run=options['dry_run'],
+        )
+
+        for key in sorted(summary):
+            self.stdout.write(f'{key}: {summary[key]}')
+
+        if options['summary_file']:
+            with open(options['summary_file'], 'w') as f:
+                json.dump(summary, f, indent=2, sort_keys=True)
+
+        if summary.get('errors'):
+            self.stdout.write(self.style.WARNING(f"Reconciled with {summary['errors']} failed chunks"))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"Reconciled {summary.get('scanned', 0)} payments"))
@@ -0,0 +1,74 @@
+"""
+Management command to run the offline Stripe emulator
+Usage: python manage.py run_stripe_emulator --port 12111 --latency-ms 80 --failure-rate 0.01
+
+Then start the app with STRIPE_API_BASE=http://127.0.0.1:12111 so every
+Stripe call is served locally, and webhooks are signed with
+STRIPE_WEBHOOK_SECRET and posted to --webhook-url.
+"""
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from apps.payments.emulator import StripeEmulator
+
+
+class Command(BaseCommand):
+    help = 'Run a local Stripe API stand-in for load and integration tests'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1', help='Interface to bind')
+        parser.add_argument('--port', type=int, default=12111, help='Port to listen on')
+        parser.add_argument(
+            '--latency-ms',
+            type=float,
+            default=0,
+            help='Fixed latency added to every API call',
+        )
+        parser.add_argument(
+            '--jitter-ms',
+            type=float,
+            default=0,
+            help='Random extra latency (uniform 0..jitter) per call',
+        )
+        parser.add_argument(
+            '--failure-rate',
+            type=float,
+            default=0.0,
+            help='Fraction of API calls answered with an injected 500 error',
+        )
+        parser.add_argument(
+            '--webhook-url',
+            default='http://127.0.0.1:8000/payments/webhook/',
+            help='Where to POST signed webhook events (empty to disable)',
+        )
+        parser.add_argument(
+            '--webhook-secret',
+            default=None,
+            help='Signing secret (defaults to STRIPE_WEBHOOK_SECRET)',
+        )
+        parser.add_argument('--seed', type=int, default=None, help='Seed for latency/failure randomness')
+
+    def handle(self, *args, **options):
+        emulator = StripeEmulator(
+            host=options['host'],
+            port=options['port'],
+            latency=options['latency_ms'] / 1000,
+            jitter=options['jitter_ms'] / 1000,
+            failure_rate=options['failure_rate'],
+            webhook_url=options['webhook_url'] or None,
+            webhook_secret=options['webhook_secret'] or settings.STRIPE_WEBHOOK_SECRET or None,
+            seed=options['seed'],
+        )
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Stripe emulator listening on http://{options['host']}:{options['port']}"
+        ))
+        self.stdout.write(f"Set STRIPE_API_BASE=http://{options['host']}:{options['port']} to use it")
+        if not emulator.webhook_secret:
+            self.stdout.write(self.style.WARNING('No webhook secret configured: webhooks will not be sent'))
+
+        try:
+            emulator.serve_forever()
+        except KeyboardInterrupt:
+            self.stdout.write('Stopping Stripe emulator')
@@ -135,6 +135,10 @@ class PaymentWebhookEvent(models.Model):
     processed = models.BooleanField(default=False)
     processing_error = models.TextField(blank=True)
     
+    # Retry bookkeeping for the background processor
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(null=True, blank=True)
+    
     # Related payment (if applicable)
     payment = models.ForeignKey(Payment, on_delete=models.CASCADE, null=True, blank=True, related_name='webhook_events')
     
@@ -144,6 +148,9 @@ class PaymentWebhookEvent(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['processed', 'next_attempt_at'], name='payments_webhook_pending_idx'),
+        ]
     
     def __str__(self):
         return f"Webhook Event {self.stripe_event_id} - {self.event_type}"
@@ -0,0 +1,31 @@
+"""
+pytest fixtures for running payment flows against the offline Stripe emulator.
+
+Enable with ``pytest -p apps.payments.pytest_plugin`` or by listing it in a
+conftest's ``pytest_plugins``.
+"""
+
+import pytest
+import stripe
+
+from .emulator import StripeEmulator
+
+
+@pytest.fixture
+def stripe_emulator():
+    """
+    Start a StripeEmulator on a free port and point the stripe library at it.
+
+    Webhooks are not delivered unless the test sets ``webhook_secret`` and
+    either ``webhook_url`` or ``webhook_callback`` (see
+    ``emulator.django_client_webhook_callback``).
+    """
+    emulator = StripeEmulator(webhook_async=False)
+    previous = stripe.api_base, stripe.api_key
+    stripe.api_base = emulator.start()
+    stripe.api_key = stripe.api_key or 'sk_test_emulator'
+    try:
+        yield emulator
+    finally:
+        emulator.stop()
+        stripe.api_base, stripe.api_key = previous
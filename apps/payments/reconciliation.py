@@ -0,0 +1,236 @@
+"""
+Reconcile Payment rows stuck in pending/processing against Stripe.
+
+Used when a webhook was lost. Candidates are streamed with keyset
+iteration, their PaymentIntents are fetched with paginated list calls over
+the candidates' creation-time windows (instead of one retrieve per row)
+on a bounded thread pool, and changes are written back with set-based
+updates.
+"""
+
+import logging
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from datetime import timedelta
+
+from django.db.models import Case, CharField, Q, Value, When
+from django.utils import timezone
+
+from apps.orders import state_machine, status_events
+from . import gateway
+from .models import Payment
+
+logger = logging.getLogger(__name__)
+
+OPEN_STATUSES = ['pending', 'processing']
+
+# Stripe PaymentIntent status -> Payment status (None: leave the row alone)
+INTENT_STATUS_MAP = {
+    'succeeded': 'succeeded',
+    'processing': 'processing',
+    'requires_capture': 'processing',
+    'canceled': 'cancelled',
+}
+
+
+def payment_status_for(intent):
+    """Payment status implied by a PaymentIntent, or None if it is still open"""
+    if intent.status == 'requires_payment_method' and getattr(intent, 'last_payment_error', None):
+        return 'failed'
+    return INTENT_STATUS_MAP.get(intent.status)
+
+
+def iter_candidates(chunk_size, min_age, max_age=None):
+    """
+    Yield chunks of open payments, oldest first.
+
+    Keyset pagination on (created_at, id) keeps every query an index range
+    scan no matter how deep into the table the run gets.
+    """
+    now = timezone.now()
+    queryset = Payment.objects.filter(status__in=OPEN_STATUSES, created_at__lte=now - min_age)
+    if max_age is not None:
+        queryset = queryset.filter(created_at__gte=now - max_age)
+    queryset = queryset.order_by('created_at', 'id').values(
+        'id', 'order_id', 'status', 'stripe_payment_intent_id', 'created_at'
+    )
+
+    last = None
+    while True:
+        page = queryset
+        if last is not None:
+            page = page.filter(
+                Q(created_at__gt=last['created_at']) |
+                Q(created_at=last['created_at'], id__gt=last['id'])
+            )
+        chunk = list(page[:chunk_size])
+        if not chunk:
+            return
+        yield chunk
+        last = chunk[-1]
+
+
+def time_windows(chunk, slack):
+    """
+    Group candidates into [start, end] windows of Stripe creation time.
+
+    Candidates whose +/- slack intervals overlap share a window, so dense
+    bursts are fetched with a few list pages while isolated stragglers do
+    not drag in everything created in between.
+    """
+    windows = []
+    for row in sorted(chunk, key=lambda r: r['created_at']):
+        ts = int(row['created_at'].timestamp())
+        start, end = ts - slack, ts + slack
+        if windows and start <= windows[-1][1]:
+            windows[-1][1] = max(windows[-1][1], end)
+            windows[-1][2].add(row['stripe_payment_intent_id'])
+        else:
+            windows.append([start, end, {row['stripe_payment_intent_id']}])
+    return windows
+
+
+def fetch_window(start, end, wanted, page_size):
+    """List intents created in [start, end] until every wanted id is found"""
+    if len(wanted) == 1:
+        intent_id = next(iter(wanted))
+        return {intent_id: gateway.retrieve_payment_intent(intent_id)}, 1
+
+    found = {}
+    calls = 0
+    params = {'created': {'gte': start, 'lte': end}, 'limit': page_size}
+    while True:
+        page = gateway.list_payment_intents(**params)
+        calls += 1
+        for intent in page.data:
+            if intent.id in wanted:
+                found[intent.id] = intent
+        if not page.has_more or len(found) == len(wanted) or not page.data:
+            return found, calls
+        params['starting_after'] = page.data[-1].id
+
+
+def fetch_intents(chunk, slack, page_size):
+    """Fetch the intents for one chunk of candidates; runs on a pool thread"""
+    intents = {}
+    calls = 0
+    for start, end, wanted in time_windows(chunk, slack):
+        found, window_calls = fetch_window(start, end, wanted, page_size)
+        intents.update(found)
+        calls += window_calls
+
+    # Anything outside its window (clock skew, odd metadata) is retrieved directly
+    missing = {row['stripe_payment_intent_id'] for row in chunk} - set(intents)
+    for intent_id in missing:
+        try:
+            intents[intent_id] = gateway.retrieve_payment_intent(intent_id)
+        except gateway.stripe.error.InvalidRequestError:
+            pass
+        calls += 1
+
+    return intents, calls, len(missing)
+
+
+def apply_changes(chunk, intents, dry_run=False):
+    """Write back status changes for one chunk; returns a Counter of what changed"""
+    stats = Counter()
+    changes = {}
+    for row in chunk:
+        intent = intents.get(row['stripe_payment_intent_id'])
+        if intent is None:
+            stats['not_found'] += 1
+            continue
+        new_status = payment_status_for(intent)
+        if new_status is None or new_status == row['status']:
+            stats['unchanged'] += 1
+            continue
+        changes.setdefault(new_status, []).append((row, intent))
+
+    now = timezone.now()
+    for new_status, items in changes.items():
+        stats[f'payments_{new_status}'] += len(items)
+        if dry_run:
+            continue
+
+        update = {'status': new_status, 'updated_at': now}
+        if new_status in ('succeeded', 'failed', 'cancelled'):
+            update['processed_at'] = now
+        if new_status == 'succeeded':
+            update['stripe_charge_id'] = Case(
+                *[When(id=row['id'], then=Value(gateway.charge_id(intent))) for row, intent in items],
+                output_field=CharField(),
+            )
+        if new_status == 'failed':
+            update['failure_reason'] = Case(
+                *[When(id=row['id'], then=Value(_failure_reason(intent))) for row, intent in items],
+                output_field=CharField(),
+            )
+
+        # Only rows still open: a webhook may have landed since we read them
+        updated = Payment.objects.filter(
+            id__in=[row['id'] for row, _ in items],
+            status__in=OPEN_STATUSES,
+        ).update(**update)
+        stats['payments_updated'] += updated
+
+        order_ids = {row['order_id'] for row, _ in items}
+        if new_status == 'succeeded':
+            confirmed = state_machine.bulk_transition(
+                order_ids,
+                'confirmed',
+                notes='Payment succeeded (reconciliation)',
+                from_statuses=state_machine.PAYABLE_STATUSES,
+            ).changed
+            stats['orders_confirmed'] += len(confirmed)
+            # Confirmed orders were published with their transition
+            order_ids -= set(confirmed)
+
+        status_events.publish_on_commit(order_ids)
+
+    return stats
+
+
+def _failure_reason(intent):
+    error = getattr(intent, 'last_payment_error', None)
+    return getattr(error, 'message', None) or 'Payment failed'
+
+
+def reconcile(chunk_size=500, concurrency=4, min_age=timedelta(minutes=15), max_age=None,
+              slack=300, page_size=100, dry_run=False):
+    """Run one reconciliation pass and return a summary dict"""
+    started = time.monotonic()
+    stats = Counter()
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        in_flight = {}
+
+        def drain(return_when):
+            done, _ = wait(in_flight, return_when=return_when)
+            for future in done:
+                chunk = in_flight.pop(future)
+                try:
+                    intents, calls, missing = future.result()
+                except Exception:
+                    logger.exception("Reconciliation chunk failed")
+                    stats['errors'] += 1
+                    stats['error_rows'] += len(chunk)
+                    continue
+                stats['stripe_calls'] += calls
+                stats['retrieved_individually'] += missing
+                stats.update(apply_changes(chunk, intents, dry_run=dry_run))
+
+        for chunk in iter_candidates(chunk_size, min_age, max_age):
+            stats['scanned'] += len(chunk)
+            in_flight[pool.submit(fetch_intents, chunk, slack, page_size)] = chunk
+            # Bounded: never read far ahead of what the pool can fetch
+            if len(in_flight) >= concurrency * 2:
+                drain(FIRST_COMPLETED)
+
+        while in_flight:
+            drain(FIRST_COMPLETED)
+
+    summary = dict(stats)
+    summary['dry_run'] = dry_run
+    summary['elapsed_seconds'] = round(time.monotonic() - started, 3)
+    return summary
@@ -0,0 +1,17 @@
+"""Background tasks for payment processing"""
+
+from celery import shared_task
+
+from .webhooks import process_pending_events
+
+
+@shared_task(ignore_result=True)
+def process_webhook_events(max_batches=20):
+    """Drain pending Stripe webhook events in batches"""
+    processed = 0
+    for _ in range(max_batches):
+        claimed = process_pending_events()
+        processed += claimed
+        if not claimed:
+            break
+    return processed
@@ -0,0 +1,73 @@
+import json
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase
+
+from . import gateway, webhooks
+from .models import PaymentWebhookEvent
+
+
+class CircuitBreakerTrialTests(SimpleTestCase):
+    def setUp(self):
+        # Opens on the first failure and goes half-open straight away
+        self.breaker = gateway.CircuitBreaker(failure_threshold=1, reset_timeout=0)
+        patcher = mock.patch.object(gateway, 'breaker', self.breaker)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.breaker.record_failure()
+
+    def test_trial_failing_with_a_non_stripe_error_is_settled(self):
+        def trial():
+            raise ValueError('Unexpected response')
+
+        with self.assertRaises(ValueError):
+            gateway.call('test', trial)
+        self.assertFalse(self.breaker.trial_in_flight)
+        self.assertTrue(self.breaker.allow())
+
+    def test_async_trial_failing_with_a_non_stripe_error_is_settled(self):
+        async def trial():
+            raise ValueError('Unexpected response')
+
+        with self.assertRaises(ValueError):
+            async_to_sync(gateway.call_async)('test', trial)
+        self.assertFalse(self.breaker.trial_in_flight)
+        self.assertTrue(self.breaker.allow())
+
+
+@mock.patch('stripe.Webhook.construct_event')
+class WebhookDedupeTests(TestCase):
+    url = '/payments/webhook/'
+    event = {'id': 'evt_test_dedupe', 'type': 'payment_intent.succeeded', 'data': {'object': {'id': 'pi_test'}}}
+
+    def setUp(self):
+        self.clear()
+        self.addCleanup(self.clear)
+
+    def clear(self):
+        cache.delete(webhooks.DEDUPE_KEY_PREFIX + self.event['id'])
+
+    def deliver(self):
+        return self.client.post(self.url, json.dumps(self.event), content_type='application/json', secure=True)
+
+    def test_duplicate_delivery_is_rejected_before_the_database(self, construct_event):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.deliver().status_code, 200)
+        self.assertTrue(webhooks.event_seen(self.event['id']))
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.deliver().status_code, 200)
+        self.assertEqual(PaymentWebhookEvent.objects.filter(stripe_event_id=self.event['id']).count(), 1)
+
+    def test_event_is_not_marked_seen_until_it_is_stored(self, construct_event):
+        with mock.patch.object(webhooks, 'ingest_event', side_effect=RuntimeError('database went away')):
+            with self.assertRaises(RuntimeError):
+                self.deliver()
+        self.assertFalse(webhooks.event_seen(self.event['id']))
+
+        # Stripe's retry gets through and is stored
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.deliver().status_code, 200)
+        self.assertTrue(PaymentWebhookEvent.objects.filter(stripe_event_id=self.event['id']).exists())
@@ -1,16 +1,27 @@
+from django.conf import settings
 from django.urls import path
 from . import views
 
 app_name = 'payments'
 
+# ASGI deployments await Stripe instead of blocking a worker on it
+if settings.ASYNC_VIEWS:
+    confirm_view = views.AsyncPaymentConfirmView
+    process_saved_view = views.AsyncProcessSavedPaymentMethodView
+    add_method_view = views.AsyncAddPaymentMethodView
+else:
+    confirm_view = views.PaymentConfirmView
+    process_saved_view = views.ProcessSavedPaymentMethodView
+    add_method_view = views.AddPaymentMethodView
+
 urlpatterns = [
     path('process/', views.PaymentProcessView.as_view(), name='process'),
     path('create-intent/', views.CreatePaymentIntentView.as_view(), name='create_intent'),
-    path('confirm/', views.PaymentConfirmView.as_view(), name='confirm'),
-    path('process-saved/', views.ProcessSavedPaymentMethodView.as_view(), name='process_saved'),
+    path('confirm/', confirm_view.as_view(), name='confirm'),
+    path('process-saved/', process_saved_view.as_view(), name='process_saved'),
     path('webhook/', views.StripeWebhookView.as_view(), name='webhook'),
     path('methods/', views.PaymentMethodListView.as_view(), name='methods'),
-    path('methods/add/', views.AddPaymentMethodView.as_view(), name='add_method'),
+    path('methods/add/', add_method_view.as_view(), name='add_method'),
     path('methods/<int:pk>/delete/', views.DeletePaymentMethodView.as_view(), name='delete_method'),
     path('methods/<int:pk>/set-default/', views.SetDefaultPaymentMethodView.as_view(), name='set_default_method'),
     path('test-order/', views.CreateTestOrderView.as_view(), name='create_test_order'),
@@ -1,5 +1,7 @@
+import asyncio
 import json
 import stripe
+from asgiref.sync import sync_to_async
 from django.conf import settings
 from django.shortcuts import render, get_object_or_404, redirect
 from django.views.generic import TemplateView, ListView, View
@@ -10,11 +12,29 @@ from django.utils.decorators import method_decorator
 from django.utils import timezone
 from django.contrib import messages
 from django.urls import reverse
+from apps.orders import state_machine, status_events
 from apps.orders.models import Order
-from .models import Payment, PaymentWebhookEvent, PaymentMethod, StripeCustomer
+from utils import aio
+from .models import Payment, PaymentMethod, StripeCustomer
+from . import gateway, webhooks
 
-# Initialize Stripe
-stripe.api_key = settings.STRIPE_SECRET_KEY
+
+def record_payment_succeeded(payment, charge_id):
+    """Mark the payment succeeded and confirm its order"""
+    payment.status = 'succeeded'
+    payment.stripe_charge_id = charge_id
+    payment.save()
+    
+    # Confirming the order tells status listeners; otherwise tell them here
+    if not state_machine.mark_paid(payment.order):
+        status_events.publish_on_commit([payment.order_id])
+
+
+def record_payment_failed(payment, intent, default_reason):
+    payment.status = 'failed'
+    payment.failure_reason = intent.last_payment_error.message if intent.last_payment_error else default_reason
+    payment.save()
+    status_events.publish_on_commit([payment.order_id])
 
 
 class PaymentProcessView(LoginRequiredMixin, TemplateView):
@@ -31,6 +51,15 @@ class PaymentProcessView(LoginRequiredMixin, TemplateView):
                 order = Order.objects.get(id=order_id, user=self.request.user)
                 context['order'] = order
                 
+                # Where the page waits for the webhook to record the payment
+                context['order_status_url'] = reverse('orders:status', args=[order.id])
+                if settings.ASYNC_VIEWS:
+                    context['order_status_stream_url'] = reverse('orders:status_stream', args=[order.id])
+                # No webhook can arrive without a signing secret: confirm straight away
+                context['webhook_wait_ms'] = (
+                    settings.PAYMENT_WEBHOOK_WAIT_SECONDS * 1000 if settings.STRIPE_WEBHOOK_SECRET else 0
+                )
+                
             except Order.DoesNotExist:
                 context['order'] = None
         else:
@@ -65,7 +94,7 @@ class CreatePaymentIntentView(LoginRequiredMixin, View):
             order = get_object_or_404(Order, id=order_id, user=request.user)
             
             # Create Stripe PaymentIntent
-            intent = stripe.PaymentIntent.create(
+            intent = gateway.create_payment_intent(
                 amount=int(order.total * 100),  # Convert to cents
                 currency='usd',
                 metadata={
@@ -111,134 +140,93 @@ class PaymentConfirmView(LoginRequiredMixin, View):
             )
             
             # Retrieve PaymentIntent from Stripe
-            intent = stripe.PaymentIntent.retrieve(payment_intent_id)
+            intent = gateway.retrieve_payment_intent(payment_intent_id, expand=['latest_charge'])
             
-            if intent.status == 'succeeded':
-                payment.status = 'succeeded'
-                payment.stripe_charge_id = intent.charges.data[0].id if intent.charges.data else ''
-                payment.save()
-                
-                # Update order status
-                order = payment.order
-                order.status = 'confirmed'
-                order.save()
-                
-                return JsonResponse({
-                    'success': True,
-                    'redirect_url': reverse('orders:success')
-                })
-            else:
-                payment.status = 'failed'
-                payment.failure_reason = intent.last_payment_error.message if intent.last_payment_error else 'Unknown error'
-                payment.save()
-                
-                return JsonResponse({
-                    'success': False,
-                    'error': 'Payment failed'
-                })
+            return confirm_response(payment, intent)
                 
         except Exception as e:
             return JsonResponse({'error': str(e)}, status=400)
 
 
+def confirm_response(payment, intent):
+    """Record a client-confirmed PaymentIntent and build the confirm view's response"""
+    if intent.status == 'succeeded':
+        record_payment_succeeded(payment, gateway.charge_id(intent))
+        return JsonResponse({
+            'success': True,
+            'redirect_url': reverse('orders:success')
+        })
+    
+    record_payment_failed(payment, intent, 'Unknown error')
+    return JsonResponse({
+        'success': False,
+        'error': 'Payment failed'
+    })
+
+
+class AsyncPaymentConfirmView(aio.LoginRequiredMixin, View):
+    """PaymentConfirmView for ASGI deployments (ASYNC_VIEWS)"""
+    
+    async def post(self, request):
+        try:
+            data = json.loads(request.body)
+            payment_intent_id = data.get('payment_intent_id')
+            
+            if not payment_intent_id:
+                return JsonResponse({'error': 'Payment intent ID required'}, status=400)
+            
+            # The payment lookup and the Stripe round trip are independent
+            payment, intent = await asyncio.gather(
+                aio.get_object_or_404(
+                    Payment.objects.select_related('order'),
+                    stripe_payment_intent_id=payment_intent_id,
+                    user=request.user
+                ),
+                gateway.retrieve_payment_intent_async(payment_intent_id, expand=['latest_charge']),
+            )
+            return await sync_to_async(confirm_response)(payment, intent)
+            
+        except Exception as e:
+            return JsonResponse({'error': str(e)}, status=400)
+
+
 @method_decorator(csrf_exempt, name='dispatch')
 class StripeWebhookView(View):
+    """
+    Fast ingest path for Stripe webhooks: verify, dedupe and persist the event,
+    then acknowledge. Processing happens in apps.payments.webhooks workers.
+    """
+    
     def post(self, request):
         payload = request.body
         sig_header = request.META.get('HTTP_STRIPE_SIGNATURE')
         endpoint_secret = settings.STRIPE_WEBHOOK_SECRET
         
         try:
-            event = stripe.Webhook.construct_event(
+            stripe.Webhook.construct_event(
                 payload, sig_header, endpoint_secret
             )
+            # Store the raw JSON rather than the StripeObject wrapper
+            event = json.loads(payload)
         except ValueError:
             return HttpResponse(status=400)
         except stripe.error.SignatureVerificationError:
             return HttpResponse(status=400)
         
-        # Store webhook event
-        webhook_event, created = PaymentWebhookEvent.objects.get_or_create(
-            stripe_event_id=event['id'],
-            defaults={
-                'event_type': event['type'],
-                'data': event['data']
-            }
-        )
+        # Reject duplicate deliveries before touching the database. This runs
+        # after signature verification so forged ids cannot block real events.
+        if webhooks.event_seen(event['id']):
+            webhooks.record_duplicate_short_circuit()
+            return HttpResponse(status=200)
+        
+        # Store webhook event; concurrent deliveries are deduped by its unique id
+        webhook_event, created = webhooks.ingest_event(event)
+        webhooks.mark_event_seen_on_commit(event['id'])
         
         if created:
-            # Process the event
-            self.handle_webhook_event(webhook_event)
+            webhooks.enqueue_processing()
         
         return HttpResponse(status=200)
-    
-    def handle_webhook_event(self, webhook_event):
-        """Process webhook event"""
-        try:
-            event_type = webhook_event.event_type
-            
-            if event_type == 'payment_intent.succeeded':
-                self.handle_payment_succeeded(webhook_event)
-            elif event_type == 'payment_intent.payment_failed':
-                self.handle_payment_failed(webhook_event)
-            elif event_type == 'payment_intent.canceled':
-                self.handle_payment_canceled(webhook_event)
-            
-            webhook_event.processed = True
-            webhook_event.processed_at = timezone.now()
-            webhook_event.save()
-            
-        except Exception as e:
-            webhook_event.processing_error = str(e)
-            webhook_event.save()
-    
-    def handle_payment_succeeded(self, webhook_event):
-        """Handle successful payment"""
-        payment_intent = webhook_event.data['object']
-        
-        try:
-            payment = Payment.objects.get(
-                stripe_payment_intent_id=payment_intent['id']
-            )
-            payment.status = 'succeeded'
-            payment.save()
-            
-            # Update order
-            order = payment.order
-            order.status = 'confirmed'
-            order.save()
-            
-        except Payment.DoesNotExist:
-            pass
-    
-    def handle_payment_failed(self, webhook_event):
-        """Handle failed payment"""
-        payment_intent = webhook_event.data['object']
-        
-        try:
-            payment = Payment.objects.get(
-                stripe_payment_intent_id=payment_intent['id']
-            )
-            payment.status = 'failed'
-            payment.failure_reason = payment_intent.get('last_payment_error', {}).get('message', 'Payment failed')
-            payment.save()
-            
-        except Payment.DoesNotExist:
-            pass
-    
-    def handle_payment_canceled(self, webhook_event):
-        """Handle canceled payment"""
-        payment_intent = webhook_event.data['object']
-        
-        try:
-            payment = Payment.objects.get(
-                stripe_payment_intent_id=payment_intent['id']
-            )
-            payment.status = 'cancelled'
-            payment.save()
-            
-        except Payment.DoesNotExist:
-            pass
 
 
 class PaymentMethodListView(LoginRequiredMixin, ListView):
@@ -266,7 +254,7 @@ class AddPaymentMethodView(LoginRequiredMixin, View):
                 return JsonResponse({'error': 'Payment method ID required'}, status=400)
             
             # Retrieve payment method from Stripe
-            pm = stripe.PaymentMethod.retrieve(payment_method_id)
+            pm = gateway.retrieve_payment_method(payment_method_id)
             
             # Get or create Stripe customer
             stripe_customer, created = StripeCustomer.objects.get_or_create(
@@ -278,7 +266,7 @@ class AddPaymentMethodView(LoginRequiredMixin, View):
             
             if created or not stripe_customer.stripe_customer_id:
                 # Create Stripe customer
-                customer = stripe.Customer.create(
+                customer = gateway.create_customer(
                     email=request.user.email,
                     name=request.user.get_full_name(),
                     metadata={
@@ -289,31 +277,73 @@ class AddPaymentMethodView(LoginRequiredMixin, View):
                 stripe_customer.save()
             
             # Attach payment method to customer
-            stripe.PaymentMethod.attach(
+            gateway.attach_payment_method(
                 payment_method_id,
                 customer=stripe_customer.stripe_customer_id
             )
             
-            # Determine if this should be the default
-            existing_methods_count = PaymentMethod.objects.filter(user=request.user, is_active=True).count()
-            is_default = set_as_default or existing_methods_count == 0
+            save_payment_method(request.user, payment_method_id, pm, set_as_default)
             
-            # If setting as default, remove default from other methods
-            if is_default:
-                PaymentMethod.objects.filter(user=request.user, is_active=True).update(is_default=False)
+            return JsonResponse({
+                'success': True,
+                'message': 'Payment method added successfully'
+            })
             
-            # Save payment method
-            payment_method = PaymentMethod.objects.create(
-                user=request.user,
-                stripe_payment_method_id=payment_method_id,
-                method_type='card',  # Assuming card for now
-                card_brand=pm.card.brand if pm.card else '',
-                card_last4=pm.card.last4 if pm.card else '',
-                card_exp_month=pm.card.exp_month if pm.card else None,
-                card_exp_year=pm.card.exp_year if pm.card else None,
-                is_default=is_default
+        except Exception as e:
+            return JsonResponse({'error': str(e)}, status=400)
+
+
+def save_payment_method(user, payment_method_id, pm, set_as_default):
+    """Store an attached Stripe payment method, defaulting the user's first one"""
+    # Determine if this should be the default
+    existing_methods_count = PaymentMethod.objects.filter(user=user, is_active=True).count()
+    is_default = set_as_default or existing_methods_count == 0
+    
+    # If setting as default, remove default from other methods
+    if is_default:
+        PaymentMethod.objects.filter(user=user, is_active=True).update(is_default=False)
+    
+    # Save payment method
+    return PaymentMethod.objects.create(
+        user=user,
+        stripe_payment_method_id=payment_method_id,
+        method_type='card',  # Assuming card for now
+        card_brand=pm.card.brand if pm.card else '',
+        card_last4=pm.card.last4 if pm.card else '',
+        card_exp_month=pm.card.exp_month if pm.card else None,
+        card_exp_year=pm.card.exp_year if pm.card else None,
+        is_default=is_default
+    )
+
+
+class AsyncAddPaymentMethodView(aio.LoginRequiredMixin, View):
+    """
+    AddPaymentMethodView for ASGI deployments (ASYNC_VIEWS): the payment
+    method lookup runs while the Stripe customer is found or created
+    """
+    
+    async def post(self, request):
+        try:
+            data = json.loads(request.body)
+            payment_method_id = data.get('payment_method_id')
+            set_as_default = data.get('set_as_default', False)
+            
+            if not payment_method_id:
+                return JsonResponse({'error': 'Payment method ID required'}, status=400)
+            
+            pm, stripe_customer = await asyncio.gather(
+                gateway.retrieve_payment_method_async(payment_method_id),
+                self.ensure_customer(request.user),
+            )
+            
+            # Attach payment method to customer
+            await gateway.attach_payment_method_async(
+                payment_method_id,
+                customer=stripe_customer.stripe_customer_id
             )
             
+            await sync_to_async(save_payment_method)(request.user, payment_method_id, pm, set_as_default)
+            
             return JsonResponse({
                 'success': True,
                 'message': 'Payment method added successfully'
@@ -321,6 +351,27 @@ class AddPaymentMethodView(LoginRequiredMixin, View):
             
         except Exception as e:
             return JsonResponse({'error': str(e)}, status=400)
+    
+    async def ensure_customer(self, user):
+        stripe_customer, created = await StripeCustomer.objects.aget_or_create(
+            user=user,
+            defaults={
+                'stripe_customer_id': ''  # Will be set below
+            }
+        )
+        
+        if created or not stripe_customer.stripe_customer_id:
+            customer = await gateway.create_customer_async(
+                email=user.email,
+                name=user.get_full_name(),
+                metadata={
+                    'user_id': str(user.id)
+                }
+            )
+            stripe_customer.stripe_customer_id = customer.id
+            await stripe_customer.asave()
+        
+        return stripe_customer
 
 
 class DeletePaymentMethodView(LoginRequiredMixin, View):
@@ -334,7 +385,7 @@ class DeletePaymentMethodView(LoginRequiredMixin, View):
             )
             
             # Detach from Stripe
-            stripe.PaymentMethod.detach(payment_method.stripe_payment_method_id)
+            gateway.detach_payment_method(payment_method.stripe_payment_method_id)
             
             # Mark as inactive
             payment_method.is_active = False
@@ -375,123 +426,165 @@ class SetDefaultPaymentMethodView(LoginRequiredMixin, View):
             return JsonResponse({'error': str(e)}, status=400)
 
 
+class SavedPaymentError(Exception):
+    """A saved-card payment that can't be attempted; the message is returned to the client"""
+
+
+def saved_payment_method_id(request):
+    # Parse request data
+    try:
+        data = json.loads(request.body.decode('utf-8')) if request.body else {}
+    except (json.JSONDecodeError, UnicodeDecodeError) as e:
+        raise SavedPaymentError('Invalid JSON data')
+    
+    payment_method_id = data.get('payment_method_id')
+    
+    if not payment_method_id:
+        raise SavedPaymentError('Payment method ID is required')
+    
+    # Convert to integer if it's a string
+    try:
+        return int(payment_method_id)
+    except (ValueError, TypeError):
+        raise SavedPaymentError('Invalid payment method ID format')
+
+
+def load_saved_payment(request, payment_method_id):
+    """(order, payment_method, stripe_customer) for a saved-card payment"""
+    # Get order from session
+    order_id = request.session.get('order_id')
+    if not order_id:
+        # Check if we can get it from the user's most recent pending order
+        try:
+            order = Order.objects.filter(
+                user=request.user,
+                status__in=['pending', 'processing']
+            ).latest('created_at')
+            # Store in session for future use
+            request.session['order_id'] = order.id
+            order_id = order.id
+        except Order.DoesNotExist:
+            raise SavedPaymentError('No order found. Please complete checkout first.')
+    
+    try:
+        order = Order.objects.get(id=order_id, user=request.user)
+    except Order.DoesNotExist:
+        raise SavedPaymentError('Order not found or access denied')
+    
+    # Get the saved payment method
+    try:
+        payment_method = PaymentMethod.objects.get(
+            id=payment_method_id,
+            user=request.user,
+            is_active=True
+        )
+    except PaymentMethod.DoesNotExist:
+        raise SavedPaymentError('Payment method not found or access denied')
+    
+    # Get Stripe customer
+    try:
+        stripe_customer = StripeCustomer.objects.get(user=request.user)
+    except StripeCustomer.DoesNotExist:
+        raise SavedPaymentError('Stripe customer not found. Please add a payment method first.')
+    
+    return order, payment_method, stripe_customer
+
+
+def saved_payment_intent_params(request, order, payment_method, stripe_customer):
+    return {
+        'amount': int(order.total * 100),  # Convert to cents
+        'currency': 'usd',
+        'customer': stripe_customer.stripe_customer_id,
+        'payment_method': payment_method.stripe_payment_method_id,
+        'confirmation_method': 'manual',
+        'confirm': True,
+        'return_url': request.build_absolute_uri(reverse('orders:success')),
+        'metadata': {
+            'order_id': str(order.id),
+            'user_id': str(request.user.id),
+        },
+        'expand': ['latest_charge'],  # Expand the latest charge to get charge details
+    }
+
+
+def saved_payment_response(request, order, payment_method, intent):
+    """Record a saved-card PaymentIntent and build the view's response"""
+    # Create Payment record
+    payment = Payment.objects.create(
+        order=order,
+        user=request.user,
+        amount=order.total,
+        stripe_payment_intent_id=intent.id,
+        payment_method='stripe_card',  # Use existing choice instead of 'stripe_saved_card'
+        stripe_payment_method_id=payment_method.stripe_payment_method_id,
+        description=f'Payment for order {order.order_number} (saved card ending in {payment_method.card_last4})'
+    )
+    
+    # Handle the payment intent status
+    if intent.status == 'succeeded':
+        # Use latest_charge since we expanded it in the PaymentIntent creation
+        record_payment_succeeded(payment, gateway.charge_id(intent))
+        return JsonResponse({
+            'success': True,
+            'redirect_url': reverse('orders:success')
+        })
+    elif intent.status == 'requires_action':
+        return JsonResponse({
+            'requires_action': True,
+            'payment_intent_client_secret': intent.client_secret
+        })
+    
+    record_payment_failed(payment, intent, 'Payment failed')
+    return JsonResponse({
+        'success': False,
+        'error': intent.last_payment_error.message if intent.last_payment_error else 'Payment failed'
+    })
+
+
 class ProcessSavedPaymentMethodView(LoginRequiredMixin, View):
     def post(self, request):
         try:
-            # Parse request data
-            try:
-                data = json.loads(request.body.decode('utf-8')) if request.body else {}
-            except (json.JSONDecodeError, UnicodeDecodeError) as e:
-                return JsonResponse({'error': 'Invalid JSON data'}, status=400)
-            
-            payment_method_id = data.get('payment_method_id')
+            payment_method_id = saved_payment_method_id(request)
+            order, payment_method, stripe_customer = load_saved_payment(request, payment_method_id)
             
-            if not payment_method_id:
-                return JsonResponse({'error': 'Payment method ID is required'}, status=400)
-            
-            # Convert to integer if it's a string
-            try:
-                payment_method_id = int(payment_method_id)
-            except (ValueError, TypeError):
-                return JsonResponse({'error': 'Invalid payment method ID format'}, status=400)
-            
-            
-            # Get order from session
-            order_id = request.session.get('order_id')
-            if not order_id:
-                # Check if we can get it from the user's most recent pending order
-                try:
-                    order = Order.objects.filter(
-                        user=request.user,
-                        status__in=['pending', 'processing']
-                    ).latest('created_at')
-                    # Store in session for future use
-                    request.session['order_id'] = order.id
-                    order_id = order.id
-                except Order.DoesNotExist:
-                    return JsonResponse({'error': 'No order found. Please complete checkout first.'}, status=400)
-            
-            try:
-                order = Order.objects.get(id=order_id, user=request.user)
-            except Order.DoesNotExist:
-                return JsonResponse({'error': 'Order not found or access denied'}, status=400)
-            
-            # Get the saved payment method
             try:
-                payment_method = PaymentMethod.objects.get(
-                    id=payment_method_id,
-                    user=request.user,
-                    is_active=True
+                intent = gateway.create_payment_intent(
+                    **saved_payment_intent_params(request, order, payment_method, stripe_customer)
                 )
-            except PaymentMethod.DoesNotExist:
-                available_methods = PaymentMethod.objects.filter(user=request.user, is_active=True)
-                return JsonResponse({'error': 'Payment method not found or access denied'}, status=400)
+            except stripe.error.StripeError as e:
+                return JsonResponse({'error': f'Stripe error: {str(e)}'}, status=400)
             
-            # Get Stripe customer
-            try:
-                stripe_customer = StripeCustomer.objects.get(user=request.user)
-            except StripeCustomer.DoesNotExist:
-                return JsonResponse({'error': 'Stripe customer not found. Please add a payment method first.'}, status=400)
+            return saved_payment_response(request, order, payment_method, intent)
+                
+        except SavedPaymentError as e:
+            return JsonResponse({'error': str(e)}, status=400)
+        except stripe.error.CardError as e:
+            return JsonResponse({'error': e.user_message}, status=400)
+        except Exception as e:
+            return JsonResponse({'error': str(e)}, status=400)
+
+
+class AsyncProcessSavedPaymentMethodView(aio.LoginRequiredMixin, View):
+    """ProcessSavedPaymentMethodView for ASGI deployments (ASYNC_VIEWS)"""
+    
+    async def post(self, request):
+        try:
+            payment_method_id = saved_payment_method_id(request)
+            order, payment_method, stripe_customer = await sync_to_async(load_saved_payment)(
+                request, payment_method_id
+            )
             
             try:
-                intent = stripe.PaymentIntent.create(
-                    amount=int(order.total * 100),  # Convert to cents
-                    currency='usd',
-                    customer=stripe_customer.stripe_customer_id,
-                    payment_method=payment_method.stripe_payment_method_id,
-                    confirmation_method='manual',
-                    confirm=True,
-                    return_url=request.build_absolute_uri(reverse('orders:success')),
-                    metadata={
-                        'order_id': str(order.id),
-                        'user_id': str(request.user.id),
-                    },
-                    expand=['latest_charge']  # Expand the latest charge to get charge details
+                intent = await gateway.create_payment_intent_async(
+                    **saved_payment_intent_params(request, order, payment_method, stripe_customer)
                 )
             except stripe.error.StripeError as e:
                 return JsonResponse({'error': f'Stripe error: {str(e)}'}, status=400)
             
-            # Create Payment record
-            payment = Payment.objects.create(
-                order=order,
-                user=request.user,
-                amount=order.total,
-                stripe_payment_intent_id=intent.id,
-                payment_method='stripe_card',  # Use existing choice instead of 'stripe_saved_card'
-                stripe_payment_method_id=payment_method.stripe_payment_method_id,
-                description=f'Payment for order {order.order_number} (saved card ending in {payment_method.card_last4})'
-            )
-            
-            # Handle the payment intent status
-            if intent.status == 'succeeded':
-                payment.status = 'succeeded'
-                # Use latest_charge since we expanded it in the PaymentIntent creation
-                payment.stripe_charge_id = intent.latest_charge.id if intent.latest_charge else ''
-                payment.save()
-                
-                # Update order status
-                order.status = 'confirmed'
-                order.save()
-                
-                return JsonResponse({
-                    'success': True,
-                    'redirect_url': reverse('orders:success')
-                })
-            elif intent.status == 'requires_action':
-                return JsonResponse({
-                    'requires_action': True,
-                    'payment_intent_client_secret': intent.client_secret
-                })
-            else:
-                payment.status = 'failed'
-                payment.failure_reason = intent.last_payment_error.message if intent.last_payment_error else 'Payment failed'
-                payment.save()
-                
-                return JsonResponse({
-                    'success': False,
-                    'error': intent.last_payment_error.message if intent.last_payment_error else 'Payment failed'
-                })
+            return await sync_to_async(saved_payment_response)(request, order, payment_method, intent)
                 
+        except SavedPaymentError as e:
+            return JsonResponse({'error': str(e)}, status=400)
         except stripe.error.CardError as e:
             return JsonResponse({'error': e.user_message}, status=400)
         except Exception as e:
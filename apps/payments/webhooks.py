@@ -0,0 +1,233 @@
+"""
+Stripe webhook ingestion and background processing.
+
+The webhook view only verifies, dedupes and persists events. Processing
+happens here, driven either by the Celery task in ``apps.payments.tasks``
+or by the ``process_webhook_events`` polling command.
+"""
+
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from apps.orders import state_machine, status_events
+from utils import metrics
+from .models import Payment, PaymentWebhookEvent
+
+logger = logging.getLogger(__name__)
+
+DEDUPE_KEY_PREFIX = 'stripe:webhook:seen:'
+DEDUPE_COUNTER_KEY = 'stripe:webhook:duplicates_short_circuited'
+
+WEBHOOK_DUPLICATES = metrics.counter(
+    'stripe_webhook_duplicates_total',
+    'Duplicate webhook deliveries rejected by the Redis fast path',
+)
+
+
+def event_seen(event_id):
+    """
+    Redis fast path for duplicate deliveries.
+
+    True when the event was already stored (mark_event_seen_on_commit), so
+    retry storms are rejected before touching Postgres. The unique constraint on
+    PaymentWebhookEvent stays the source of truth: if Redis is unavailable
+    this fails open and the DB dedupes as before.
+    """
+    try:
+        return cache.get(DEDUPE_KEY_PREFIX + event_id) is not None
+    except Exception as e:
+        logger.warning("Webhook dedupe cache unavailable: %s", e)
+        return False
+
+
+def mark_event_seen_on_commit(event_id):
+    """
+    Set the fast-path marker once the stored event commits. Set any earlier
+    and a crash before the commit would have Stripe's retries acknowledged
+    and dropped for the whole TTL.
+    """
+    def mark():
+        try:
+            cache.set(DEDUPE_KEY_PREFIX + event_id, 1, timeout=settings.STRIPE_WEBHOOK_DEDUPE_TTL)
+        except Exception as e:
+            logger.warning("Webhook dedupe cache unavailable: %s", e)
+
+    transaction.on_commit(mark)
+
+
+def record_duplicate_short_circuit():
+    """Count a duplicate delivery rejected by the fast path"""
+    WEBHOOK_DUPLICATES.inc()
+    try:
+        try:
+            cache.incr(DEDUPE_COUNTER_KEY)
+        except ValueError:
+            # First duplicate since the counter was reset
+            if not cache.add(DEDUPE_COUNTER_KEY, 1, timeout=None):
+                cache.incr(DEDUPE_COUNTER_KEY)
+    except Exception as e:
+        logger.warning("Webhook dedupe cache unavailable: %s", e)
+
+
+def duplicate_short_circuit_count():
+    """Number of duplicate deliveries rejected without a DB round trip"""
+    try:
+        return cache.get(DEDUPE_COUNTER_KEY, 0)
+    except Exception:
+        return 0
+
+
+def ingest_event(event):
+    """Persist a verified Stripe event, returning (webhook_event, created)"""
+    return PaymentWebhookEvent.objects.get_or_create(
+        stripe_event_id=event['id'],
+        defaults={
+            'event_type': event['type'],
+            'data': event['data'],
+            'next_attempt_at': timezone.now(),
+        }
+    )
+
+
+def enqueue_processing():
+    """Ask the worker pool to drain pending events once the current transaction commits"""
+    if not settings.CELERY_BROKER_URL:
+        # No broker configured: the process_webhook_events poller picks events up
+        return
+
+    def _send():
+        from .tasks import process_webhook_events
+        try:
+            process_webhook_events.delay()
+        except Exception as e:
+            # The event is already persisted, so the poller/beat schedule will retry it
+            logger.warning("Could not enqueue webhook processing: %s", e)
+
+    transaction.on_commit(_send)
+
+
+def retry_delay(attempts):
+    """Exponential backoff for the given number of failed attempts"""
+    delay = settings.STRIPE_WEBHOOK_RETRY_BASE_SECONDS * (2 ** max(attempts - 1, 0))
+    return timedelta(seconds=min(delay, settings.STRIPE_WEBHOOK_RETRY_MAX_SECONDS))
+
+
+def pending_events():
+    """Events that are due for (re)processing"""
+    return PaymentWebhookEvent.objects.filter(
+        Q(next_attempt_at__isnull=True) | Q(next_attempt_at__lte=timezone.now()),
+        processed=False,
+        attempts__lt=settings.STRIPE_WEBHOOK_MAX_ATTEMPTS,
+    )
+
+
+def process_pending_events(batch_size=None):
+    """
+    Claim one batch of pending events and process it.
+
+    Rows are locked with SELECT ... FOR UPDATE SKIP LOCKED so several workers
+    can drain the queue concurrently without picking the same events.
+    Returns the number of events claimed.
+    """
+    batch_size = batch_size or settings.STRIPE_WEBHOOK_BATCH_SIZE
+
+    with transaction.atomic():
+        events = list(
+            pending_events()
+            .select_for_update(skip_locked=True)
+            .order_by('created_at')[:batch_size]
+        )
+
+        for webhook_event in events:
+            process_event(webhook_event)
+
+        PaymentWebhookEvent.objects.bulk_update(
+            events,
+            ['processed', 'processed_at', 'processing_error', 'attempts', 'next_attempt_at', 'payment'],
+        )
+
+    return len(events)
+
+
+def process_event(webhook_event):
+    """Process a single event, recording the outcome on the instance (caller saves)"""
+    webhook_event.attempts += 1
+
+    try:
+        # Savepoint so a failing handler does not poison the rest of the batch
+        with transaction.atomic():
+            handler = EVENT_HANDLERS.get(webhook_event.event_type)
+            if handler:
+                handler(webhook_event)
+    except Exception as e:
+        logger.exception("Failed to process webhook event %s", webhook_event.stripe_event_id)
+        webhook_event.processing_error = str(e)
+        webhook_event.next_attempt_at = timezone.now() + retry_delay(webhook_event.attempts)
+        return False
+
+    webhook_event.processed = True
+    webhook_event.processed_at = timezone.now()
+    webhook_event.processing_error = ''
+    webhook_event.next_attempt_at = None
+    return True
+
+
+def _get_payment(webhook_event):
+    payment_intent = webhook_event.data['object']
+    payment = Payment.objects.select_related('order').filter(
+        stripe_payment_intent_id=payment_intent['id']
+    ).first()
+    if payment:
+        webhook_event.payment = payment
+    return payment
+
+
+def handle_payment_succeeded(webhook_event):
+    """Handle successful payment"""
+    payment = _get_payment(webhook_event)
+    if not payment:
+        return
+
+    payment.status = 'succeeded'
+    payment.save()
+
+    # A late or duplicate event leaves an order that has moved on alone
+    if not state_machine.mark_paid(payment.order, notes=f'Payment succeeded ({webhook_event.stripe_event_id})'):
+        status_events.publish_on_commit([payment.order_id])
+
+
+def handle_payment_failed(webhook_event):
+    """Handle failed payment"""
+    payment = _get_payment(webhook_event)
+    if not payment:
+        return
+
+    payment_intent = webhook_event.data['object']
+    payment.status = 'failed'
+    payment.failure_reason = (payment_intent.get('last_payment_error') or {}).get('message', 'Payment failed')
+    payment.save()
+    status_events.publish_on_commit([payment.order_id])
+
+
+def handle_payment_canceled(webhook_event):
+    """Handle canceled payment"""
+    payment = _get_payment(webhook_event)
+    if not payment:
+        return
+
+    payment.status = 'cancelled'
+    payment.save()
+    status_events.publish_on_commit([payment.order_id])
+
+
+EVENT_HANDLERS = {
+    'payment_intent.succeeded': handle_payment_succeeded,
+    'payment_intent.payment_failed': handle_payment_failed,
+    'payment_intent.canceled': handle_payment_canceled,
+}
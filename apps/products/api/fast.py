@@ -0,0 +1,200 @@
+"""
+Read-only fast path for product listings.
+
+FastProductSerializer produces exactly what ProductSerializer does for the
+same products, but from .values() rows instead of model instances and
+nested serializers:
+
+- one query for the products (category and stats joined in)
+- one query for all their images
+- one aggregate query for all their ratings
+
+instead of two rating queries per product, and with the per-field work
+reduced to unpacking plain tuples in a fixed column order. Pair it with
+utils.renderers.ORJSONRenderer for the encoding side.
+
+?fields= and ?expand= are resolved by ProductSerializer itself, so both
+paths accept and reject the same selections; images and ratings are only
+queried when selected.
+"""
+
+from django.db.models import Avg, Count
+from django.utils import timezone
+from rest_framework import serializers
+
+from utils.serializers import Selection
+from ..models import Category, Product, ProductImage, Review
+from .serializers import ProductSerializer
+
+PRODUCT_COLUMNS = (
+    'id', 'name', 'slug', 'description', 'short_description',
+    'price', 'compare_price', 'sku', 'track_inventory', 'inventory_quantity', 'allow_backorder',
+    'created_at', 'updated_at',
+    'category_id', 'category__name', 'category__slug', 'category__description', 'category__image',
+    'stats__view_count', 'stats__viewers_today', 'stats__stats_date',
+)
+IMAGE_COLUMNS = ('product_id', 'id', 'image', 'alt_text', 'is_primary')
+
+
+def decimal_string(value):
+    """DRF DecimalField representation (coerced to string)"""
+    return None if value is None else '{:f}'.format(value)
+
+
+def datetime_string(value):
+    """DRF DateTimeField representation (ISO 8601, Z for UTC)"""
+    if value is None:
+        return None
+    value = timezone.localtime(value).isoformat()
+    if value.endswith('+00:00'):
+        value = value[:-6] + 'Z'
+    return value
+
+
+def is_on_sale(price, compare_price):
+    # Mirrors Product.is_on_sale, including its falsy passthrough
+    return compare_price and compare_price > price
+
+
+def discount_percentage(price, compare_price):
+    if is_on_sale(price, compare_price):
+        return int(((compare_price - price) / compare_price) * 100)
+    return 0
+
+
+def in_stock(track_inventory, inventory_quantity, allow_backorder):
+    if not track_inventory:
+        return True
+    return inventory_quantity > 0 or allow_backorder
+
+
+class FastProductSerializer:
+    """
+    Serializes products given as ids (in the order given). ``request``
+    makes image URLs absolute, as ProductSerializer does with a request in
+    its context, and supplies the field selection unless ``selection`` is
+    given.
+    """
+
+    def __init__(self, request=None, selection=None):
+        self.request = request
+        if selection is None:
+            selection = Selection.from_request(request)
+        self.fields = None if selection.is_default else self._shape(ProductSerializer(selection=selection).fields)
+        self.product_image_url = self._url_builder(ProductImage._meta.get_field('image').storage)
+        self.category_image_url = self._url_builder(Category._meta.get_field('image').storage)
+        self.today = timezone.localdate()
+
+    def _url_builder(self, storage):
+        request = self.request
+
+        def url(name):
+            if not name:
+                return None
+            url = storage.url(name)
+            return request.build_absolute_uri(url) if request is not None else url
+
+        return url
+
+    @staticmethod
+    def _shape(fields):
+        """[(name, how to cut the full value down to the selection)] for the selected fields"""
+        shape = []
+        for name, field in fields.items():
+            if isinstance(field, serializers.ManyRelatedField):
+                shape.append((name, lambda images: [image['id'] for image in images]))
+            elif isinstance(field, serializers.RelatedField):
+                shape.append((name, lambda value: value['id']))
+            elif isinstance(field, serializers.ListSerializer):
+                keys = list(field.child.fields)
+                shape.append((name, lambda items, keys=keys: [{key: item[key] for key in keys} for item in items]))
+            elif isinstance(field, serializers.BaseSerializer):
+                keys = list(field.fields)
+                shape.append((name, lambda value, keys=keys: {key: value[key] for key in keys}))
+            else:
+                shape.append((name, None))
+        return shape
+
+    def selects(self, *names):
+        return self.fields is None or any(name == selected for name in names for selected, _ in self.fields)
+
+    def serialize(self, ids, queryset=None):
+        """Products with these ids, in this order; ids missing from ``queryset`` are skipped"""
+        ids = list(ids)
+        if not ids:
+            return []
+        queryset = Product.objects.all() if queryset is None else queryset
+        rows = {
+            row[0]: row
+            for row in queryset.filter(id__in=ids).values_list(*PRODUCT_COLUMNS)
+        }
+        images = self.images(ids) if self.selects('images') else {}
+        ratings = self.ratings(ids) if self.selects('average_rating', 'review_count') else {}
+        products = [
+            self.product(rows[product_id], images.get(product_id, []), ratings.get(product_id))
+            for product_id in ids if product_id in rows
+        ]
+        if self.fields is None:
+            return products
+        return [
+            {name: cut(product[name]) if cut else product[name] for name, cut in self.fields}
+            for product in products
+        ]
+
+    def images(self, ids):
+        images = {}
+        image_url = self.product_image_url
+        for product_id, image_id, name, alt_text, is_primary in (
+            ProductImage.objects.filter(product_id__in=ids).values_list(*IMAGE_COLUMNS)
+        ):
+            images.setdefault(product_id, []).append({
+                'id': image_id,
+                'image': image_url(name),
+                'alt_text': alt_text,
+                'is_primary': is_primary,
+            })
+        return images
+
+    def ratings(self, ids):
+        return {
+            row['product_id']: (row['average'], row['count'])
+            for row in Review.objects.filter(product_id__in=ids, is_approved=True)
+            .values('product_id').annotate(average=Avg('rating'), count=Count('id')).order_by()
+        }
+
+    def product(self, row, images, rating):
+        (
+            product_id, name, slug, description, short_description,
+            price, compare_price, sku, track_inventory, inventory_quantity, allow_backorder,
+            created_at, updated_at,
+            category_id, category_name, category_slug, category_description, category_image,
+            view_count, viewers_today, stats_date,
+        ) = row
+        has_stats = view_count is not None
+        return {
+            'id': product_id,
+            'name': name,
+            'slug': slug,
+            'category': {
+                'id': category_id,
+                'name': category_name,
+                'slug': category_slug,
+                'description': category_description,
+                'image': self.category_image_url(category_image),
+            },
+            'description': description,
+            'short_description': short_description,
+            'price': decimal_string(price),
+            'compare_price': decimal_string(compare_price),
+            'sku': sku,
+            'in_stock': in_stock(track_inventory, inventory_quantity, allow_backorder),
+            'is_on_sale': is_on_sale(price, compare_price),
+            'discount_percentage': discount_percentage(price, compare_price),
+            'images': images,
+            'average_rating': rating[0] if rating else 0,
+            'review_count': rating[1] if rating else 0,
+            'view_count': view_count if has_stats else 0,
+            'viewers_today': viewers_today if has_stats and stats_date == self.today else 0,
+            'created_at': datetime_string(created_at),
+            'updated_at': datetime_string(updated_at),
+        }
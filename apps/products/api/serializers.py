@@ -1,24 +1,28 @@
+from django.db import models
 from rest_framework import serializers
+from utils.serializers import DynamicFieldsMixin
 from ..models import Product, Category, ProductImage, Review
 
 
-class ProductImageSerializer(serializers.ModelSerializer):
+class ProductImageSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = ProductImage
         fields = ['id', 'image', 'alt_text', 'is_primary']
 
 
-class CategorySerializer(serializers.ModelSerializer):
+class CategorySerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Category
         fields = ['id', 'name', 'slug', 'description', 'image']
 
 
-class ProductSerializer(serializers.ModelSerializer):
+class ProductSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     category = CategorySerializer(read_only=True)
     images = ProductImageSerializer(many=True, read_only=True)
     average_rating = serializers.SerializerMethodField()
     review_count = serializers.SerializerMethodField()
+    view_count = serializers.SerializerMethodField()
+    viewers_today = serializers.SerializerMethodField()
     
     class Meta:
         model = Product
@@ -26,8 +30,17 @@ class ProductSerializer(serializers.ModelSerializer):
             'id', 'name', 'slug', 'category', 'description', 'short_description',
             'price', 'compare_price', 'sku', 'in_stock', 'is_on_sale', 
             'discount_percentage', 'images', 'average_rating', 'review_count',
-            'created_at', 'updated_at'
+            'view_count', 'viewers_today', 'created_at', 'updated_at'
         ]
+        expandable = ['category', 'images']
+        default_expand = ['category', 'images']
+        field_dependencies = {
+            'in_stock': ['track_inventory', 'inventory_quantity', 'allow_backorder'],
+            'is_on_sale': ['price', 'compare_price'],
+            'discount_percentage': ['price', 'compare_price'],
+            'view_count': ['stats__view_count'],
+            'viewers_today': ['stats__viewers_today', 'stats__stats_date'],
+        }
     
     def get_average_rating(self, obj):
         reviews = obj.reviews.filter(is_approved=True)
@@ -37,6 +50,15 @@ class ProductSerializer(serializers.ModelSerializer):
     
     def get_review_count(self, obj):
         return obj.reviews.filter(is_approved=True).count()
+    
+    # Counters come from the select_related('stats') row; never-viewed products have none
+    def get_view_count(self, obj):
+        stats = getattr(obj, 'stats', None)
+        return stats.view_count if stats else 0
+    
+    def get_viewers_today(self, obj):
+        stats = getattr(obj, 'stats', None)
+        return stats.today_viewers if stats else 0
 
 
 class ProductDetailSerializer(ProductSerializer):
@@ -50,7 +72,7 @@ class ProductDetailSerializer(ProductSerializer):
         return ReviewSerializer(reviews, many=True).data
 
 
-class ReviewSerializer(serializers.ModelSerializer):
+class ReviewSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     user_name = serializers.CharField(source='user.get_full_name', read_only=True)
     
     class Meta:
@@ -1,32 +1,81 @@
-from rest_framework import viewsets, filters
+from rest_framework import viewsets, filters, serializers
 from rest_framework.decorators import action
+from rest_framework.renderers import BrowsableAPIRenderer
 from rest_framework.response import Response
 from django_filters.rest_framework import DjangoFilterBackend
-from django.db.models import Q
+from django.conf import settings
+from django.db.models import Q, QuerySet
+from utils.renderers import MessagePackRenderer, ORJSONRenderer
+from utils.serializers import DynamicFieldsViewMixin, Selection, optimize_queryset
 from ..models import Product, Category
 from .serializers import ProductSerializer, ProductDetailSerializer, CategorySerializer
+from .. import leaderboards
+from ..caching import featured_products
+from .fast import FastProductSerializer
 
 
-class ProductViewSet(viewsets.ReadOnlyModelViewSet):
-    queryset = Product.objects.filter(is_active=True).select_related('category').prefetch_related('images')
+class ProductViewSet(DynamicFieldsViewMixin, viewsets.ReadOnlyModelViewSet):
+    queryset = Product.objects.filter(is_active=True).select_related('category', 'stats').prefetch_related('images')
     serializer_class = ProductSerializer
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
     filterset_fields = ['category', 'is_featured']
     search_fields = ['name', 'description', 'category__name']
     ordering_fields = ['name', 'price', 'created_at']
     ordering = ['name']
+    renderer_classes = [ORJSONRenderer, BrowsableAPIRenderer, MessagePackRenderer]
     
     def get_serializer_class(self):
         if self.action == 'retrieve':
             return ProductDetailSerializer
         return ProductSerializer
     
+    def filter_queryset(self, queryset):
+        # ?ordering=popular / ?ordering=trending rank by the sales leaderboards
+        sort = self.request.query_params.get('ordering')
+        if self.action != 'list' or sort not in leaderboards.SORTS:
+            return super().filter_queryset(queryset)
+        params = self.request.query_params
+        filtered = any(params.get(name) for name in [*self.filterset_fields, 'search'])
+        queryset = DjangoFilterBackend().filter_queryset(self.request, queryset, self)
+        queryset = filters.SearchFilter().filter_queryset(self.request, queryset, self)
+        return leaderboards.sort_products(queryset, sort, filtered)
+    
+    def list(self, request, *args, **kwargs):
+        if 'ids' in request.query_params:
+            return self.multi_get(request.query_params['ids'])
+        
+        # Listings skip ProductSerializer: only ids are paged, then serialized in bulk
+        products = self.filter_queryset(self.get_queryset())
+        if isinstance(products, QuerySet):
+            products = products.values_list('id', flat=True)
+        
+        page = self.paginate_queryset(products)
+        if page is not None:
+            return self.get_paginated_response(self.fast_data(page))
+        
+        return Response(self.fast_data(products))
+    
+    def multi_get(self, ids):
+        """?ids=3,1,2: those products in that order, unpaginated; unknown or inactive ids are left out"""
+        try:
+            ids = list(dict.fromkeys(int(product_id) for product_id in ids.split(',') if product_id.strip()))
+        except ValueError:
+            raise serializers.ValidationError({'ids': 'Expected a comma-separated list of product ids.'})
+        if len(ids) > settings.API_MULTI_GET_MAX_IDS:
+            raise serializers.ValidationError({'ids': f'At most {settings.API_MULTI_GET_MAX_IDS} ids per request.'})
+        data = FastProductSerializer(self.request).serialize(ids, queryset=Product.objects.filter(is_active=True))
+        return Response(data)
+    
+    def fast_data(self, products):
+        # Leaderboard orderings page through products rather than ids
+        ids = [product if isinstance(product, int) else product.id for product in products]
+        return FastProductSerializer(self.request).serialize(ids)
+    
     @action(detail=False, methods=['get'])
     def featured(self, request):
         """Get featured products"""
-        featured_products = self.get_queryset().filter(is_featured=True)[:8]
-        serializer = self.get_serializer(featured_products, many=True)
-        return Response(serializer.data)
+        ids = [product.id for product in featured_products()]
+        return Response(FastProductSerializer(request).serialize(ids))
     
     @action(detail=False, methods=['get'])
     def search(self, request):
@@ -55,6 +104,7 @@ class ProductViewSet(viewsets.ReadOnlyModelViewSet):
         if category:
             queryset = queryset.filter(category__slug=category)
         
+        queryset = optimize_queryset(queryset, self.get_serializer())
         page = self.paginate_queryset(queryset)
         if page is not None:
             serializer = self.get_serializer(page, many=True)
@@ -64,23 +114,24 @@ class ProductViewSet(viewsets.ReadOnlyModelViewSet):
         return Response(serializer.data)
 
 
-class CategoryViewSet(viewsets.ReadOnlyModelViewSet):
+class CategoryViewSet(DynamicFieldsViewMixin, viewsets.ReadOnlyModelViewSet):
     queryset = Category.objects.filter(is_active=True)
     serializer_class = CategorySerializer
+    renderer_classes = [ORJSONRenderer, BrowsableAPIRenderer, MessagePackRenderer]
     
     @action(detail=True, methods=['get'])
     def products(self, request, pk=None):
         """Get products in a category"""
         category = self.get_object()
-        products = Product.objects.filter(
+        ids = Product.objects.filter(
             category=category,
             is_active=True
-        ).select_related('category').prefetch_related('images')
+        ).values_list('id', flat=True)
         
-        page = self.paginate_queryset(products)
+        # No request: image URLs stay relative, as they always have here
+        serializer = FastProductSerializer(selection=Selection.from_request(request))
+        page = self.paginate_queryset(ids)
         if page is not None:
-            serializer = ProductSerializer(page, many=True)
-            return self.get_paginated_response(serializer.data)
+            return self.get_paginated_response(serializer.serialize(page))
         
-        serializer = ProductSerializer(products, many=True)
-        return Response(serializer.data)
\ No newline at end of file
+        return Response(serializer.serialize(ids))
\ No newline at end of file
@@ -3,4 +3,8 @@ from django.apps import AppConfig
 
 class ProductsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
-    name = 'apps.products'
\ No newline at end of file
+    name = 'apps.products'
+
+    def ready(self):
+        from .caching import connect_invalidation
+        connect_invalidation()
\ No newline at end of file
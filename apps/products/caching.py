@@ -0,0 +1,37 @@
+"""
+Catalogue lookups that every storefront page needs, served from the
+two-tier cache (utils/cache.py) and invalidated when the rows change.
+"""
+
+from django.conf import settings
+
+from utils.cache import invalidate_on_change, tiered_cache
+
+from .models import Category, Product, ProductImage
+
+CATEGORIES_KEY = 'products:categories'
+FEATURED_PRODUCTS_KEY = 'products:featured'
+
+
+def active_categories():
+    return tiered_cache().get_or_set(
+        CATEGORIES_KEY,
+        lambda: list(Category.objects.filter(is_active=True)),
+        ttl=settings.CATALOG_CACHE_TTL,
+    )
+
+
+def featured_products():
+    return tiered_cache().get_or_set(
+        FEATURED_PRODUCTS_KEY,
+        lambda: list(
+            Product.objects.filter(is_active=True, is_featured=True)
+            .select_related('category', 'stats').prefetch_related('images')[:8]
+        ),
+        ttl=settings.CATALOG_CACHE_TTL,
+    )
+
+
+def connect_invalidation():
+    invalidate_on_change([Category], CATEGORIES_KEY, FEATURED_PRODUCTS_KEY)
+    invalidate_on_change([Product, ProductImage], FEATURED_PRODUCTS_KEY)
@@ -0,0 +1,324 @@
+"""
+Time-decayed best-seller and trending leaderboards in Redis sorted sets.
+
+Scores use forward decay: a sale of q units at time t adds
+q * 2 ** ((t - L) / half_life) to the product's score, where L is a
+per-board landmark. Old sales never need rewriting; relative order is the
+same as if every score decayed continuously. compact() periodically
+rescales scores to a fresh landmark before they grow too large, trims the
+boards, and snapshots them into ProductPopularity.
+
+Sales are recorded once per order: every path that confirms an order
+calls record_orders() and a Redis guard key makes repeats no-ops.
+"""
+
+import logging
+import time
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from django_redis import get_redis_connection
+
+from apps.orders.models import OrderItem
+from .models import Product, ProductPopularity
+
+logger = logging.getLogger(__name__)
+
+BESTSELLERS = 'bestsellers'
+TRENDING = 'trending'
+
+# Listing sort option -> (board, ProductPopularity column)
+SORTS = {
+    'popular': (BESTSELLERS, 'bestseller_score'),
+    'trending': (TRENDING, 'trending_score'),
+}
+
+# Rescale once scores have doubled this many times since the landmark
+REBASE_HALF_LIVES = 32
+
+# Members decayed below this are dropped at compaction
+MIN_SCORE = 1e-3
+
+# KEYS: board, landmark. ARGV: now, half-life, member, amount, member, amount...
+RECORD_SCRIPT = """
+local landmark = tonumber(redis.call('GET', KEYS[2]))
+if not landmark then
+    landmark = tonumber(ARGV[1])
+    redis.call('SET', KEYS[2], ARGV[1])
+end
+local weight = math.pow(2, (tonumber(ARGV[1]) - landmark) / tonumber(ARGV[2]))
+for i = 3, #ARGV, 2 do
+    redis.call('ZINCRBY', KEYS[1], tonumber(ARGV[i + 1]) * weight, ARGV[i])
+end
+return landmark
+"""
+
+# KEYS: board, landmark. ARGV: now, half-life, rebase after (seconds), min score, max size
+COMPACT_SCRIPT = """
+local now = tonumber(ARGV[1])
+local landmark = tonumber(redis.call('GET', KEYS[2])) or now
+if now - landmark > tonumber(ARGV[3]) then
+    local factor = math.pow(2, (landmark - now) / tonumber(ARGV[2]))
+    redis.call('ZUNIONSTORE', KEYS[1], 1, KEYS[1], 'WEIGHTS', factor)
+    redis.call('SET', KEYS[2], ARGV[1])
+    landmark = now
+end
+local floor = tonumber(ARGV[4]) * math.pow(2, (now - landmark) / tonumber(ARGV[2]))
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', '(' .. floor)
+redis.call('ZREMRANGEBYRANK', KEYS[1], 0, -tonumber(ARGV[5]) - 1)
+return tostring(landmark)
+"""
+
+
+def half_lives():
+    return {
+        BESTSELLERS: settings.LEADERBOARD_BESTSELLER_HALF_LIFE_DAYS * 86400,
+        TRENDING: settings.LEADERBOARD_TRENDING_HALF_LIFE_HOURS * 3600,
+    }
+
+
+def board_key(board):
+    return f'leaderboard:{board}'
+
+
+def landmark_key(board):
+    return f'leaderboard:{board}:landmark'
+
+
+def redis():
+    return get_redis_connection('default')
+
+
+def record_orders(order_ids):
+    """Add the items of newly confirmed orders to every board (once per order)"""
+    client = redis()
+    guard_ttl = settings.LEADERBOARD_ORDER_GUARD_SECONDS
+    fresh = [
+        order_id for order_id in order_ids
+        if client.set(f'leaderboard:order:{order_id}', 1, nx=True, ex=guard_ttl)
+    ]
+    if not fresh:
+        return 0
+
+    # Outside requests reads go to a replica, which may not have the order yet
+    items = OrderItem.objects.using('default').filter(order_id__in=fresh)
+    quantities = {}
+    for product_id, quantity in items.values_list('product_id', 'quantity'):
+        quantities[product_id] = quantities.get(product_id, 0) + quantity
+    if not quantities:
+        return 0
+
+    args = []
+    for product_id, quantity in quantities.items():
+        args += [product_id, quantity]
+    now = time.time()
+    script = client.register_script(RECORD_SCRIPT)
+    for board, half_life in half_lives().items():
+        script(keys=[board_key(board), landmark_key(board)], args=[now, half_life, *args])
+
+    mark_ranked(list(quantities))
+    return len(fresh)
+
+
+def mark_ranked(product_ids):
+    """
+    Give the products a positive snapshot score on every board until the
+    next compact() writes the real ones. A product is on a board exactly
+    when its snapshot score there is positive, which is how
+    RankedProducts keeps them out of that board's unranked tail.
+    """
+    ProductPopularity.objects.bulk_create(
+        [
+            ProductPopularity(product_id=product_id, bestseller_score=MIN_SCORE, trending_score=MIN_SCORE)
+            for product_id in product_ids
+        ],
+        ignore_conflicts=True,
+    )
+    for column in dict(SORTS.values()).values():
+        ProductPopularity.objects.filter(product_id__in=product_ids, **{f'{column}__lt': MIN_SCORE}).update(
+            **{column: MIN_SCORE}
+        )
+
+
+def record_orders_on_commit(order_ids):
+    """record_orders() once the confirming transaction commits; never raises"""
+    order_ids = list(order_ids)
+
+    def record():
+        try:
+            record_orders(order_ids)
+        except Exception as e:
+            # The next compaction can't recover these sales, but checkout must not fail
+            logger.warning("Leaderboard update for orders %s failed: %s", order_ids, e)
+
+    transaction.on_commit(record)
+
+
+def _decay(board, landmark, now):
+    return 2 ** ((landmark - now) / half_lives()[board])
+
+
+def ranked_ids(board, start, stop):
+    """Product ids ranked ``start``..``stop - 1`` on ``board``: O(log n + page)"""
+    if stop <= start:
+        return []
+    return [int(member) for member in redis().zrevrange(board_key(board), start, stop - 1)]
+
+
+def board_size(board):
+    return redis().zcard(board_key(board))
+
+
+def current_scores(board):
+    """{product id: score as of now}, for the snapshot"""
+    client = redis()
+    landmark = client.get(landmark_key(board))
+    if landmark is None:
+        return {}
+    factor = _decay(board, float(landmark), time.time())
+    return {
+        int(member): score * factor
+        for member, score in client.zscan_iter(board_key(board))
+    }
+
+
+def restore(board, column):
+    """Reload an empty board from the DB snapshot, e.g. after a Redis flush"""
+    client = redis()
+    scores = {
+        product_id: score
+        for product_id, score in ProductPopularity.objects.filter(**{f'{column}__gt': 0}).values_list('product_id', column)
+    }
+    if not scores:
+        return 0
+    pipe = client.pipeline()
+    pipe.set(landmark_key(board), time.time())
+    pipe.zadd(board_key(board), scores)
+    pipe.execute()
+    return len(scores)
+
+
+def compact():
+    """Rescale and trim the boards, then snapshot them into ProductPopularity"""
+    client = redis()
+    script = client.register_script(COMPACT_SCRIPT)
+    columns = dict(SORTS.values())
+    stats = {}
+
+    for board, half_life in half_lives().items():
+        if not client.exists(board_key(board)):
+            stats[f'{board}_restored'] = restore(board, columns[board])
+        script(
+            keys=[board_key(board), landmark_key(board)],
+            args=[time.time(), half_life, half_life * REBASE_HALF_LIVES, MIN_SCORE, settings.LEADERBOARD_MAX_SIZE],
+        )
+
+    # Inactive products can't be listed; drop them rather than rank them
+    scores = {board: current_scores(board) for board in columns}
+    ranked = sorted(set().union(*scores.values()))
+    active = set()
+    for i in range(0, len(ranked), 5000):
+        active.update(
+            Product.objects.filter(id__in=ranked[i:i + 5000], is_active=True).values_list('id', flat=True)
+        )
+    inactive = set(ranked) - active
+    if inactive:
+        for board in columns:
+            client.zrem(board_key(board), *inactive)
+
+    started = timezone.now()
+    rows = [
+        ProductPopularity(
+            product_id=product_id,
+            bestseller_score=scores[BESTSELLERS].get(product_id, 0),
+            trending_score=scores[TRENDING].get(product_id, 0),
+        )
+        for product_id in active
+    ]
+    with transaction.atomic():
+        ProductPopularity.objects.bulk_create(
+            rows,
+            batch_size=2000,
+            update_conflicts=True,
+            unique_fields=['product'],
+            update_fields=['bestseller_score', 'trending_score', 'updated_at'],
+        )
+        # Whatever wasn't refreshed fell off both boards
+        stats['snapshot_removed'] = ProductPopularity.objects.filter(updated_at__lt=started).delete()[0]
+    stats['snapshot_rows'] = len(rows)
+    stats['inactive_removed'] = len(inactive)
+    return stats
+
+
+class RankedProducts:
+    """
+    Sequence of products in leaderboard order, followed by the products not
+    on that board (newest first). Slicing a page costs one ZREVRANGE and
+    one or two indexed queries, so it can be handed to any paginator.
+
+    The tail is read from the board's snapshot column (see mark_ranked),
+    so a product that sold but fell off this board, or only sold on the
+    other one, is listed there rather than nowhere.
+    """
+
+    def __init__(self, board, queryset):
+        self.board = board
+        self.column = dict(SORTS.values())[board]
+        self.queryset = queryset
+        self._ranked = None
+        self._length = None
+
+    @property
+    def ranked(self):
+        if self._ranked is None:
+            self._ranked = board_size(self.board)
+        return self._ranked
+
+    def unranked(self):
+        return self.queryset.exclude(**{f'popularity__{self.column}__gt': 0}).order_by('-created_at', '-id')
+
+    def count(self):
+        if self._length is None:
+            self._length = self.ranked + self.unranked().count()
+        return self._length
+
+    __len__ = count
+
+    def __iter__(self):
+        return iter(self[0:self.count()])
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            page = self[index:index + 1]
+            if not page:
+                raise IndexError(index)
+            return page[0]
+        start, stop = index.start or 0, index.stop if index.stop is not None else self.count()
+
+        products = []
+        if start < self.ranked:
+            ids = ranked_ids(self.board, start, min(stop, self.ranked))
+            by_id = self.queryset.in_bulk(ids)
+            products += [by_id[product_id] for product_id in ids if product_id in by_id]
+        if stop > self.ranked:
+            products += list(self.unranked()[max(start - self.ranked, 0):stop - self.ranked])
+        return products
+
+
+def sort_products(queryset, sort, filtered=False):
+    """
+    ``queryset`` in ``sort`` order (a key of SORTS). Unfiltered listings page
+    straight through Redis; filtered ones, or any listing while Redis is
+    unreachable, are ordered by the last snapshot instead.
+    """
+    board, column = SORTS[sort]
+    if not filtered:
+        try:
+            ranked = RankedProducts(board, queryset)
+            ranked.count()
+            return ranked
+        except Exception as e:
+            logger.warning("Leaderboard %s unavailable, sorting from snapshot: %s", board, e)
+    return queryset.order_by(F(f'popularity__{column}').desc(nulls_last=True), '-created_at')
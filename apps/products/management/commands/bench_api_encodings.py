@@ -0,0 +1,71 @@
+"""
+Management command to compare API encodings for product listings
+Usage: python manage.py bench_api_encodings [--count 20] [--repeat 20]
+
+Encodes one listing's worth of products as JSON (DRF and orjson) and as
+MessagePack (object and columnar layouts), and reports the payload size
+raw, gzipped and Brotli-compressed at the API's settings, with encode and
+decode time. Read-only; run it against a seeded database.
+"""
+
+import json
+import time
+
+import msgpack
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.renderers import JSONRenderer
+
+from apps.products.api.fast import FastProductSerializer
+from apps.products.models import Product
+from utils.compression import compress
+from utils.renderers import MessagePackRenderer, ORJSONRenderer
+
+
+class Command(BaseCommand):
+    help = 'Benchmark JSON vs MessagePack (and compression) for product listings'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=20, help='Products per listing (the API page size is 20)')
+        parser.add_argument('--repeat', type=int, default=20, help='Runs per encoding (best is reported)')
+
+    def handle(self, *args, **options):
+        ids = list(Product.objects.filter(is_active=True).order_by('name').values_list('id', flat=True)[:options['count']])
+        if not ids:
+            raise CommandError('No active products to encode; seed some first')
+        data = {'count': len(ids), 'next': None, 'previous': None, 'results': FastProductSerializer().serialize(ids)}
+        repeat = max(options['repeat'], 1)
+
+        encodings = [
+            ('json (DRF)', lambda: JSONRenderer().render(data), json.loads),
+            ('json (orjson)', lambda: ORJSONRenderer().render(data), json.loads),
+            ('msgpack', lambda: MessagePackRenderer().render(data, 'application/msgpack'), msgpack.unpackb),
+            (
+                'msgpack columnar',
+                lambda: MessagePackRenderer().render(data, 'application/msgpack; layout=columnar'),
+                msgpack.unpackb,
+            ),
+        ]
+
+        self.stdout.write(f'{len(ids)} products, best of {repeat} runs')
+        self.stdout.write(
+            f'  {"encoding":<18} {"bytes":>8} {"gzip":>8} {"br":>8} {"encode us":>10} {"decode us":>10}'
+        )
+        for name, encode, decode in encodings:
+            payload = encode()
+            encode_time = self.best(encode, repeat)
+            decode_time = self.best(lambda: decode(payload), repeat)
+            gzipped, brotlied = len(compress(payload, 'gzip')), len(compress(payload, 'br'))
+            self.stdout.write(
+                f'  {name:<18} {len(payload):8d} {gzipped:8d} {brotlied:8d} '
+                f'{encode_time * 1e6:10.0f} {decode_time * 1e6:10.0f}'
+            )
+        self.stdout.write(self.style.SUCCESS('Done'))
+
+    def best(self, run, repeat):
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            run()
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return best
@@ -0,0 +1,69 @@
+"""
+Management command to compare the product listing serializers
+Usage: python manage.py bench_product_serializers [--count 200] [--repeat 5]
+
+Serializes the same active products with ProductSerializer + JSONRenderer
+and with FastProductSerializer + ORJSONRenderer, and reports the per-item
+cost and query count of each. Read-only; run it against a seeded database.
+"""
+
+import json
+import time
+from contextlib import ExitStack
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test.utils import CaptureQueriesContext
+from rest_framework.renderers import JSONRenderer
+
+from apps.products.api.fast import FastProductSerializer
+from apps.products.api.serializers import ProductSerializer
+from apps.products.models import Product
+from utils.renderers import ORJSONRenderer
+
+
+class Command(BaseCommand):
+    help = 'Benchmark ProductSerializer against the fast listing serializer'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=200, help='Products per run')
+        parser.add_argument('--repeat', type=int, default=5, help='Runs per serializer (best is reported)')
+
+    def handle(self, *args, **options):
+        ids = list(Product.objects.filter(is_active=True).order_by('name').values_list('id', flat=True)[:options['count']])
+        if not ids:
+            raise CommandError('No active products to serialize; seed some first')
+
+        def drf():
+            products = Product.objects.filter(id__in=ids).select_related('category', 'stats').prefetch_related('images').order_by('name')
+            return JSONRenderer().render(ProductSerializer(products, many=True).data)
+
+        def fast():
+            return ORJSONRenderer().render(FastProductSerializer().serialize(ids))
+
+        results = {}
+        for name, run in [('ProductSerializer', drf), ('FastProductSerializer', fast)]:
+            results[name] = self.measure(run, options['repeat'])
+
+        if json.loads(results['ProductSerializer'][2]) != json.loads(results['FastProductSerializer'][2]):
+            raise CommandError('Serializers disagree; the fast path no longer matches ProductSerializer')
+
+        self.stdout.write(f'{len(ids)} products, best of {options["repeat"]} runs')
+        for name, (seconds, queries, _) in results.items():
+            self.stdout.write(
+                f'  {name:<22} {seconds * 1000:8.1f} ms  {seconds / len(ids) * 1e6:8.1f} us/item  {queries:5d} queries'
+            )
+        speedup = results['ProductSerializer'][0] / results['FastProductSerializer'][0]
+        self.stdout.write(self.style.SUCCESS(f'Fast path is {speedup:.1f}x faster, output identical'))
+
+    def measure(self, run, repeat):
+        best = None
+        for _ in range(max(repeat, 1)):
+            # Reads may be routed to a replica alias
+            with ExitStack() as stack:
+                captured = [stack.enter_context(CaptureQueriesContext(connection)) for connection in connections.all()]
+                start = time.perf_counter()
+                output = run()
+                elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return best, sum(len(queries) for queries in captured), output
@@ -0,0 +1,56 @@
+"""
+Management command to rebuild the related-products index
+Usage: python manage.py build_recommendations [--top-k 8] [--category-weight 0.3] [--days 365]
+
+Scores every active product against its co-purchases in order history,
+blended with category similarity, and replaces ProductRecommendation a
+chunk of products at a time. Run it nightly (CELERY_BEAT_SCHEDULE does) or after a
+large catalogue import.
+"""
+
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.products import recommendations
+
+
+class Command(BaseCommand):
+    help = 'Rebuild product recommendations from order history'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--top-k',
+            type=int,
+            default=settings.RECOMMENDATIONS_TOP_K,
+            help='Recommendations stored per product',
+        )
+        parser.add_argument(
+            '--category-weight',
+            type=float,
+            default=settings.RECOMMENDATIONS_CATEGORY_WEIGHT,
+            help='Weight of same-category similarity vs co-purchases (0-1)',
+        )
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=settings.RECOMMENDATIONS_LOOKBACK_DAYS,
+            help='Only use orders from the last N days (0 for all history)',
+        )
+
+    def handle(self, *args, **options):
+        if not 0 <= options['category_weight'] <= 1:
+            raise CommandError('--category-weight must be between 0 and 1')
+        if options['top_k'] < 1:
+            raise CommandError('--top-k must be at least 1')
+
+        start = time.monotonic()
+        count = recommendations.build(
+            k=options['top_k'],
+            category_weight=options['category_weight'],
+            days=options['days'] or None,
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Stored {count} recommendations in {time.monotonic() - start:.1f}s'
+        ))
@@ -0,0 +1,22 @@
+"""
+Management command to compact the best-seller/trending leaderboards
+Usage: python manage.py compact_leaderboards
+
+Rescales the Redis sorted sets to a fresh decay landmark when due, trims
+them, and snapshots the scores into ProductPopularity. Restores a board
+from the snapshot if Redis lost it. Celery beat runs this every 15 minutes.
+"""
+
+from django.core.management.base import BaseCommand
+
+from apps.products import leaderboards
+
+
+class Command(BaseCommand):
+    help = 'Compact the Redis leaderboards and snapshot them to the database'
+
+    def handle(self, *args, **options):
+        stats = leaderboards.compact()
+        for key, value in sorted(stats.items()):
+            self.stdout.write(f'{key}: {value}')
+        self.stdout.write(self.style.SUCCESS('Leaderboards compacted'))
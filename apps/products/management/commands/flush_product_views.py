@@ -0,0 +1,20 @@
+"""
+Management command to write buffered product views to the database
+Usage: python manage.py flush_product_views
+
+Drains the Redis view counters into ProductStats with one bulk upsert per
+batch. Celery beat runs this every PRODUCT_VIEWS_FLUSH_INTERVAL seconds;
+run it by hand when no beat scheduler is deployed.
+"""
+
+from django.core.management.base import BaseCommand
+
+from apps.products import view_counts
+
+
+class Command(BaseCommand):
+    help = 'Flush buffered product view counts to ProductStats'
+
+    def handle(self, *args, **options):
+        updated = view_counts.flush()
+        self.stdout.write(self.style.SUCCESS(f'Updated view counts for {updated} products'))
@@ -0,0 +1,27 @@
+# Generated by Django 4.2.30 on 2026-10-19 04:15
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0003_productpopularity'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductStats',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='products.product')),
+                ('view_count', models.PositiveBigIntegerField(default=0)),
+                ('viewers_today', models.PositiveIntegerField(default=0)),
+                ('stats_date', models.DateField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name_plural': 'Product stats',
+            },
+        ),
+    ]
@@ -1,5 +1,6 @@
 from django.db import models
 from django.urls import reverse
+from django.utils import timezone
 from django.utils.text import slugify
 
 
@@ -89,6 +90,11 @@ class Product(models.Model):
     @property
     def featured_image(self):
         """Returns the primary/featured image for this product"""
+        if 'images' in getattr(self, '_prefetched_objects_cache', {}):
+            # prefetch_related('images') on listings: no query per product
+            images = self.images.all()
+            image = next((image for image in images if image.is_primary), images[0] if images else None)
+            return image.image if image else None
         primary_image = self.images.filter(is_primary=True).first()
         if primary_image:
             return primary_image.image
@@ -129,6 +135,64 @@ class ProductVariant(models.Model):
         return f"{self.product.name} - {self.name}"
 
 
+class ProductRecommendation(models.Model):
+    """Precomputed top-K neighbours of a product, rebuilt by build_recommendations"""
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='recommendations')
+    recommended = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='recommended_by')
+    rank = models.PositiveSmallIntegerField()
+    score = models.FloatField()
+    
+    class Meta:
+        ordering = ['product', 'rank']
+        constraints = [
+            # Also the index behind "top N for this product" lookups
+            models.UniqueConstraint(fields=['product', 'rank'], name='unique_recommendation_rank'),
+        ]
+    
+    def __str__(self):
+        return f"{self.product_id} -> {self.recommended_id} (#{self.rank})"
+
+
+class ProductPopularity(models.Model):
+    """
+    Snapshot of the Redis leaderboards (see apps/products/leaderboards.py),
+    for DB-side sorting and for restoring Redis if its data is lost
+    """
+    product = models.OneToOneField(Product, on_delete=models.CASCADE, primary_key=True, related_name='popularity')
+    bestseller_score = models.FloatField(default=0, db_index=True)
+    trending_score = models.FloatField(default=0, db_index=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        verbose_name_plural = 'Product popularity'
+    
+    def __str__(self):
+        return f"{self.product_id}: {self.bestseller_score:.2f} / {self.trending_score:.2f}"
+
+
+class ProductStats(models.Model):
+    """
+    View counters, written in bulk by flush_product_views from the Redis
+    buffers in apps/products/view_counts.py; never updated per request
+    """
+    product = models.OneToOneField(Product, on_delete=models.CASCADE, primary_key=True, related_name='stats')
+    view_count = models.PositiveBigIntegerField(default=0)
+    viewers_today = models.PositiveIntegerField(default=0)
+    stats_date = models.DateField(null=True, blank=True)  # day viewers_today counts
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        verbose_name_plural = 'Product stats'
+    
+    @property
+    def today_viewers(self):
+        """Distinct viewers today (0 if nobody has viewed it since midnight)"""
+        return self.viewers_today if self.stats_date == timezone.localdate() else 0
+    
+    def __str__(self):
+        return f"{self.product_id}: {self.view_count} views"
+
+
 class Review(models.Model):
     RATING_CHOICES = [
         (1, '1 Star'),
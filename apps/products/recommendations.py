@@ -0,0 +1,196 @@
+"""
+Related-product recommendations, built offline from order history.
+
+build() turns OrderItem rows into a sparse orders x products matrix X and
+takes the co-purchase counts C = X.T @ X. Scores are cosine-normalised
+(C_ij / sqrt(n_i * n_j)) so bestsellers don't dominate every list, then
+blended with category similarity:
+
+    score = (1 - w) * cosine + w * same_category
+
+Products with too few co-purchases are topped up with the bestsellers of
+their own category. The top K per product are stored in
+ProductRecommendation, so pages read them with one indexed lookup. They are
+written WRITE_CHUNK_SIZE products at a time, each chunk in its own short
+transaction, so a rebuild never holds every row in memory or locks the whole
+table.
+"""
+
+import logging
+from datetime import timedelta
+from itertools import islice
+
+import numpy as np
+from scipy import sparse
+from django.db import transaction
+from django.db.models import prefetch_related_objects
+from django.utils import timezone
+
+from apps.orders.models import OrderItem
+from .models import Product, ProductRecommendation
+
+logger = logging.getLogger(__name__)
+
+# Orders that actually went through; pending and cancelled carts say little
+PURCHASED_STATUSES = ('confirmed', 'processing', 'shipped', 'delivered')
+
+# Products whose recommendations are replaced per transaction
+WRITE_CHUNK_SIZE = 500
+WRITE_BATCH_SIZE = 5000
+
+
+def load_catalog():
+    """Active product ids and their category ids, as aligned arrays"""
+    rows = np.array(
+        list(Product.objects.filter(is_active=True).order_by('id').values_list('id', 'category_id')),
+        dtype=np.int64,
+    ).reshape(-1, 2)
+    return rows[:, 0], rows[:, 1]
+
+
+def purchase_matrix(product_ids, since=None):
+    """Binary orders x products CSR matrix of purchases of active products"""
+    column = {product_id: i for i, product_id in enumerate(product_ids.tolist())}
+    items = OrderItem.objects.filter(order__status__in=PURCHASED_STATUSES)
+    if since is not None:
+        items = items.filter(order__created_at__gte=since)
+
+    order_rows = {}
+    rows, cols = [], []
+    for order_id, product_id in items.values_list('order_id', 'product_id').iterator(chunk_size=10000):
+        col = column.get(product_id)
+        if col is None:
+            continue
+        rows.append(order_rows.setdefault(order_id, len(order_rows)))
+        cols.append(col)
+
+    data = np.ones(len(rows), dtype=np.float32)
+    matrix = sparse.csr_matrix((data, (rows, cols)), shape=(len(order_rows), len(product_ids)))
+    matrix.sum_duplicates()
+    # An order listing the same product twice (two variants) counts once
+    matrix.data[:] = 1
+    return matrix
+
+
+def co_purchase_scores(purchases):
+    """Cosine-normalised co-purchase matrix with an empty diagonal"""
+    counts = (purchases.T @ purchases).tocsr()
+    popularity = counts.diagonal().astype(np.float32)
+    counts.setdiag(0)
+    counts.eliminate_zeros()
+
+    norm = np.sqrt(popularity)
+    norm[norm == 0] = 1
+    inverse = sparse.diags(1 / norm)
+    return (inverse @ counts @ inverse).tocsr(), popularity
+
+
+def category_bestsellers(category_ids, popularity, limit):
+    """{category id: product indices by descending popularity, at most ``limit``}"""
+    order = np.lexsort((-np.arange(len(popularity)), -popularity))
+    best = {}
+    for index in order:
+        ranked = best.setdefault(int(category_ids[index]), [])
+        if len(ranked) < limit:
+            ranked.append(int(index))
+    return best
+
+
+def top_k(scores, category_ids, popularity, k, category_weight):
+    """Yield (product index, [(neighbour index, score), ...]) for every product"""
+    bestsellers = category_bestsellers(category_ids, popularity, k + 1)
+    # Category fill-ins rank below any co-purchased product of the same category
+    fill_score = category_weight * 0.5
+
+    for i in range(scores.shape[0]):
+        start, end = scores.indptr[i], scores.indptr[i + 1]
+        neighbours = scores.indices[start:end]
+        blended = (1 - category_weight) * scores.data[start:end]
+        blended = blended + category_weight * (category_ids[neighbours] == category_ids[i])
+
+        if len(neighbours) > k:
+            keep = np.argpartition(-blended, k)[:k]
+            neighbours, blended = neighbours[keep], blended[keep]
+        ranked = sorted(zip(neighbours.tolist(), blended.tolist()), key=lambda pair: (-pair[1], pair[0]))
+
+        if len(ranked) < k:
+            seen = {index for index, _ in ranked}
+            seen.add(i)
+            for index in bestsellers.get(int(category_ids[i]), ()):
+                if len(ranked) >= k:
+                    break
+                if index not in seen:
+                    ranked.append((index, fill_score))
+            ranked.sort(key=lambda pair: (-pair[1], pair[0]))
+        yield i, ranked
+
+
+def build(k=8, category_weight=0.3, days=None):
+    """Recompute and replace every product's recommendations; returns the row count"""
+    product_ids, category_ids = load_catalog()
+    if not len(product_ids):
+        return 0
+    since = timezone.now() - timedelta(days=days) if days else None
+
+    purchases = purchase_matrix(product_ids, since)
+    scores, popularity = co_purchase_scores(purchases)
+    logger.info(
+        "Recommendations: %d products, %d orders, %d co-purchase pairs",
+        len(product_ids), purchases.shape[0], scores.nnz,
+    )
+
+    count = 0
+    ranked_lists = top_k(scores, category_ids, popularity, k, category_weight)
+    while True:
+        chunk = list(islice(ranked_lists, WRITE_CHUNK_SIZE))
+        if not chunk:
+            break
+        count += _write_chunk(product_ids, chunk)
+
+    # Products dropped from the catalogue since the last build
+    ProductRecommendation.objects.exclude(product__is_active=True).delete()
+    return count
+
+
+def _write_chunk(product_ids, chunk):
+    """Replace the recommendations of one chunk of top_k() output; returns the row count"""
+    rows = [
+        ProductRecommendation(
+            product_id=int(product_ids[i]),
+            recommended_id=int(product_ids[index]),
+            rank=rank,
+            score=round(score, 6),
+        )
+        for i, ranked in chunk
+        for rank, (index, score) in enumerate(ranked, start=1)
+    ]
+    # Readers see a product's old list or its new one, never a mix
+    with transaction.atomic():
+        ProductRecommendation.objects.filter(product_id__in=[int(product_ids[i]) for i, _ in chunk]).delete()
+        ProductRecommendation.objects.bulk_create(rows, batch_size=WRITE_BATCH_SIZE)
+    return len(rows)
+
+
+def recommended_for(product_ids, limit, exclude=(), in_stock=False):
+    """
+    Active products recommended for any of ``product_ids``, best first. A
+    product recommended for several of them keeps its best score.
+    """
+    rows = (
+        ProductRecommendation.objects
+        .filter(product_id__in=product_ids, recommended__is_active=True)
+        .exclude(recommended_id__in=exclude)
+        .select_related('recommended__category')
+        .order_by('-score', 'rank')
+    )
+    if in_stock:
+        rows = rows.filter(recommended__inventory_quantity__gt=0)
+    recommended = {}
+    for row in rows[:limit * len(product_ids)]:
+        recommended.setdefault(row.recommended_id, row.recommended)
+        if len(recommended) == limit:
+            break
+    products = list(recommended.values())
+    # Listed with their featured_image
+    prefetch_related_objects(products, 'images')
+    return products
@@ -0,0 +1,28 @@
+"""Background tasks for the product catalogue"""
+
+from celery import shared_task
+from django.conf import settings
+
+from . import leaderboards, recommendations, view_counts
+
+
+@shared_task(ignore_result=True)
+def build_recommendations():
+    """Nightly rebuild of the related-products index"""
+    return recommendations.build(
+        k=settings.RECOMMENDATIONS_TOP_K,
+        category_weight=settings.RECOMMENDATIONS_CATEGORY_WEIGHT,
+        days=settings.RECOMMENDATIONS_LOOKBACK_DAYS or None,
+    )
+
+
+@shared_task(ignore_result=True)
+def compact_leaderboards():
+    """Rescale/trim the Redis leaderboards and snapshot them to the DB"""
+    return leaderboards.compact()
+
+
+@shared_task(ignore_result=True)
+def flush_product_views():
+    """Write buffered product views to ProductStats"""
+    return view_counts.flush()
@@ -0,0 +1,104 @@
+import time
+
+from django.test import TestCase
+
+from utils.cache import tiered_cache
+
+from . import caching, leaderboards
+from .models import Category, Product
+
+
+class RankedProductsTests(TestCase):
+    """Needs the Redis behind CACHES['default']; the leaderboard keys are cleared around each test"""
+
+    def setUp(self):
+        self.clear_boards()
+        self.addCleanup(self.clear_boards)
+        category = Category.objects.create(name='Board games')
+        self.products = [
+            Product.objects.create(
+                name=f'Product {i}', category=category, description='', price=10, sku=f'SKU-{i}'
+            )
+            for i in range(5)
+        ]
+
+    def clear_boards(self):
+        client = leaderboards.redis()
+        for board in (leaderboards.BESTSELLERS, leaderboards.TRENDING):
+            client.delete(leaderboards.board_key(board), leaderboards.landmark_key(board))
+
+    def sold(self, scores):
+        """Put ``scores`` ({board: {product: score}}) on the boards as record_orders() would"""
+        client = leaderboards.redis()
+        for board, board_scores in scores.items():
+            client.set(leaderboards.landmark_key(board), time.time())
+            client.zadd(leaderboards.board_key(board), {product.id: score for product, score in board_scores.items()})
+        leaderboards.mark_ranked([product.id for board_scores in scores.values() for product in board_scores])
+
+    def listing(self, sort):
+        ranked = leaderboards.sort_products(Product.objects.filter(is_active=True), sort)
+        self.assertIsInstance(ranked, leaderboards.RankedProducts)
+        return ranked
+
+    def test_product_trimmed_from_one_board_stays_listed_there(self):
+        top, faded, *unsold = self.products
+        # ``faded`` sold long enough ago to decay off trending but not off bestsellers
+        self.sold({
+            leaderboards.BESTSELLERS: {top: 5, faded: 3},
+            leaderboards.TRENDING: {top: 5, faded: leaderboards.MIN_SCORE / 10},
+        })
+        leaderboards.compact()
+        self.assertEqual(leaderboards.board_size(leaderboards.TRENDING), 1)
+
+        trending = self.listing('trending')
+        self.assertEqual(trending.count(), len(self.products))
+        self.assertEqual(list(trending), [top, *reversed(unsold), faded])
+        self.assertEqual(trending[3:5], [unsold[0], faded])
+
+        popular = self.listing('popular')
+        self.assertEqual(popular.count(), len(self.products))
+        self.assertEqual(list(popular), [top, faded, *reversed(unsold)])
+
+    def test_sold_product_is_not_listed_twice_before_compaction(self):
+        first, *rest = self.products
+        self.sold({leaderboards.BESTSELLERS: {first: 1}, leaderboards.TRENDING: {first: 1}})
+
+        for sort in leaderboards.SORTS:
+            listing = self.listing(sort)
+            self.assertEqual(listing.count(), len(self.products))
+            self.assertEqual(list(listing), [first, *reversed(rest)])
+
+
+class CatalogCacheTests(TestCase):
+    """Needs the Redis behind CACHES['default']"""
+
+    def setUp(self):
+        self.invalidate()
+        self.addCleanup(self.invalidate)
+        category = Category.objects.create(name='Board games')
+        Product.objects.create(
+            name='Chess', category=category, description='', price=10, sku='SKU-1', is_featured=True
+        )
+        # on_commit invalidation never fires inside a TestCase
+        self.invalidate()
+
+    def invalidate(self):
+        tiered_cache().invalidate(caching.CATEGORIES_KEY, caching.FEATURED_PRODUCTS_KEY)
+
+    def test_every_call_gets_its_own_instances(self):
+        for lookup in (caching.active_categories, caching.featured_products):
+            with self.subTest(lookup=lookup.__name__):
+                [first] = lookup()
+                first.annotated = True
+                with self.assertNumQueries(0):
+                    [second] = lookup()
+                self.assertEqual(second, first)
+                self.assertIsNot(second, first)
+                self.assertFalse(hasattr(second, 'annotated'))
+
+    def test_prefetched_rows_are_not_shared(self):
+        [first] = caching.featured_products()
+        first._prefetched_objects_cache['images']._result_cache.append('leaked')
+        [second] = caching.featured_products()
+        with self.assertNumQueries(0):
+            self.assertEqual(list(second.images.all()), [])
@@ -1,10 +1,17 @@
+from django.conf import settings
 from django.urls import path
 from . import views
 
 app_name = 'products'
 
+# ASGI deployments serve the read-heavy pages from async views
+if settings.ASYNC_VIEWS:
+    list_view, detail_view = views.AsyncProductListView, views.AsyncProductDetailView
+else:
+    list_view, detail_view = views.ProductListView, views.ProductDetailView
+
 urlpatterns = [
-    path('', views.ProductListView.as_view(), name='list'),
+    path('', list_view.as_view(), name='list'),
     path('category/<slug:slug>/', views.CategoryView.as_view(), name='category'),
-    path('<slug:slug>/', views.ProductDetailView.as_view(), name='detail'),
+    path('<slug:slug>/', detail_view.as_view(), name='detail'),
 ]
\ No newline at end of file
@@ -0,0 +1,112 @@
+"""
+Buffered product view counters.
+
+A page view costs one pipelined Redis round trip: HINCRBY on a pending
+hash plus PFADD of the viewer into today's HyperLogLog for the product.
+flush() periodically swaps the pending hash out with RENAME, so views
+keep landing in a fresh one, and applies the whole batch to ProductStats
+in one bulk upsert.
+"""
+
+import hashlib
+import logging
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+from django_redis import get_redis_connection
+
+from .models import Product, ProductStats
+
+logger = logging.getLogger(__name__)
+
+PENDING_KEY = 'product_views:pending'
+# Batch being flushed; survives a crashed flush and is retried first
+FLUSHING_KEY = 'product_views:flushing'
+FLUSH_LOCK_KEY = 'product_views:flush_lock'
+
+CHUNK_SIZE = 2000
+
+
+def viewers_key(product_id, day):
+    return f'product_views:viewers:{day.isoformat()}:{product_id}'
+
+
+def viewer_id(request):
+    """Stable per-person id: the user, else the session, else IP + user agent"""
+    if request.user.is_authenticated:
+        return f'u{request.user.pk}'
+    if request.session.session_key:
+        return f's{request.session.session_key}'
+    raw = f"{request.META.get('REMOTE_ADDR', '')}|{request.META.get('HTTP_USER_AGENT', '')}"
+    return 'a' + hashlib.blake2b(raw.encode(), digest_size=8).hexdigest()
+
+
+def record_view(request, product_id):
+    """Count one view; never fails the page if Redis is unavailable"""
+    key = viewers_key(product_id, timezone.localdate())
+    try:
+        pipe = get_redis_connection('default').pipeline(transaction=False)
+        pipe.hincrby(PENDING_KEY, product_id, 1)
+        pipe.pfadd(key, viewer_id(request))
+        pipe.expire(key, 2 * 86400)
+        pipe.execute()
+    except Exception as e:
+        logger.warning("Recording a view of product %s failed: %s", product_id, e)
+
+
+def flush():
+    """Apply buffered views to ProductStats; returns the number of products updated"""
+    if not cache.add(FLUSH_LOCK_KEY, 1, timeout=settings.PRODUCT_VIEWS_FLUSH_LOCK_SECONDS):
+        return 0
+    try:
+        client = get_redis_connection('default')
+        updated = 0
+        # A batch left by a crashed flush goes first; it may be applied twice
+        # if the crash came after the commit, which view counts can tolerate
+        if not client.exists(FLUSHING_KEY):
+            if not client.exists(PENDING_KEY):
+                return 0
+            client.rename(PENDING_KEY, FLUSHING_KEY)
+        counts = {int(product_id): int(views) for product_id, views in client.hgetall(FLUSHING_KEY).items()}
+        ids = sorted(counts)
+        for start in range(0, len(ids), CHUNK_SIZE):
+            updated += _apply(client, {product_id: counts[product_id] for product_id in ids[start:start + CHUNK_SIZE]})
+        client.delete(FLUSHING_KEY)
+        return updated
+    finally:
+        cache.delete(FLUSH_LOCK_KEY)
+
+
+def _apply(client, counts):
+    today = timezone.localdate()
+    pipe = client.pipeline(transaction=False)
+    for product_id in counts:
+        pipe.pfcount(viewers_key(product_id, today))
+    viewers = dict(zip(counts, pipe.execute()))
+
+    # One query for current totals; products deleted since the view are skipped
+    current = {
+        product_id: view_count or 0
+        for product_id, view_count in Product.objects.using('default')
+        .filter(id__in=list(counts)).values_list('id', 'stats__view_count')
+    }
+    rows = [
+        ProductStats(
+            product_id=product_id,
+            view_count=current[product_id] + counts[product_id],
+            viewers_today=viewers[product_id],
+            stats_date=today,
+        )
+        for product_id in current
+    ]
+    # Only the flusher writes view_count, and the lock keeps it to one at a time
+    with transaction.atomic():
+        ProductStats.objects.bulk_create(
+            rows,
+            update_conflicts=True,
+            unique_fields=['product'],
+            update_fields=['view_count', 'viewers_today', 'stats_date', 'updated_at'],
+        )
+    return len(rows)
@@ -1,7 +1,59 @@
+from asgiref.sync import sync_to_async
+from django.http import Http404
 from django.shortcuts import render, get_object_or_404
+from django.template.response import TemplateResponse
+from django.views import View
 from django.views.generic import ListView, DetailView
 from django.db.models import Q, Avg
+from utils import aio
 from .models import Product, Category, Review
+from . import leaderboards, view_counts
+from .caching import active_categories
+from .recommendations import recommended_for
+
+
+def listing_queryset(params):
+    """Active products filtered and sorted by the listing's query params"""
+    queryset = Product.objects.filter(is_active=True).select_related('category', 'stats').prefetch_related('images')
+    
+    # Search functionality
+    search_query = params.get('search')
+    if search_query:
+        queryset = queryset.filter(
+            Q(name__icontains=search_query) |
+            Q(description__icontains=search_query) |
+            Q(category__name__icontains=search_query)
+        )
+    
+    # Category filter
+    category_slug = params.get('category')
+    if category_slug:
+        queryset = queryset.filter(category__slug=category_slug)
+    
+    # Price filters
+    min_price = params.get('min_price')
+    max_price = params.get('max_price')
+    if min_price:
+        queryset = queryset.filter(price__gte=min_price)
+    if max_price:
+        queryset = queryset.filter(price__lte=max_price)
+    
+    # Sorting
+    sort = params.get('sort', 'name')
+    if sort == 'price_low':
+        queryset = queryset.order_by('price')
+    elif sort == 'price_high':
+        queryset = queryset.order_by('-price')
+    elif sort == 'newest':
+        queryset = queryset.order_by('-created_at')
+    elif sort in leaderboards.SORTS:
+        # Unfiltered listings page straight through the Redis leaderboard
+        filtered = bool(search_query or category_slug or min_price or max_price)
+        queryset = leaderboards.sort_products(queryset, sort, filtered)
+    else:
+        queryset = queryset.order_by('name')
+    
+    return queryset
 
 
 class ProductListView(ListView):
@@ -11,46 +63,11 @@ class ProductListView(ListView):
     paginate_by = 12
     
     def get_queryset(self):
-        queryset = Product.objects.filter(is_active=True).select_related('category')
-        
-        # Search functionality
-        search_query = self.request.GET.get('search')
-        if search_query:
-            queryset = queryset.filter(
-                Q(name__icontains=search_query) |
-                Q(description__icontains=search_query) |
-                Q(category__name__icontains=search_query)
-            )
-        
-        # Category filter
-        category_slug = self.request.GET.get('category')
-        if category_slug:
-            queryset = queryset.filter(category__slug=category_slug)
-        
-        # Price filters
-        min_price = self.request.GET.get('min_price')
-        max_price = self.request.GET.get('max_price')
-        if min_price:
-            queryset = queryset.filter(price__gte=min_price)
-        if max_price:
-            queryset = queryset.filter(price__lte=max_price)
-        
-        # Sorting
-        sort = self.request.GET.get('sort', 'name')
-        if sort == 'price_low':
-            queryset = queryset.order_by('price')
-        elif sort == 'price_high':
-            queryset = queryset.order_by('-price')
-        elif sort == 'newest':
-            queryset = queryset.order_by('-created_at')
-        else:
-            queryset = queryset.order_by('name')
-        
-        return queryset
+        return listing_queryset(self.request.GET)
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['categories'] = Category.objects.filter(is_active=True)
+        context['categories'] = active_categories()
         return context
 
 
@@ -61,7 +78,7 @@ class CategoryView(DetailView):
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['products'] = self.object.products.filter(is_active=True)
+        context['products'] = self.object.products.filter(is_active=True).prefetch_related('images')
         return context
 
 
@@ -71,7 +88,12 @@ class ProductDetailView(DetailView):
     context_object_name = 'product'
     
     def get_queryset(self):
-        return Product.objects.filter(is_active=True).select_related('category').prefetch_related('images', 'variants')
+        return Product.objects.filter(is_active=True).select_related('category', 'stats').prefetch_related('images', 'variants')
+    
+    def get(self, request, *args, **kwargs):
+        response = super().get(request, *args, **kwargs)
+        view_counts.record_view(request, self.object.id)
+        return response
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -86,10 +108,67 @@ class ProductDetailView(DetailView):
         context['review_count'] = reviews.count()
         context['average_rating'] = reviews.aggregate(Avg('rating'))['rating__avg'] or 0
         
-        # Related products
-        context['related_products'] = Product.objects.filter(
+        # Related products, precomputed by build_recommendations; products
+        # added since the last build fall back to their category
+        context['related_products'] = recommended_for([self.object.id], 4) or Product.objects.filter(
             category=self.object.category,
             is_active=True
-        ).exclude(id=self.object.id)[:4]
+        ).exclude(id=self.object.id).prefetch_related('images')[:4]
+        
+        return context
+
+
+class AsyncProductListView(View):
+    """ProductListView for ASGI deployments (ASYNC_VIEWS); same template and context"""
+    template_name = ProductListView.template_name
+    paginate_by = ProductListView.paginate_by
+    
+    async def get(self, request):
+        # Leaderboard sorts hit Redis while building the listing
+        products = await sync_to_async(listing_queryset)(request.GET)
+        paginator, page = await aio.paginate(products, self.paginate_by, request.GET.get('page') or 1)
+        categories = await sync_to_async(active_categories)()
+        
+        return TemplateResponse(request, self.template_name, {
+            'paginator': paginator,
+            'page_obj': page,
+            'is_paginated': page.has_other_pages(),
+            'object_list': page.object_list,
+            'products': page.object_list,
+            'categories': categories,
+        })
+
+
+class AsyncProductDetailView(View):
+    """ProductDetailView for ASGI deployments (ASYNC_VIEWS); same template and context"""
+    template_name = ProductDetailView.template_name
+    
+    async def get(self, request, slug):
+        queryset = Product.objects.filter(is_active=True).select_related('category', 'stats').prefetch_related('images', 'variants')
+        try:
+            product = await queryset.aget(slug=slug)
+        except Product.DoesNotExist:
+            raise Http404('No product found matching the query')
+        
+        reviews = [
+            review async for review in
+            Review.objects.filter(product=product, is_approved=True).select_related('user')
+        ]
+        related_products = await sync_to_async(recommended_for)([product.id], 4)
+        if not related_products:
+            related_products = [
+                related async for related in
+                Product.objects.filter(category_id=product.category_id, is_active=True)
+                .exclude(id=product.id).prefetch_related('images')[:4]
+            ]
         
-        return context
\ No newline at end of file
+        response = TemplateResponse(request, self.template_name, {
+            'object': product,
+            'product': product,
+            'reviews': reviews,
+            'review_count': len(reviews),
+            'average_rating': sum(review.rating for review in reviews) / len(reviews) if reviews else 0,
+            'related_products': related_products,
+        })
+        await sync_to_async(view_counts.record_view)(request, product.id)
+        return response
\ No newline at end of file
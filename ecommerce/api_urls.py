@@ -1,8 +1,10 @@
 """API URL Configuration"""
 from django.urls import path, include
+from apps.core.batch import BatchView
 
 urlpatterns = [
     path('v1/products/', include('apps.products.api.urls')),
     path('v1/orders/', include('apps.orders.api.urls')),
     path('v1/payments/', include('apps.payments.api.urls')),
+    path('v1/batch/', BatchView.as_view(), name='api-batch'),
 ]
\ No newline at end of file
@@ -3,6 +3,11 @@ ASGI config for ecommerce project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Run it with the ASGI deployment profile, which also switches on the async
+views (ASYNC_VIEWS):
+
+    gunicorn ecommerce.asgi:application -c ecommerce/gunicorn_asgi.py
+
 For more information on this file, see
 https://docs.djangoproject.com/en/4.2/howto/deployment/asgi/
 """
@@ -0,0 +1,20 @@
+"""
+Celery application for background tasks.
+
+Start a worker with: celery -A ecommerce worker -l info
+Periodic tasks (CELERY_BEAT_SCHEDULE) run with: celery -A ecommerce beat -l info
+"""
+
+import os
+
+from celery import Celery
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ecommerce.settings')
+
+app = Celery('ecommerce')
+app.config_from_object('django.conf:settings', namespace='CELERY')
+app.autodiscover_tasks()
+
+from utils.tracing import install_celery_hooks  # noqa: E402
+
+install_celery_hooks()
@@ -0,0 +1,29 @@
+"""
+Gunicorn settings for the ASGI deployment profile
+Usage: gunicorn ecommerce.asgi:application -c ecommerce/gunicorn_asgi.py
+
+Uvicorn workers run one event loop each. The async views (ASYNC_VIEWS,
+switched on here) await Blob Storage and Stripe instead of holding a
+thread, so one worker keeps serving while upstreams are slow. Everything
+else still runs as sync code on Django's thread adapter.
+
+Environment: GUNICORN_BIND (default 0.0.0.0:8000), WEB_CONCURRENCY
+(workers, default 2 per CPU), GUNICORN_TIMEOUT (default 60).
+"""
+
+import multiprocessing
+import os
+
+# Read by ecommerce/settings.py in each worker
+os.environ.setdefault('ASYNC_VIEWS', 'True')
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2))
+worker_class = 'uvicorn.workers.UvicornWorker'
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 60))
+graceful_timeout = 30
+# Longer than Azure's front-end idle timeout, so it closes connections first
+keepalive = 240
+# Recycle workers now and then to bound memory growth
+max_requests = 5000
+max_requests_jitter = 500
@@ -7,6 +7,7 @@ Generated by Django 4.2 for Azure E-commerce platform with Stripe integration.
 import os
 import environ
 import dj_database_url
+from celery.schedules import crontab
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -57,9 +58,14 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'utils.tracing.TracingMiddleware',
+    'utils.instrumentation.RequestMetricsMiddleware',
+    'utils.compression.CompressionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',
+    'utils.aio.WhiteNoiseMiddleware',
+    'utils.db.ReadYourWritesMiddleware',
+    'utils.queries.QueryInspectorMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -96,8 +102,70 @@ DATABASES = {
     "default": dj_database_url.parse(env('PRIMARY_SQL_URL', default='sqlite:///db.sqlite3')),
     "replica": dj_database_url.parse(env('READ_SQL_URL', default='sqlite:///db.sqlite3')),
 }
+# Extra read replicas, comma separated; they become replica2, replica3, ...
+for i, url in enumerate(env.list('READ_SQL_URLS', default=[]), start=2):
+    DATABASES[f"replica{i}"] = dj_database_url.parse(url)
+for alias in DATABASES:
+    if alias != "default":
+        # Replicas see the primary's data under test instead of an empty copy
+        DATABASES[alias]["TEST"] = {"MIRROR": "default"}
+
+DATABASE_ROUTERS = ["utils.db.ReplicaAwareRouter"]
+
+# Replica routing (see utils/db.py)
+# Relative read share per replica alias, e.g. DATABASE_REPLICA_WEIGHTS=replica=3,replica2=1
+DATABASE_REPLICA_WEIGHTS = env.dict('DATABASE_REPLICA_WEIGHTS', cast={'value': int}, default={})
+DATABASE_REPLICA_MAX_LAG_SECONDS = env.float('DATABASE_REPLICA_MAX_LAG_SECONDS', default=5.0)
+DATABASE_REPLICA_LAG_CHECK_INTERVAL = env.int('DATABASE_REPLICA_LAG_CHECK_INTERVAL', default=10)
+# How long a client's reads stay on the primary after it writes
+DATABASE_READ_YOUR_WRITES_SECONDS = env.int('DATABASE_READ_YOUR_WRITES_SECONDS', default=5)
+
+# Query budgets and N+1 detection (see utils/queries.py)
+QUERY_INSPECTOR_ENABLED = env.bool('QUERY_INSPECTOR_ENABLED', default=DEBUG)
+# Raise instead of logging when a request goes over budget (turn on in tests)
+QUERY_BUDGET_STRICT = env.bool('QUERY_BUDGET_STRICT', default=False)
+# Repeats of one statement shape in a request before it is reported as N+1
+N_PLUS_ONE_THRESHOLD = env.int('N_PLUS_ONE_THRESHOLD', default=5)
+QUERY_BUDGET_DEFAULT = None
+# Max queries per URL name: what each page takes for a signed-in user with a
+# cart (the user lookup included), plus one for a cold cache
+QUERY_BUDGETS = {
+    'core:home': 2,
+    'products:list': 5,
+    'products:category': 5,
+    'products:detail': 10,
+    'orders:cart': 5,
+    'orders:checkout': 5,
+    'orders:list': 5,
+    'orders:detail': 6,
+    'product-list': 7,
+    'product-detail': 7,
+}
 
-DATABASE_ROUTERS = ["utils.db.ReadWriteRouter"]
+# Metrics (see utils/metrics.py, served at /metrics)
+# Shared directory for per-worker dumps under gunicorn; empty the directory
+# before (re)starting the server. Leave unset for a single process.
+METRICS_MULTIPROC_DIR = env('METRICS_MULTIPROC_DIR', default='')
+METRICS_FLUSH_INTERVAL = env.float('METRICS_FLUSH_INTERVAL', default=5.0)
+# Require "Authorization: Bearer <token>" on /metrics when set
+METRICS_TOKEN = env('METRICS_TOKEN', default='')
+
+# Deep health check (/health/?deep=1, see apps/core/health.py)
+HEALTH_CHECK_TIMEOUT = env.float('HEALTH_CHECK_TIMEOUT', default=2.0)  # seconds per probe
+HEALTH_CHECK_SLOW_MS = env.int('HEALTH_CHECK_SLOW_MS', default=500)  # slower probes are "degraded"
+HEALTH_CHECK_CACHE_SECONDS = env.float('HEALTH_CHECK_CACHE_SECONDS', default=5.0)
+# Dependencies whose failure makes the worker unhealthy (503) rather than degraded
+HEALTH_CHECK_CRITICAL = env.list('HEALTH_CHECK_CRITICAL', default=['default', 'replica', 'cache'])
+
+# Distributed tracing (see utils/tracing.py). Sampling is decided once per
+# trace, at the request or task that starts it; joined traces follow the
+# caller's traceparent.
+TRACING_ENABLED = env.bool('TRACING_ENABLED', default=False)
+TRACING_SAMPLE_RATE = env.float('TRACING_SAMPLE_RATE', default=0.05)
+# 'console', 'jsonl', 'azure' or dotted paths to exporter classes
+TRACING_EXPORTERS = env.list('TRACING_EXPORTERS', default=['console'])
+TRACING_JSONL_PATH = env('TRACING_JSONL_PATH', default=str(BASE_DIR / 'traces.jsonl'))
+APPLICATIONINSIGHTS_CONNECTION_STRING = env('APPLICATIONINSIGHTS_CONNECTION_STRING', default='')
 
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
@@ -130,13 +198,22 @@ CACHES = {
         "BACKEND": "django_redis.cache.RedisCache",
         "LOCATION": env('REDIS_URL', default="redis://127.0.0.1:6379/1"),
         "OPTIONS": {
-            "CLIENT_CLASS": "django_redis.client.DefaultClient",
+            "CLIENT_CLASS": "utils.instrumentation.InstrumentedRedisClient",
             "SSL": env.bool('REDIS_SSL', default=False),
         },
         "TIMEOUT": 300,
     }
 }
 
+# Two-tier cache (utils/cache.py): per-process LRU in front of Redis
+TIERED_CACHE_LOCAL_MAX_ENTRIES = env.int('TIERED_CACHE_LOCAL_MAX_ENTRIES', default=1024)
+TIERED_CACHE_LOCAL_TTL = env.float('TIERED_CACHE_LOCAL_TTL', default=30.0)  # bounds staleness per worker
+TIERED_CACHE_LOCK_TIMEOUT = env.float('TIERED_CACHE_LOCK_TIMEOUT', default=10.0)  # recompute lock
+TIERED_CACHE_XFETCH_BETA = env.float('TIERED_CACHE_XFETCH_BETA', default=1.0)  # >1 refreshes earlier
+TIERED_CACHE_CHANNEL = env('TIERED_CACHE_CHANNEL', default='tiered-cache-invalidate')
+# Categories, featured products and shipping methods
+CATALOG_CACHE_TTL = env.int('CATALOG_CACHE_TTL', default=600)
+
 SESSION_ENGINE = "django.contrib.sessions.backends.cache"
 SESSION_CACHE_ALIAS = "default"
 SESSION_COOKIE_AGE = 3600  # 1 hour
@@ -161,6 +238,8 @@ if env('USE_AZURE_STORAGE'):
     AZURE_ACCOUNT_NAME = env('AZURE_ACCOUNT_NAME', default='mystore')
     AZURE_ACCOUNT_KEY = env('AZURE_BLOB_KEY', default='')
     AZURE_CONTAINER = env('AZURE_CONTAINER', default='media')
+    # Blob endpoint; override to point at Azurite or a custom domain
+    AZURE_BLOB_ACCOUNT_URL = env('AZURE_BLOB_ACCOUNT_URL', default='') or f'https://{AZURE_ACCOUNT_NAME}.blob.core.windows.net'
     
     # Django-storages Azure configuration
     DEFAULT_FILE_STORAGE = 'apps.core.storage.AzureMediaStorage'
@@ -239,10 +318,43 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
+    'DEFAULT_RENDERER_CLASSES': [
+        'rest_framework.renderers.JSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+        # Accept: application/msgpack (see utils/renderers.py)
+        'utils.renderers.MessagePackRenderer',
+    ],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 20
 }
 
+# Serve the catalog pages, cart count and the Stripe-bound payment views
+# from async views. Turn on only under ASGI
+# (ecommerce/gunicorn_asgi.py sets it); under WSGI every async view would
+# pay for its own event loop.
+ASYNC_VIEWS = env.bool('ASYNC_VIEWS', default=False)
+
+# Live order status (apps/orders/status_events.py): how long an event stream
+# stays open, how often it sends keepalives, and the most a long poll waits
+# (it holds a worker thread, so keep it short)
+ORDER_STATUS_STREAM_SECONDS = env.int('ORDER_STATUS_STREAM_SECONDS', default=120)
+ORDER_STATUS_KEEPALIVE_SECONDS = env.int('ORDER_STATUS_KEEPALIVE_SECONDS', default=15)
+ORDER_STATUS_LONG_POLL_SECONDS = env.int('ORDER_STATUS_LONG_POLL_SECONDS', default=5)
+# How long the payment page waits for the webhook to record a payment before
+# asking the server to check with Stripe; skipped without STRIPE_WEBHOOK_SECRET
+PAYMENT_WEBHOOK_WAIT_SECONDS = env.int('PAYMENT_WEBHOOK_WAIT_SECONDS', default=10)
+
+# Product multi-get (?ids=) and batched API requests (/api/v1/batch/)
+API_MULTI_GET_MAX_IDS = env.int('API_MULTI_GET_MAX_IDS', default=100)
+API_BATCH_MAX_REQUESTS = env.int('API_BATCH_MAX_REQUESTS', default=20)
+
+# Brotli/gzip for API responses (see utils/compression.py)
+API_COMPRESSION_PATHS = env.list('API_COMPRESSION_PATHS', default=['/api/'])
+API_COMPRESSION_MIN_BYTES = env.int('API_COMPRESSION_MIN_BYTES', default=1024)
+# Brotli 0-11 and gzip 1-9; mid levels keep compression cheap per request
+API_COMPRESSION_BROTLI_QUALITY = env.int('API_COMPRESSION_BROTLI_QUALITY', default=5)
+API_COMPRESSION_GZIP_LEVEL = env.int('API_COMPRESSION_GZIP_LEVEL', default=6)
+
 # Crispy Forms
 CRISPY_ALLOWED_TEMPLATE_PACKS = "bootstrap5"
 CRISPY_TEMPLATE_PACK = "bootstrap5"
@@ -251,6 +363,77 @@ CRISPY_TEMPLATE_PACK = "bootstrap5"
 STRIPE_PUBLISHABLE_KEY = env('STRIPE_PUBLISHABLE_KEY', default='')
 STRIPE_SECRET_KEY = env('STRIPE_SECRET_KEY', default='')
 STRIPE_WEBHOOK_SECRET = env('STRIPE_WEBHOOK_SECRET', default='')
+# Override to run against the offline emulator, e.g. http://127.0.0.1:12111
+STRIPE_API_BASE = env('STRIPE_API_BASE', default='')
+
+# Stripe gateway (see apps/payments/gateway.py)
+STRIPE_TIMEOUTS = {
+    'default': env.float('STRIPE_TIMEOUT', default=10.0),
+    'payment_intent.retrieve': 5.0,
+    'payment_intent.list': 15.0,
+    'payment_method.retrieve': 5.0,
+    'payment_intent.create': 20.0,
+    'payment_intent.confirm': 20.0,
+}
+STRIPE_HTTP_POOL_SIZE = env.int('STRIPE_HTTP_POOL_SIZE', default=10)
+# Keep-alive connections for async views; one pool serves a whole event loop
+STRIPE_ASYNC_HTTP_POOL_SIZE = env.int('STRIPE_ASYNC_HTTP_POOL_SIZE', default=50)
+STRIPE_MAX_RETRIES = env.int('STRIPE_MAX_RETRIES', default=2)
+STRIPE_RETRY_BASE_DELAY = 0.25  # seconds, doubled per attempt with full jitter
+STRIPE_RETRY_MAX_DELAY = 2.0
+STRIPE_CIRCUIT_FAILURE_THRESHOLD = env.int('STRIPE_CIRCUIT_FAILURE_THRESHOLD', default=5)
+STRIPE_CIRCUIT_RESET_SECONDS = env.int('STRIPE_CIRCUIT_RESET_SECONDS', default=30)
+
+# Stripe webhook processing (see apps/payments/webhooks.py)
+STRIPE_WEBHOOK_BATCH_SIZE = env.int('STRIPE_WEBHOOK_BATCH_SIZE', default=50)
+STRIPE_WEBHOOK_MAX_ATTEMPTS = env.int('STRIPE_WEBHOOK_MAX_ATTEMPTS', default=8)
+STRIPE_WEBHOOK_RETRY_BASE_SECONDS = env.int('STRIPE_WEBHOOK_RETRY_BASE_SECONDS', default=30)
+STRIPE_WEBHOOK_RETRY_MAX_SECONDS = env.int('STRIPE_WEBHOOK_RETRY_MAX_SECONDS', default=3600)
+# Redis fast-path dedupe window; Stripe retries deliveries for up to 3 days
+STRIPE_WEBHOOK_DEDUPE_TTL = env.int('STRIPE_WEBHOOK_DEDUPE_TTL', default=3 * 24 * 3600)
+
+# Product view counters (see apps/products/view_counts.py): buffered in Redis,
+# written to ProductStats every PRODUCT_VIEWS_FLUSH_INTERVAL seconds
+PRODUCT_VIEWS_FLUSH_INTERVAL = env.float('PRODUCT_VIEWS_FLUSH_INTERVAL', default=60.0)
+PRODUCT_VIEWS_FLUSH_LOCK_SECONDS = env.int('PRODUCT_VIEWS_FLUSH_LOCK_SECONDS', default=300)
+
+# Celery (background tasks)
+# Leave CELERY_BROKER_URL empty to use the DB-polling workers
+# (python manage.py process_webhook_events) instead of a broker.
+CELERY_BROKER_URL = env('CELERY_BROKER_URL', default='')
+CELERY_TASK_IGNORE_RESULT = True
+CELERY_BEAT_SCHEDULE = {
+    # Picks up retries whose backoff has elapsed
+    'process-stripe-webhook-events': {
+        'task': 'apps.payments.tasks.process_webhook_events',
+        'schedule': 30.0,
+    },
+    'build-product-recommendations': {
+        'task': 'apps.products.tasks.build_recommendations',
+        'schedule': crontab(hour=3, minute=0),
+    },
+    'compact-product-leaderboards': {
+        'task': 'apps.products.tasks.compact_leaderboards',
+        'schedule': 15 * 60.0,
+    },
+    'flush-product-views': {
+        'task': 'apps.products.tasks.flush_product_views',
+        'schedule': PRODUCT_VIEWS_FLUSH_INTERVAL,
+    },
+}
+
+# Related products (see apps/products/recommendations.py)
+RECOMMENDATIONS_TOP_K = env.int('RECOMMENDATIONS_TOP_K', default=8)
+# 0 = co-purchases only, 1 = category only
+RECOMMENDATIONS_CATEGORY_WEIGHT = env.float('RECOMMENDATIONS_CATEGORY_WEIGHT', default=0.3)
+RECOMMENDATIONS_LOOKBACK_DAYS = env.int('RECOMMENDATIONS_LOOKBACK_DAYS', default=365)  # 0 = all history
+
+# Best-seller/trending leaderboards (see apps/products/leaderboards.py)
+LEADERBOARD_BESTSELLER_HALF_LIFE_DAYS = env.float('LEADERBOARD_BESTSELLER_HALF_LIFE_DAYS', default=30.0)
+LEADERBOARD_TRENDING_HALF_LIFE_HOURS = env.float('LEADERBOARD_TRENDING_HALF_LIFE_HOURS', default=24.0)
+LEADERBOARD_MAX_SIZE = env.int('LEADERBOARD_MAX_SIZE', default=100000)  # products kept per board
+# How long an order is remembered as counted (confirmations may arrive late and twice)
+LEADERBOARD_ORDER_GUARD_SECONDS = env.int('LEADERBOARD_ORDER_GUARD_SECONDS', default=7 * 24 * 3600)
 
 # Azure B2C Configuration
 AZURE_B2C_TENANT_NAME = env('AZURE_B2C_TENANT_NAME', default='')
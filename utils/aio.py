@@ -0,0 +1,113 @@
+"""
+Helpers for async views (ASYNC_VIEWS, served under ASGI).
+
+Django 4.2 has no async request.user or session API, and Paginator counts
+synchronously, so these resolve them off the event loop. Async ORM calls
+still run on Django's sync thread; what async views free up is the time
+spent waiting on upstreams (Blob Storage, Stripe, Redis).
+
+WhiteNoiseMiddleware is WhiteNoise's middleware made async-capable, so
+that under ASGI requests don't drop to a thread before reaching the view.
+"""
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.contrib.auth.mixins import AccessMixin
+from django.core.paginator import InvalidPage, Paginator
+from django.db.models import QuerySet
+from django.http import Http404
+from whitenoise.middleware import WhiteNoiseMiddleware as BaseWhiteNoiseMiddleware
+
+
+async def get_user(request):
+    """request.user with its lazy lookup done in a thread"""
+
+    def resolve():
+        request.user.is_authenticated  # Forces the session + user lookup
+        return request.user
+
+    return await sync_to_async(resolve)()
+
+
+async def get_session_key(request, create=False):
+    """The request's session key, creating the session if asked"""
+
+    def resolve():
+        if create and not request.session.session_key:
+            request.session.create()
+        return request.session.session_key
+
+    return await sync_to_async(resolve)()
+
+
+async def get_object_or_404(klass, **kwargs):
+    """django.shortcuts.get_object_or_404, awaited"""
+    queryset = klass if isinstance(klass, QuerySet) else klass._default_manager.all()
+    try:
+        return await queryset.aget(**kwargs)
+    except queryset.model.DoesNotExist:
+        raise Http404(f'No {queryset.model._meta.object_name} matches the given query.')
+
+
+class LoginRequiredMixin(AccessMixin):
+    """LoginRequiredMixin for async views; the user is loaded off the loop"""
+
+    async def dispatch(self, request, *args, **kwargs):
+        user = await get_user(request)
+        if not user.is_authenticated:
+            return self.handle_no_permission()
+        return await super().dispatch(request, *args, **kwargs)
+
+
+async def paginate(object_list, per_page, page_number):
+    """
+    (paginator, page) as ListView builds them, with the count and page
+    fetched asynchronously. Invalid pages raise Http404 as ListView does.
+    """
+    paginator = Paginator(object_list, per_page)
+    # Paginator.count is a cached_property; filling it keeps it off the loop
+    if isinstance(object_list, QuerySet):
+        paginator.count = await object_list.acount()
+    else:
+        paginator.count = await sync_to_async(object_list.count)()
+
+    if page_number == 'last':
+        page_number = paginator.num_pages
+    try:
+        if isinstance(object_list, QuerySet):
+            page = paginator.page(page_number)  # Slicing a queryset is lazy
+            page.object_list = [item async for item in page.object_list]
+        else:
+            # Other sequences may do I/O when sliced (leaderboards.RankedProducts)
+            page = await sync_to_async(paginator.page)(page_number)
+            page.object_list = list(page.object_list)
+    except InvalidPage as e:
+        raise Http404(f'Invalid page ({page_number}): {e}')
+    return paginator, page
+
+
+class WhiteNoiseMiddleware(BaseWhiteNoiseMiddleware):
+    """WhiteNoise's middleware; under ASGI only static file hits use a thread"""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response=None, *args, **kwargs):
+        super().__init__(get_response, *args, **kwargs)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return super().__call__(request)
+
+    async def __acall__(self, request):
+        if self.autorefresh:
+            # Looks on disk (DEBUG)
+            static_file = await sync_to_async(self.find_file)(request.path_info)
+        else:
+            static_file = self.files.get(request.path_info)
+        if static_file is not None:
+            # Opens the file
+            return await sync_to_async(self.serve)(static_file, request)
+        return await self.get_response(request)
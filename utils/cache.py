@@ -0,0 +1,290 @@
+"""
+Two-tier cache for hot, rarely-changing data.
+
+Reads go to a bounded in-process LRU first, then to the ``default`` Redis
+cache, and only then to the database:
+
+- the local tier holds at most TIERED_CACHE_LOCAL_MAX_ENTRIES entries for
+  at most TIERED_CACHE_LOCAL_TTL seconds, so a worker never serves data
+  older than that even if an invalidation message is lost
+- concurrent misses for a key are coalesced: one thread per process
+  recomputes, and a short Redis lock keeps other workers on the stale
+  value (or waiting) instead of all hitting the database
+- entries are refreshed early with probability rising towards expiry
+  (XFetch), weighted by how long the value took to compute, so hot keys
+  are normally recomputed before they expire at all
+- invalidate() deletes from Redis and publishes the keys on a pub/sub
+  channel that every worker listens on to evict its local copy
+- values are held pickled in both tiers and unpickled per call, so every
+  caller gets its own objects: prefetch caches or attributes a view sets
+  on a cached model instance never leak into another request
+"""
+
+import json
+import logging
+import math
+import os
+import pickle
+import random
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django_redis import get_redis_connection
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+TIERED_CACHE_REQUESTS = metrics.counter(
+    'tiered_cache_requests_total',
+    'Two-tier cache lookups by the tier that answered',
+    ['result'],
+)
+
+# pickled value, seconds it took to compute, wall-clock expiry of the Redis copy
+Entry = namedtuple('Entry', ['value', 'delta', 'expires_at'])
+
+# Versioned so workers on either side of an Entry format change don't
+# read each other's entries
+KEY_PREFIX = 'tiered:2:'
+
+
+class LocalCache:
+    """Thread-safe LRU with a per-entry deadline"""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            entry, deadline = item
+            if deadline <= time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return entry
+
+    def set(self, key, entry, ttl):
+        with self._lock:
+            self._data[key] = (entry, time.monotonic() + ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class _Flight:
+    """One in-process recompute that other threads can wait on"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.entry = None
+
+
+class TieredCache:
+    def __init__(self, alias='default'):
+        self.alias = alias
+        self.local = LocalCache(settings.TIERED_CACHE_LOCAL_MAX_ENTRIES)
+        self._flights = {}
+        self._flights_lock = threading.Lock()
+        self._listener_pid = None
+
+    @property
+    def remote(self):
+        return caches[self.alias]
+
+    def get_or_set(self, key, compute, ttl, local_ttl=None):
+        """
+        Cached ``compute()`` for ``key``, as a fresh copy on every call.
+        ``ttl`` bounds the Redis copy; ``local_ttl`` (default
+        TIERED_CACHE_LOCAL_TTL) the in-process one.
+        """
+        self._ensure_listener()
+        local_ttl = settings.TIERED_CACHE_LOCAL_TTL if local_ttl is None else local_ttl
+
+        entry = self.local.get(key)
+        if entry is not None and not _expiring(entry):
+            TIERED_CACHE_REQUESTS.inc(result='local_hit')
+            return pickle.loads(entry.value)
+
+        stale = entry
+        entry = self._remote_get(key)
+        if entry is not None:
+            if not _expiring(entry):
+                self.local.set(key, entry, _local_ttl(entry, local_ttl))
+                TIERED_CACHE_REQUESTS.inc(result='redis_hit')
+                return pickle.loads(entry.value)
+            stale = entry
+
+        return pickle.loads(self._recompute(key, compute, ttl, local_ttl, stale).value)
+
+    def invalidate(self, *keys):
+        """Drop ``keys`` from Redis and from every worker's local tier"""
+        for key in keys:
+            self.local.delete(key)
+        try:
+            self.remote.delete_many([KEY_PREFIX + key for key in keys])
+            get_redis_connection(self.alias).publish(settings.TIERED_CACHE_CHANNEL, json.dumps(keys))
+        except Exception as e:
+            # Other workers converge within TIERED_CACHE_LOCAL_TTL regardless
+            logger.warning("Cache invalidation of %s failed: %s", keys, e)
+
+    def _recompute(self, key, compute, ttl, local_ttl, stale):
+        with self._flights_lock:
+            flight = self._flights.get(key)
+            owner = flight is None
+            if owner:
+                flight = self._flights[key] = _Flight()
+
+        if not owner:
+            if stale is not None:
+                TIERED_CACHE_REQUESTS.inc(result='stale')
+                return stale
+            flight.done.wait(settings.TIERED_CACHE_LOCK_TIMEOUT)
+            if flight.entry is not None:
+                TIERED_CACHE_REQUESTS.inc(result='coalesced')
+                return flight.entry
+            # The leader failed or is stuck; don't fail the request over it
+            return self._compute(key, compute, ttl, local_ttl)
+
+        try:
+            flight.entry = self._fill(key, compute, ttl, local_ttl, stale)
+            return flight.entry
+        finally:
+            with self._flights_lock:
+                self._flights.pop(key, None)
+            flight.done.set()
+
+    def _fill(self, key, compute, ttl, local_ttl, stale):
+        """Recompute under a cross-worker lock, or wait for the worker holding it"""
+        lock_key = f'{KEY_PREFIX}lock:{key}'
+        timeout = settings.TIERED_CACHE_LOCK_TIMEOUT
+        try:
+            acquired = self.remote.add(lock_key, 1, timeout=timeout)
+        except Exception:
+            acquired = True  # Redis is down: every worker computes for itself
+
+        if not acquired:
+            if stale is not None:
+                TIERED_CACHE_REQUESTS.inc(result='stale')
+                return stale
+            deadline = time.monotonic() + timeout
+            while time.monotonic() < deadline:
+                time.sleep(0.05)
+                entry = self._remote_get(key)
+                if entry is not None:
+                    self.local.set(key, entry, _local_ttl(entry, local_ttl))
+                    TIERED_CACHE_REQUESTS.inc(result='coalesced')
+                    return entry
+            return self._compute(key, compute, ttl, local_ttl)
+
+        try:
+            return self._compute(key, compute, ttl, local_ttl)
+        finally:
+            try:
+                self.remote.delete(lock_key)
+            except Exception:
+                pass
+
+    def _compute(self, key, compute, ttl, local_ttl):
+        start = time.monotonic()
+        value = pickle.dumps(compute(), pickle.HIGHEST_PROTOCOL)
+        entry = Entry(value, time.monotonic() - start, time.time() + ttl)
+        TIERED_CACHE_REQUESTS.inc(result='miss')
+        try:
+            self.remote.set(KEY_PREFIX + key, entry, timeout=ttl)
+        except Exception as e:
+            logger.warning("Cache write of %s failed: %s", key, e)
+        self.local.set(key, entry, _local_ttl(entry, local_ttl))
+        return entry
+
+    def _remote_get(self, key):
+        try:
+            entry = self.remote.get(KEY_PREFIX + key)
+        except Exception as e:
+            logger.warning("Cache read of %s failed: %s", key, e)
+            return None
+        return Entry(*entry) if entry is not None else None
+
+    def _ensure_listener(self):
+        # Threads don't survive fork, so (re)start per process
+        pid = os.getpid()
+        if self._listener_pid == pid:
+            return
+        with self._flights_lock:
+            if self._listener_pid == pid:
+                return
+            self._listener_pid = pid
+            self.local.clear()
+            threading.Thread(target=self._listen, name='cache-invalidation', daemon=True).start()
+
+    def _listen(self):
+        channel = settings.TIERED_CACHE_CHANNEL
+        while True:
+            try:
+                pubsub = get_redis_connection(self.alias).pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(channel)
+                for message in pubsub.listen():
+                    for key in json.loads(message['data']):
+                        self.local.delete(key)
+            except Exception as e:
+                logger.warning("Cache invalidation listener lost Redis: %s", e)
+            # Messages may have been missed while disconnected
+            self.local.clear()
+            time.sleep(1)
+
+
+def _expiring(entry):
+    """XFetch: recompute early with probability rising as expiry approaches"""
+    beta = settings.TIERED_CACHE_XFETCH_BETA
+    return time.time() - entry.delta * beta * math.log(1.0 - random.random()) >= entry.expires_at
+
+
+def _local_ttl(entry, local_ttl):
+    return max(0.0, min(local_ttl, entry.expires_at - time.time()))
+
+
+_default = None
+_default_lock = threading.Lock()
+
+
+def tiered_cache():
+    """The process-wide TieredCache over the default cache"""
+    global _default
+    if _default is None:
+        with _default_lock:
+            if _default is None:
+                _default = TieredCache()
+    return _default
+
+
+def invalidate_on_change(models, *keys):
+    """Invalidate ``keys`` after any save or delete of ``models`` commits"""
+
+    def handler(sender, using=None, **kwargs):
+        transaction.on_commit(lambda: tiered_cache().invalidate(*keys), using=using)
+
+    for model in models:
+        uid = f'utils.cache:{model._meta.label}:{",".join(keys)}'
+        post_save.connect(handler, sender=model, weak=False, dispatch_uid=uid + ':save')
+        post_delete.connect(handler, sender=model, weak=False, dispatch_uid=uid + ':delete')
@@ -0,0 +1,107 @@
+"""
+Brotli/gzip compression of API responses.
+
+Responses under API_COMPRESSION_PATHS of at least API_COMPRESSION_MIN_BYTES
+are compressed with Brotli when the client accepts it, else gzip. Product
+listings shrink several-fold either way. HTML pages are left alone: they
+carry CSRF tokens, and compressing secrets next to reflected input invites
+BREACH.
+"""
+
+import gzip
+
+import brotli
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+
+from . import metrics
+
+COMPRESSED_BYTES = metrics.counter(
+    'api_compression_bytes_total',
+    'API response bytes before and after compression',
+    ['encoding', 'stage'],
+)
+
+
+def accepted_encodings(header):
+    """{coding: q} from an Accept-Encoding header"""
+    accepted = {}
+    for part in header.split(','):
+        coding, _, params = part.strip().partition(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[coding] = q
+    return accepted
+
+
+def choose_encoding(header):
+    accepted = accepted_encodings(header)
+    wildcard = accepted.get('*', 0)
+    options = [(accepted.get(coding, wildcard), preference, coding) for preference, coding in enumerate(['gzip', 'br'])]
+    q, _, coding = max(options)
+    return coding if q > 0 else None
+
+
+def compress(content, encoding):
+    if encoding == 'br':
+        return brotli.compress(content, quality=settings.API_COMPRESSION_BROTLI_QUALITY)
+    # mtime=0 keeps output deterministic, so identical bodies stay identical
+    return gzip.compress(content, compresslevel=settings.API_COMPRESSION_GZIP_LEVEL, mtime=0)
+
+
+class CompressionMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.paths = tuple(settings.API_COMPRESSION_PATHS)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self.process_response(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        return self.process_response(request, await self.get_response(request))
+
+    def process_response(self, request, response):
+        if not request.path.startswith(self.paths):
+            return response
+        # Varies even when this body is too small: the next one may not be
+        patch_vary_headers(response, ('Accept-Encoding',))
+        if (
+            response.streaming
+            or response.has_header('Content-Encoding')
+            or len(response.content) < settings.API_COMPRESSION_MIN_BYTES
+        ):
+            return response
+
+        encoding = choose_encoding(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        if encoding is None:
+            return response
+        compressed = compress(response.content, encoding)
+        if len(compressed) >= len(response.content):
+            return response
+
+        COMPRESSED_BYTES.inc(len(response.content), encoding=encoding, stage='before')
+        COMPRESSED_BYTES.inc(len(compressed), encoding=encoding, stage='after')
+        response.content = compressed
+        response['Content-Length'] = str(len(compressed))
+        response['Content-Encoding'] = encoding
+        # The compressed body is a different representation
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        return response
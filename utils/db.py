@@ -1,4 +1,24 @@
-"""Database router for read/write splitting"""
+"""Database routers for read/write splitting"""
+
+import contextvars
+import logging
+import random
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+# Per-request pin to the primary; set by ReadYourWritesMiddleware and by
+# writes made while handling the request
+_pinned = contextvars.ContextVar('db_pinned_to_primary', default=False)
+_wrote = contextvars.ContextVar('db_request_wrote', default=None)
+
+PIN_COOKIE_NAME = 'db_pin'
+
 
 class ReadWriteRouter:
     """
@@ -20,4 +40,170 @@ class ReadWriteRouter:
 
     def allow_migrate(self, db, app_label, model_name=None, **hints):
         """Ensure that migrations only happen on the default (primary) database."""
-        return db == 'default'
\ No newline at end of file
+        return db == 'default'
+
+
+class ReplicaMonitor:
+    """
+    Tracks replication lag per replica and ejects the ones that fall behind.
+
+    Lag is measured lazily from the request path at most once every
+    DATABASE_REPLICA_LAG_CHECK_INTERVAL seconds per process; only one thread
+    probes at a time and the others keep using the last measurement.
+    """
+
+    # Postgres: zero when the replica has replayed everything it received,
+    # otherwise the age of the last replayed transaction
+    POSTGRES_LAG_SQL = (
+        "SELECT CASE "
+        "WHEN NOT pg_is_in_recovery() THEN 0 "
+        "WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+        "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END"
+    )
+
+    def __init__(self):
+        self.lag = {}
+        self.checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def measure_lag(self, alias, connection=None):
+        """Replication lag of ``alias`` in seconds (0 where it cannot be measured)"""
+        connection = connection or connections[alias]
+        if connection.vendor != 'postgresql':
+            return 0.0
+        with connection.cursor() as cursor:
+            cursor.execute(self.POSTGRES_LAG_SQL)
+            return float(cursor.fetchone()[0] or 0)
+
+    def record_lag(self, alias, lag):
+        self.lag[alias] = lag
+
+    def refresh(self, aliases, force=False):
+        interval = settings.DATABASE_REPLICA_LAG_CHECK_INTERVAL
+        if not force and time.monotonic() - self.checked_at < interval:
+            return
+        if not self._lock.acquire(blocking=False):
+            return
+        try:
+            for alias in aliases:
+                try:
+                    self.record_lag(alias, self.measure_lag(alias))
+                except Exception as e:
+                    logger.warning("Replica %s lag check failed: %s", alias, e)
+                    self.record_lag(alias, float('inf'))
+            self.checked_at = time.monotonic()
+        finally:
+            self._lock.release()
+
+    def healthy(self, aliases):
+        max_lag = settings.DATABASE_REPLICA_MAX_LAG_SECONDS
+        return [alias for alias in aliases if self.lag.get(alias, 0.0) <= max_lag]
+
+
+class ReplicaAwareRouter(ReadWriteRouter):
+    """
+    Read/write splitting that keeps reads consistent with recent writes.
+
+    Reads go to the primary while a transaction is open on it, for the rest
+    of a request that has written, and for DATABASE_READ_YOUR_WRITES_SECONDS
+    afterwards (carried by a cookie, see ReadYourWritesMiddleware). Other
+    reads are spread over the healthy replicas by DATABASE_REPLICA_WEIGHTS;
+    replicas lagging more than DATABASE_REPLICA_MAX_LAG_SECONDS are skipped,
+    and if none are left the primary serves the read.
+    """
+
+    def __init__(self):
+        self.monitor = ReplicaMonitor()
+
+    @property
+    def replicas(self):
+        return [alias for alias in settings.DATABASES if alias != 'default']
+
+    def db_for_read(self, model, **hints):
+        if _pinned.get() or connections['default'].in_atomic_block:
+            return 'default'
+
+        # Follow related lookups from an object loaded from the primary
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db == 'default':
+            return 'default'
+
+        replicas = self.replicas
+        self.monitor.refresh(replicas)
+        healthy = self.monitor.healthy(replicas)
+        if not healthy:
+            return 'default'
+        if len(healthy) == 1:
+            return healthy[0]
+
+        weights = settings.DATABASE_REPLICA_WEIGHTS
+        return random.choices(healthy, weights=[weights.get(alias, 1) for alias in healthy])[0]
+
+    def db_for_write(self, model, **hints):
+        wrote = _wrote.get()
+        if wrote is not None:
+            # Anything this request reads from now on must see the write
+            _pinned.set(True)
+            wrote.append(model)
+        return 'default'
+
+
+class ReadYourWritesMiddleware:
+    """
+    Pins a client's reads to the primary for a short window after it writes.
+
+    The pin is an expiry timestamp in a cookie, so it works for anonymous
+    users and survives the redirect that usually follows a POST.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        pinned_token, wrote_token = self.start(request)
+        try:
+            response = self.get_response(request)
+            wrote = _wrote.get()
+        finally:
+            _pinned.reset(pinned_token)
+            _wrote.reset(wrote_token)
+        return self.finish(response, wrote)
+
+    async def __acall__(self, request):
+        # Async views' queries run in a thread, which copies this context;
+        # writes made there land in the same _wrote list
+        pinned_token, wrote_token = self.start(request)
+        try:
+            response = await self.get_response(request)
+            wrote = _wrote.get()
+        finally:
+            _pinned.reset(pinned_token)
+            _wrote.reset(wrote_token)
+        return self.finish(response, wrote)
+
+    def start(self, request):
+        try:
+            pinned_until = float(request.COOKIES.get(PIN_COOKIE_NAME, 0))
+        except ValueError:
+            pinned_until = 0
+        return _pinned.set(pinned_until > time.time()), _wrote.set([])
+
+    def finish(self, response, wrote):
+        if wrote:
+            window = settings.DATABASE_READ_YOUR_WRITES_SECONDS
+            response.set_cookie(
+                PIN_COOKIE_NAME,
+                str(time.time() + window),
+                max_age=window,
+                httponly=True,
+                secure=settings.SESSION_COOKIE_SECURE,
+                samesite='Lax',
+            )
+        return response
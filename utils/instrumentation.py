@@ -0,0 +1,185 @@
+"""
+Hot-path instrumentation feeding utils.metrics.
+
+- RequestMetricsMiddleware: latency and DB queries per URL name
+- install_db_instrumentation(): query count/time for every connection
+- InstrumentedRedisClient: django-redis client counting hits and misses,
+  with a trace span per cache operation
+- BLOB_LATENCY: Azure Blob fetch latency (used by apps.core)
+"""
+
+import contextvars
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django_redis.client import DefaultClient
+
+from . import metrics, tracing
+
+REQUEST_LATENCY = metrics.histogram(
+    'http_request_duration_seconds',
+    'Request latency by URL name',
+    ['view', 'method', 'status'],
+)
+REQUEST_QUERIES = metrics.histogram(
+    'http_request_db_queries',
+    'SQL statements per request by URL name',
+    ['view'],
+    buckets=(1, 2, 5, 10, 20, 50, 100, 200, 500),
+)
+DB_QUERIES = metrics.counter(
+    'db_queries_total',
+    'SQL statements executed',
+    ['alias'],
+)
+DB_QUERY_LATENCY = metrics.histogram(
+    'db_query_duration_seconds',
+    'SQL statement latency',
+    ['alias'],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0),
+)
+CACHE_REQUESTS = metrics.counter(
+    'cache_requests_total',
+    'Redis cache reads by result',
+    ['operation', 'result'],
+)
+CACHE_LATENCY = metrics.histogram(
+    'cache_operation_duration_seconds',
+    'Redis cache read latency',
+    ['operation'],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25),
+)
+BLOB_LATENCY = metrics.histogram(
+    'azure_blob_fetch_duration_seconds',
+    'Azure Blob Storage download latency',
+    ['operation'],
+)
+
+# Statements run by the current request (None outside requests)
+_request_queries = contextvars.ContextVar('request_queries', default=None)
+
+_MISSING = object()
+
+
+def _db_wrapper(execute, sql, params, many, context):
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        alias = context['connection'].alias
+        DB_QUERIES.inc(alias=alias)
+        DB_QUERY_LATENCY.observe(time.perf_counter() - start, alias=alias)
+        counter = _request_queries.get()
+        if counter is not None:
+            counter[0] += 1
+
+
+def _install_wrapper(sender, connection, **kwargs):
+    if _db_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_db_wrapper)
+
+
+def install_db_instrumentation():
+    """Time every statement on every connection, including future ones"""
+    connection_created.connect(_install_wrapper, dispatch_uid='utils.instrumentation.db')
+
+
+class RequestMetricsMiddleware:
+    """Observes request latency and query count, labelled by URL name"""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        queries = [0]
+        token = _request_queries.set(queries)
+        start = time.perf_counter()
+        status = 500
+        try:
+            response = self.get_response(request)
+            status = response.status_code
+            return response
+        finally:
+            _request_queries.reset(token)
+            self.observe(request, status, time.perf_counter() - start, queries[0])
+
+    async def __acall__(self, request):
+        # Async views' queries run in a thread, which copies this context
+        queries = [0]
+        token = _request_queries.set(queries)
+        start = time.perf_counter()
+        status = 500
+        try:
+            response = await self.get_response(request)
+            status = response.status_code
+            return response
+        finally:
+            _request_queries.reset(token)
+            self.observe(request, status, time.perf_counter() - start, queries[0])
+
+    def observe(self, request, status, elapsed, queries):
+        match = getattr(request, 'resolver_match', None)
+        # Unresolved paths (404 scans) would explode label cardinality
+        view = match.view_name if match else 'unresolved'
+        REQUEST_LATENCY.observe(elapsed, view=view, method=request.method, status=f'{status // 100}xx')
+        REQUEST_QUERIES.observe(queries, view=view)
+
+        if settings.METRICS_MULTIPROC_DIR:
+            metrics.registry.flush_if_due(settings.METRICS_FLUSH_INTERVAL)
+
+
+class InstrumentedRedisClient(DefaultClient):
+    """
+    django-redis client that records cache hits, misses and read latency,
+    and traces every read and write inside a sampled trace
+    """
+
+    def get(self, key, default=None, version=None, client=None):
+        start = time.perf_counter()
+        with tracing.span('cache get', 'client', **{'cache.key': key}) as trace_span:
+            value = super().get(key, default=_MISSING, version=version, client=client)
+            if trace_span is not None:
+                trace_span.set_attribute('cache.hit', value is not _MISSING)
+        CACHE_LATENCY.observe(time.perf_counter() - start, operation='get')
+        if value is _MISSING:
+            CACHE_REQUESTS.inc(operation='get', result='miss')
+            return default
+        CACHE_REQUESTS.inc(operation='get', result='hit')
+        return value
+
+    def get_many(self, keys, version=None, client=None):
+        keys = list(keys)
+        start = time.perf_counter()
+        with tracing.span('cache get_many', 'client', **{'cache.keys': len(keys)}) as trace_span:
+            found = super().get_many(keys, version=version, client=client)
+            if trace_span is not None:
+                trace_span.set_attribute('cache.hits', len(found))
+        CACHE_LATENCY.observe(time.perf_counter() - start, operation='get_many')
+        CACHE_REQUESTS.inc(len(found), operation='get_many', result='hit')
+        CACHE_REQUESTS.inc(len(keys) - len(found), operation='get_many', result='miss')
+        return found
+
+    def set(self, key, value, *args, **kwargs):
+        with tracing.span('cache set', 'client', **{'cache.key': key}):
+            return super().set(key, value, *args, **kwargs)
+
+    def add(self, key, value, *args, **kwargs):
+        with tracing.span('cache add', 'client', **{'cache.key': key}):
+            return super().add(key, value, *args, **kwargs)
+
+    def delete(self, key, *args, **kwargs):
+        with tracing.span('cache delete', 'client', **{'cache.key': key}):
+            return super().delete(key, *args, **kwargs)
+
+    def incr(self, key, *args, **kwargs):
+        with tracing.span('cache incr', 'client', **{'cache.key': key}):
+            return super().incr(key, *args, **kwargs)
@@ -0,0 +1,241 @@
+"""
+In-process metrics registry: labelled counters and latency histograms.
+
+Under gunicorn each worker has its own registry. When METRICS_MULTIPROC_DIR
+is set, every process periodically dumps its snapshot to a per-pid JSON file
+there and collect() merges them, so /metrics shows totals for the whole
+server no matter which worker answers the scrape.
+"""
+
+import atexit
+import json
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+# Latency buckets in seconds, tuned for DB/cache/HTTP calls
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Metric:
+    """Base class holding one value per label combination"""
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self):
+        """Snapshot of {label values: value}"""
+        with self._lock:
+            return {key: self._copy(value) for key, value in self._values.items()}
+
+    def _copy(self, value):
+        return value
+
+
+class Counter(Metric):
+    """Monotonically increasing counter"""
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Histogram(Metric):
+    """Cumulative-bucket histogram of observed values"""
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = {'buckets': [0] * len(self.buckets), 'count': 0, 'sum': 0.0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state['buckets'][i] += 1
+            state['count'] += 1
+            state['sum'] += value
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the wall-clock duration of the with-block"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _copy(self, value):
+        return {'buckets': list(value['buckets']), 'count': value['count'], 'sum': value['sum']}
+
+
+class Registry:
+    """Get-or-create registry so modules can declare metrics at import time"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+        self._last_flush = 0.0
+
+    def _get_or_create(self, cls, name, documentation, labelnames, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, documentation, labelnames, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"Metric {name} already registered as a {metric.kind}")
+            return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._get_or_create(Counter, name, documentation, labelnames)
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._get_or_create(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def metrics(self):
+        with self._lock:
+            return list(self._metrics.values())
+
+    def snapshot(self):
+        """JSON-serialisable state of every metric in this process"""
+        return {
+            metric.name: {
+                'kind': metric.kind,
+                'documentation': metric.documentation,
+                'labelnames': list(metric.labelnames),
+                'buckets': list(getattr(metric, 'buckets', ())),
+                'samples': [[list(key), value] for key, value in metric.samples().items()],
+            }
+            for metric in self.metrics()
+        }
+
+    def collect(self):
+        """This process's snapshot merged with every other process's dump"""
+        merged = self.snapshot()
+        directory = multiprocess_dir()
+        if not directory:
+            return merged
+        own = _dump_path(directory)
+        for entry in os.scandir(directory):
+            if not entry.name.startswith('metrics_') or entry.path == own:
+                continue
+            try:
+                with open(entry.path) as f:
+                    _merge(merged, json.load(f))
+            except (OSError, ValueError):
+                # Half-written or vanished between scandir and open
+                continue
+        return merged
+
+    def flush(self):
+        """Write this process's snapshot to the multiprocess directory"""
+        directory = multiprocess_dir()
+        if not directory:
+            return
+        fd, tmp = tempfile.mkstemp(dir=directory, prefix='.tmp_')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(self.snapshot(), f)
+        os.replace(tmp, _dump_path(directory))
+        self._last_flush = time.monotonic()
+
+    def flush_if_due(self, interval=5.0):
+        if time.monotonic() - self._last_flush >= interval:
+            self.flush()
+
+
+def multiprocess_dir():
+    """Directory shared by all worker processes, or '' for single-process mode"""
+    try:
+        from django.conf import settings
+        return getattr(settings, 'METRICS_MULTIPROC_DIR', '')
+    except Exception:
+        return os.environ.get('METRICS_MULTIPROC_DIR', '')
+
+
+def _dump_path(directory):
+    return os.path.join(directory, f'metrics_{os.getpid()}.json')
+
+
+def _merge(into, other):
+    for name, metric in other.items():
+        target = into.setdefault(name, {**metric, 'samples': []})
+        samples = {tuple(labels): value for labels, value in target['samples']}
+        for labels, value in metric['samples']:
+            labels = tuple(labels)
+            current = samples.get(labels)
+            if current is None:
+                samples[labels] = value
+            elif metric['kind'] == 'histogram':
+                samples[labels] = {
+                    'buckets': [a + b for a, b in zip(current['buckets'], value['buckets'])],
+                    'count': current['count'] + value['count'],
+                    'sum': current['sum'] + value['sum'],
+                }
+            else:
+                samples[labels] = current + value
+        target['samples'] = [[list(labels), value] for labels, value in samples.items()]
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def exposition(snapshot):
+    """Render a snapshot in the Prometheus text format (version 0.0.4)"""
+    lines = []
+    for name in sorted(snapshot):
+        metric = snapshot[name]
+        labelnames = metric['labelnames']
+        lines.append(f"# HELP {name} {metric['documentation']}")
+        lines.append(f"# TYPE {name} {metric['kind']}")
+        for labels, value in sorted(metric['samples'], key=lambda sample: sample[0]):
+            if metric['kind'] == 'histogram':
+                bounds = metric['buckets'] + [float('inf')]
+                counts = value['buckets'] + [value['count']]
+                for bound, count in zip(bounds, counts):
+                    le = _format_labels(labelnames, labels, [('le', _format_number(bound))])
+                    lines.append(f"{name}_bucket{le} {count}")
+                lines.append(f"{name}_sum{_format_labels(labelnames, labels)} {_format_number(value['sum'])}")
+                lines.append(f"{name}_count{_format_labels(labelnames, labels)} {value['count']}")
+            else:
+                lines.append(f"{name}{_format_labels(labelnames, labels)} {_format_number(value)}")
+    return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+counter = registry.counter
+histogram = registry.histogram
+
+# Don't lose the tail of a worker's counts when gunicorn recycles it
+atexit.register(lambda: multiprocess_dir() and registry.flush())
@@ -0,0 +1,258 @@
+"""
+Per-request SQL inspection: query budgets and N+1 detection.
+
+Every statement run while a QueryRecorder is active is grouped by its
+normalized shape (literals and IN-lists stripped). A shape that repeats
+N_PLUS_ONE_THRESHOLD times is reported as a likely N+1 together with the
+innermost frame of app code that issued it.
+
+    with max_queries(5):
+        client.get('/products/')
+
+raises QueryBudgetExceeded if the block runs more than 5 queries.
+"""
+
+import contextvars
+import logging
+import os
+import re
+import time
+import traceback
+from contextlib import ExitStack, contextmanager
+from pathlib import Path
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+logger = logging.getLogger(__name__)
+
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PARAM_LIST_RE = re.compile(r"\(\s*(?:%s|\?|\$\d+)(?:\s*,\s*(?:%s|\?|\$\d+))*\s*\)")
+_WHITESPACE_RE = re.compile(r"\s+")
+
+# The current request's recorder (set by QueryInspectorMiddleware)
+_request_recorder = contextvars.ContextVar('query_recorder', default=None)
+
+
+class QueryBudgetExceeded(AssertionError):
+    """A request or block ran more queries than its budget allows"""
+
+
+def normalize_sql(sql):
+    """Reduce a statement to its shape so repeats with different params group together"""
+    sql = _STRING_RE.sub('?', sql)
+    sql = _NUMBER_RE.sub('?', sql)
+    sql = _PARAM_LIST_RE.sub('(...)', sql)
+    return _WHITESPACE_RE.sub(' ', sql).strip()
+
+
+# Frames of Django's template engine, wherever it is installed
+_TEMPLATE_DIR = os.path.join('django', 'template', '')
+
+
+def _is_test(path):
+    return 'tests' in path.parts or path.name == 'tests.py' or path.name.startswith('test_')
+
+
+def _origin():
+    """
+    Innermost stack frame in the project's apps.
+
+    Frames elsewhere (utils/ middleware, management commands such as the
+    benches driving a request, libraries) are skipped. If the innermost
+    app frame is a test, the test issued the queries itself ('test code')
+    unless a template was being rendered under it; with no app frame on
+    the stack the queries came from a template.
+    """
+    base_dir = Path(settings.BASE_DIR)
+    apps_dir = os.path.join(base_dir, 'apps', '')
+    rendering = False
+    for frame in reversed(traceback.extract_stack()):
+        filename = frame.filename
+        if _TEMPLATE_DIR in filename:
+            rendering = True
+            continue
+        if not filename.startswith(apps_dir) or 'site-packages' in filename:
+            continue
+        path = Path(filename).relative_to(base_dir)
+        if _is_test(path):
+            return 'template rendering' if rendering else 'test code'
+        if 'management' in path.parts:
+            continue
+        return f"{path}:{frame.lineno} in {frame.name}"
+    return 'template rendering'
+
+
+class QueryRecorder:
+    """execute_wrapper that records every statement on the wrapped connections"""
+
+    def __init__(self, threshold=None):
+        self.threshold = threshold or settings.N_PLUS_ONE_THRESHOLD
+        self.count = 0
+        self.duration = 0.0
+        self.shapes = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.count += 1
+            self.duration += elapsed
+
+            shape = normalize_sql(sql)
+            entry = self.shapes.get(shape)
+            if entry is None:
+                self.shapes[shape] = {'count': 1, 'duration': elapsed, 'sql': sql, 'origin': None}
+            else:
+                entry['count'] += 1
+                entry['duration'] += elapsed
+                # Stack walks are expensive: only pay for them on repeats
+                if entry['origin'] is None:
+                    entry['origin'] = _origin()
+
+    @contextmanager
+    def record(self, using=None):
+        aliases = [using] if using else list(settings.DATABASES)
+        with ExitStack() as stack:
+            for alias in aliases:
+                stack.enter_context(connections[alias].execute_wrapper(self))
+            yield self
+
+    @property
+    def n_plus_one(self):
+        """Repeated shapes, most frequent first"""
+        repeated = [
+            {'shape': shape, **entry}
+            for shape, entry in self.shapes.items()
+            if entry['count'] >= self.threshold
+        ]
+        return sorted(repeated, key=lambda e: e['count'], reverse=True)
+
+    @property
+    def duplicates(self):
+        return sum(entry['count'] - 1 for entry in self.shapes.values())
+
+    def summary(self):
+        lines = [f"{self.count} queries in {self.duration * 1000:.1f}ms"]
+        for entry in self.n_plus_one:
+            lines.append(f"  N+1 x{entry['count']} at {entry['origin']}: {entry['shape'][:200]}")
+        return '\n'.join(lines)
+
+
+@contextmanager
+def max_queries(budget, using=None, threshold=None):
+    """
+    Test helper: fail if the block runs more than ``budget`` queries.
+
+    The error message lists the repeated shapes and where they came from.
+    """
+    recorder = QueryRecorder(threshold=threshold)
+    with recorder.record(using=using):
+        yield recorder
+    if recorder.count > budget:
+        raise QueryBudgetExceeded(f"Query budget of {budget} exceeded: {recorder.summary()}")
+
+
+def budget_for(view_name):
+    """Configured query budget for a URL name, falling back to QUERY_BUDGET_DEFAULT"""
+    return settings.QUERY_BUDGETS.get(view_name, settings.QUERY_BUDGET_DEFAULT)
+
+
+def _request_wrapper(execute, sql, params, many, context):
+    recorder = _request_recorder.get()
+    if recorder is None:
+        return execute(sql, params, many, context)
+    return recorder(execute, sql, params, many, context)
+
+
+def _install_wrapper(sender, connection, **kwargs):
+    if _request_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_request_wrapper)
+
+
+def install_query_inspection():
+    """
+    Let QueryInspectorMiddleware see every connection's queries. Async views
+    run theirs on another thread's connections, so a recorder wrapped
+    around the request's own connections would miss them.
+    """
+    connection_created.connect(_install_wrapper, dispatch_uid='utils.queries.request')
+
+
+class QueryInspectorMiddleware:
+    """
+    Records the queries of every request and checks them against QUERY_BUDGETS.
+
+    Over-budget requests and N+1 shapes are logged as warnings; with
+    QUERY_BUDGET_STRICT (tests) an over-budget request raises instead. In
+    DEBUG the counts are returned in X-Query-* response headers.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not settings.QUERY_INSPECTOR_ENABLED:
+            return self.get_response(request)
+
+        recorder = QueryRecorder()
+        token = _request_recorder.set(recorder)
+        try:
+            response = self.get_response(request)
+        finally:
+            _request_recorder.reset(token)
+        return self.check(request, recorder, response)
+
+    async def __acall__(self, request):
+        if not settings.QUERY_INSPECTOR_ENABLED:
+            return await self.get_response(request)
+
+        recorder = QueryRecorder()
+        token = _request_recorder.set(recorder)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _request_recorder.reset(token)
+        return self.check(request, recorder, response)
+
+    def check(self, request, recorder, response):
+        match = getattr(request, 'resolver_match', None)
+        view_name = match.view_name if match else request.path
+        budget = budget_for(view_name)
+
+        for entry in recorder.n_plus_one:
+            logger.warning(
+                "N+1 in %s: %s queries of one shape at %s: %s",
+                view_name, entry['count'], entry['origin'], entry['shape'][:200],
+            )
+
+        if budget is not None and recorder.count > budget:
+            message = f"{view_name} ran {recorder.count} queries (budget {budget})"
+            if settings.QUERY_BUDGET_STRICT:
+                raise QueryBudgetExceeded(f"{message}\n{recorder.summary()}")
+            logger.warning(message)
+
+        if settings.DEBUG:
+            response['X-Query-Count'] = str(recorder.count)
+            response['X-Query-Time-Ms'] = f"{recorder.duration * 1000:.1f}"
+            response['X-Query-Duplicates'] = str(recorder.duplicates)
+            if budget is not None:
+                response['X-Query-Budget'] = str(budget)
+            n_plus_one = recorder.n_plus_one
+            if n_plus_one:
+                response['X-Query-N-Plus-One'] = '; '.join(
+                    f"x{entry['count']} {entry['origin']}" for entry in n_plus_one[:3]
+                )
+        return response
@@ -0,0 +1,262 @@
+"""
+Sparse fieldsets and expansion control for DRF serializers.
+
+    ?fields=id,name,price,category.name
+    ?expand=category
+
+``fields`` picks the fields to return; dotted paths pick fields of nested
+objects (and imply expanding them). ``expand`` lists the nested objects to
+embed: any other field in a serializer's Meta.expandable is rendered as
+the related primary key(s) instead. Without ``?expand=`` each serializer
+embeds its Meta.default_expand, so existing clients see no change.
+
+The selection also drives the queryset: DynamicFieldsViewMixin loads only
+the selected columns and joins or prefetches only the selected relations.
+Fields that aren't plain columns declare what they read in
+Meta.field_dependencies, as lookups ('price', 'stats__view_count',
+'items__quantity'); a field whose source can't be resolved makes its
+model load in full rather than risk a query per row.
+"""
+
+from collections import namedtuple
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch, QuerySet, prefetch_related_objects
+from rest_framework import serializers
+
+FIELDS_PARAM = 'fields'
+EXPAND_PARAM = 'expand'
+
+
+def parse_paths(value):
+    """'a,b.c,b.d' -> {'a': {}, 'b': {'c': {}, 'd': {}}}"""
+    tree = {}
+    for path in value.split(','):
+        node = tree
+        for part in path.strip().split('.'):
+            if part:
+                node = node.setdefault(part, {})
+    return tree
+
+
+class Selection(namedtuple('Selection', ['fields', 'expand'])):
+    """Parsed ?fields= / ?expand= trees; None means the parameter wasn't given"""
+
+    @classmethod
+    def from_request(cls, request):
+        if request is None:
+            return cls(None, None)
+        params = getattr(request, 'query_params', request.GET)
+        fields = params.get(FIELDS_PARAM)
+        expand = params.get(EXPAND_PARAM)
+        return cls(
+            parse_paths(fields) if fields else None,
+            # An empty ?expand= is meaningful: collapse everything
+            parse_paths(expand) if expand is not None else None,
+        )
+
+    @property
+    def is_default(self):
+        return self.fields is None and self.expand is None
+
+    def includes(self, name):
+        return self.fields is None or name in self.fields
+
+    def expands(self, name, default=()):
+        if self.fields and self.fields.get(name):
+            return True
+        if self.expand is None:
+            return name in default
+        return name in self.expand
+
+    def child(self, name):
+        fields = self.fields.get(name) if self.fields else None
+        expand = None if self.expand is None else self.expand.get(name, {})
+        return Selection(fields or None, expand)
+
+
+def _collapsed(field):
+    """The primary-key field that stands in for an unexpanded nested serializer"""
+    kwargs = {'source': field.source} if field.source else {}
+    return serializers.PrimaryKeyRelatedField(
+        many=isinstance(field, serializers.ListSerializer), read_only=True, **kwargs
+    )
+
+
+class DynamicFieldsMixin:
+    """
+    Serializer mixin applying ?fields= and ?expand=. The root serializer
+    reads them from the request in its context; nested ones get their part
+    of the selection from their parent. ``selection`` overrides both.
+    """
+
+    def __init__(self, *args, selection=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.selection = selection
+
+    def get_selection(self):
+        if self.selection is None:
+            parent = self.parent
+            if isinstance(parent, serializers.ListSerializer):
+                parent = parent.parent
+            # Nested under a serializer without the mixin: plain defaults
+            request = self.context.get('request') if parent is None else None
+            self.selection = Selection.from_request(request)
+        return self.selection
+
+    def get_fields(self):
+        fields = super().get_fields()
+        selection = self.get_selection()
+        meta = getattr(self, 'Meta', None)
+        expandable = getattr(meta, 'expandable', ())
+        default_expand = getattr(meta, 'default_expand', ())
+
+        if selection.fields is not None:
+            unknown = sorted(set(selection.fields) - set(fields))
+            if unknown:
+                raise serializers.ValidationError({FIELDS_PARAM: f"Unknown field(s): {', '.join(unknown)}"})
+
+        selected = {}
+        for name, field in fields.items():
+            if not selection.includes(name):
+                continue
+            if name in expandable and not selection.expands(name, default_expand):
+                field = _collapsed(field)
+            nested = field.child if isinstance(field, serializers.ListSerializer) else field
+            if isinstance(nested, DynamicFieldsMixin):
+                nested.selection = selection.child(name)
+            selected[name] = field
+        return selected
+
+
+class QueryPlan:
+    """Columns, joins and prefetches one serializer needs from one model"""
+
+    def __init__(self, model):
+        self.model = model
+        self.columns = set()  # None: every column
+        self.related = {}     # forward and one-to-one relations -> QueryPlan (select_related)
+        self.many = {}        # many-valued relations -> QueryPlan (Prefetch)
+
+    @classmethod
+    def for_serializer(cls, serializer, model):
+        plan = cls(model)
+        plan.add_serializer(serializer)
+        return plan
+
+    def relation(self, field):
+        if field.many_to_many or field.one_to_many:
+            plan = self.many.get(field.name)
+            if plan is None:
+                plan = self.many[field.name] = QueryPlan(field.related_model)
+                if field.one_to_many:
+                    # The prefetch matches rows to parents on the foreign key
+                    plan.columns.add(field.field.name)
+                else:
+                    plan.columns = None
+            return plan
+        if field.concrete and self.columns is not None:
+            self.columns.add(field.name)
+        return self.related.setdefault(field.name, QueryPlan(field.related_model))
+
+    def add(self, lookup):
+        """Require ``lookup``; one ending on a relation needs the related rows in full"""
+        plan = self
+        for part in lookup.split('__'):
+            try:
+                field = plan.model._meta.get_field(part)
+            except FieldDoesNotExist:
+                plan.columns = None
+                return
+            if not field.is_relation:
+                if plan.columns is not None:
+                    plan.columns.add(field.name)
+                return
+            plan = plan.relation(field)
+        plan.columns = None
+
+    def add_serializer(self, serializer):
+        meta = getattr(serializer, 'Meta', None)
+        dependencies = getattr(meta, 'field_dependencies', {})
+        for name, field in serializer.fields.items():
+            if name in dependencies:
+                for lookup in dependencies[name]:
+                    self.add(lookup)
+            elif field.source == '*':
+                self.columns = None
+            elif isinstance(field, serializers.SerializerMethodField):
+                # Method fields list any columns they read in field_dependencies
+                continue
+            elif isinstance(field, (serializers.ListSerializer, serializers.BaseSerializer, serializers.ManyRelatedField)):
+                nested = field.child if isinstance(field, serializers.ListSerializer) else field
+                try:
+                    model_field = self.model._meta.get_field(field.source)
+                except FieldDoesNotExist:
+                    self.columns = None
+                    continue
+                plan = self.relation(model_field)
+                if isinstance(field, serializers.ManyRelatedField):
+                    plan.add(plan.model._meta.pk.name)
+                else:
+                    plan.add_serializer(nested)
+            elif isinstance(field, serializers.RelatedField):
+                # A collapsed relation needs only its key column
+                try:
+                    model_field = self.model._meta.get_field(field.source)
+                except FieldDoesNotExist:
+                    self.columns = None
+                    continue
+                if model_field.concrete:
+                    if self.columns is not None:
+                        self.columns.add(model_field.name)
+                else:
+                    self.relation(model_field).add(model_field.related_model._meta.pk.name)
+            else:
+                self.add('__'.join(field.source_attrs))
+
+    def _collect(self, prefix, only, select, prefetch):
+        opts = self.model._meta
+        columns = self.columns if self.columns is not None else {field.name for field in opts.concrete_fields}
+        only.extend(prefix + column for column in columns | {opts.pk.name})
+        for name, plan in self.related.items():
+            select.append(prefix + name)
+            plan._collect(f'{prefix}{name}__', only, select, prefetch)
+        for name, plan in self.many.items():
+            prefetch.append(Prefetch(prefix + name, queryset=plan.apply(plan.model._default_manager.all())))
+
+    def apply(self, queryset):
+        """``queryset`` narrowed to this plan; replaces its own select/prefetch_related"""
+        only, select, prefetch = [], [], []
+        self._collect('', only, select, prefetch)
+        queryset = queryset.select_related(None).prefetch_related(None)
+        if select:
+            queryset = queryset.select_related(*select)
+        return queryset.only(*only).prefetch_related(*prefetch)
+
+    def prefetch(self, instances):
+        """Load this plan's relations onto already-fetched ``instances``"""
+        lookups = []
+        for name, plan in [*self.related.items(), *self.many.items()]:
+            lookups.append(Prefetch(name, queryset=plan.apply(plan.model._default_manager.all())))
+        prefetch_related_objects(instances, *lookups)
+
+
+def optimize_queryset(queryset, serializer):
+    """``queryset`` loading only what ``serializer`` will read"""
+    if not isinstance(queryset, QuerySet):
+        return queryset
+    return QueryPlan.for_serializer(serializer, queryset.model).apply(queryset)
+
+
+class DynamicFieldsViewMixin:
+    """
+    GenericAPIView mixin: list and retrieve load only the selected fields.
+    Custom actions may respond with another serializer, so they narrow
+    their own querysets with optimize_queryset().
+    """
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if getattr(self, 'action', None) not in (None, 'list', 'retrieve'):
+            return queryset
+        return optimize_queryset(queryset, self.get_serializer())
@@ -0,0 +1,391 @@
+"""
+Lightweight distributed tracing.
+
+A trace starts at a request (TracingMiddleware) or a Celery task and is
+sampled once, at its root, with TRACING_SAMPLE_RATE. Child spans are only
+recorded inside a sampled trace, so unsampled or disabled tracing costs a
+context-variable lookup per instrumented call. Finished traces are handed
+to the exporters in TRACING_EXPORTERS:
+
+- 'console': one JSON line per span on the utils.tracing logger
+- 'jsonl': appended to TRACING_JSONL_PATH, for offline analysis
+- 'azure': Application Insights via opencensus-ext-azure
+- or a dotted path to any class with export(spans)
+
+Context crosses process boundaries as a W3C ``traceparent`` header, on
+incoming HTTP requests and on Celery task messages.
+"""
+
+import contextvars
+import json
+import logging
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+_current = contextvars.ContextVar('tracing_current_span', default=None)
+
+
+class Span:
+    __slots__ = ('trace', 'name', 'kind', 'span_id', 'parent_id', 'start', 'end', 'attributes', 'error')
+
+    def __init__(self, trace, name, kind, parent_id, attributes):
+        self.trace = trace
+        self.name = name
+        self.kind = kind
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.start = time.time()
+        self.end = None
+        self.attributes = attributes
+        self.error = None
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def finish(self, error=None):
+        self.end = time.time()
+        if error is not None:
+            self.error = f'{type(error).__name__}: {error}'
+        self.trace.record(self)
+
+    @property
+    def traceparent(self):
+        return f'00-{self.trace.trace_id}-{self.span_id}-01'
+
+    def to_dict(self):
+        return {
+            'trace_id': self.trace.trace_id,
+            'span_id': self.span_id,
+            'parent_id': self.parent_id,
+            'name': self.name,
+            'kind': self.kind,
+            'start': self.start,
+            'duration_ms': round((self.end - self.start) * 1000, 3),
+            'attributes': self.attributes,
+            'error': self.error,
+        }
+
+
+class Trace:
+    """Collects the spans of one sampled trace in this process"""
+
+    def __init__(self, trace_id=None):
+        self.trace_id = trace_id or os.urandom(16).hex()
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def record(self, span):
+        with self._lock:
+            self.spans.append(span)
+
+
+def parse_traceparent(header):
+    """(trace_id, parent span id, sampled) from a W3C traceparent, or None"""
+    try:
+        version, trace_id, span_id, flags = header.strip().split('-')
+        int(trace_id, 16), int(span_id, 16)
+    except (AttributeError, ValueError):
+        return None
+    if version != '00' or len(trace_id) != 32 or len(span_id) != 16:
+        return None
+    return trace_id, span_id, int(flags, 16) & 1 == 1
+
+
+def current_span():
+    return _current.get()
+
+
+def current_traceparent():
+    span = _current.get()
+    return span.traceparent if span is not None else None
+
+
+def start_root(name, kind='server', traceparent=None, **attributes):
+    """
+    Start the root span of a trace in this process, or return None if the
+    trace isn't sampled. An incoming traceparent joins the caller's trace and
+    follows its sampling decision.
+    """
+    if not settings.TRACING_ENABLED:
+        return None
+    parent = parse_traceparent(traceparent) if traceparent else None
+    if parent is not None:
+        trace_id, parent_id, sampled = parent
+    else:
+        trace_id, parent_id = None, None
+        sampled = random.random() < settings.TRACING_SAMPLE_RATE
+    if not sampled:
+        return None
+    return Span(Trace(trace_id), name, kind, parent_id, attributes)
+
+
+def start_span(name, kind='internal', **attributes):
+    """Start a child of the current span; None when there is no sampled trace"""
+    parent = _current.get()
+    if parent is None:
+        return None
+    return Span(parent.trace, name, kind, parent.span_id, attributes)
+
+
+@contextmanager
+def activate(span):
+    """Make ``span`` current for the block, finish it, and export if it is a root"""
+    if span is None:
+        yield None
+        return
+    token = _current.set(span)
+    error = None
+    try:
+        yield span
+    except BaseException as e:
+        error = e
+        raise
+    finally:
+        _current.reset(token)
+        span.finish(error)
+        if _current.get() is None or _current.get().trace is not span.trace:
+            export(span.trace)
+
+
+@contextmanager
+def span(name, kind='internal', **attributes):
+    """Child span around a block (no-op outside a sampled trace)"""
+    with activate(start_span(name, kind, **attributes)) as child:
+        yield child
+
+
+# Exporters
+
+class ConsoleExporter:
+    def export(self, spans):
+        for item in spans:
+            logger.info(json.dumps(item.to_dict(), default=str))
+
+
+class JsonLinesExporter:
+    def __init__(self):
+        self.path = settings.TRACING_JSONL_PATH
+        self._lock = threading.Lock()
+
+    def export(self, spans):
+        lines = ''.join(json.dumps(item.to_dict(), default=str) + '\n' for item in spans)
+        with self._lock, open(self.path, 'a') as f:
+            f.write(lines)
+
+
+class AzureExporter:
+    """Ships spans to Application Insights through opencensus-ext-azure"""
+
+    KINDS = {'server': 1, 'client': 2}
+
+    def __init__(self):
+        from opencensus.ext.azure.trace_exporter import AzureExporter as OpenCensusAzureExporter
+
+        self.exporter = OpenCensusAzureExporter(
+            connection_string=settings.APPLICATIONINSIGHTS_CONNECTION_STRING,
+        )
+
+    def export(self, spans):
+        from opencensus.trace.span_context import SpanContext
+        from opencensus.trace.span_data import SpanData
+        from opencensus.trace.status import Status
+
+        self.exporter.export([
+            SpanData(
+                name=item.name,
+                context=SpanContext(trace_id=item.trace.trace_id, span_id=item.span_id),
+                span_id=item.span_id,
+                parent_span_id=item.parent_id,
+                attributes={key: str(value) for key, value in item.attributes.items()},
+                start_time=_iso(item.start),
+                end_time=_iso(item.end),
+                child_span_count=0,
+                stack_trace=None,
+                annotations=None,
+                message_events=None,
+                links=None,
+                status=Status(2, item.error) if item.error else Status(0),
+                same_process_as_parent_span=None,
+                span_kind=self.KINDS.get(item.kind, 0),
+            )
+            for item in spans
+        ])
+
+
+def _iso(timestamp):
+    return datetime.fromtimestamp(timestamp, tz=timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+
+
+EXPORTER_ALIASES = {
+    'console': ConsoleExporter,
+    'jsonl': JsonLinesExporter,
+    'azure': AzureExporter,
+}
+
+_exporters = None
+_exporters_lock = threading.Lock()
+
+
+def exporters():
+    global _exporters
+    if _exporters is None:
+        with _exporters_lock:
+            if _exporters is None:
+                _exporters = [
+                    (EXPORTER_ALIASES.get(path) or import_string(path))()
+                    for path in settings.TRACING_EXPORTERS
+                ]
+    return _exporters
+
+
+def export(trace):
+    for exporter in exporters():
+        try:
+            exporter.export(trace.spans)
+        except Exception as e:
+            logger.warning("Trace export via %s failed: %s", type(exporter).__name__, e)
+
+
+# Integrations
+
+class TracingMiddleware:
+    """Root span per request, joined to the caller's trace via traceparent"""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        root = self.start(request)
+        if root is None:
+            return self.get_response(request)
+
+        with activate(root):
+            return self.finish(request, root, self.get_response(request))
+
+    async def __acall__(self, request):
+        root = self.start(request)
+        if root is None:
+            return await self.get_response(request)
+
+        with activate(root):
+            return self.finish(request, root, await self.get_response(request))
+
+    def start(self, request):
+        return start_root(
+            f'{request.method} {request.path}',
+            traceparent=request.headers.get('traceparent'),
+            **{'http.method': request.method, 'http.path': request.path},
+        )
+
+    def finish(self, request, root, response):
+        match = getattr(request, 'resolver_match', None)
+        if match is not None:
+            root.name = f'{request.method} {match.view_name}'
+        root.set_attribute('http.status_code', response.status_code)
+        response['traceparent'] = root.traceparent
+        return response
+
+
+def _db_wrapper(execute, sql, params, many, context):
+    child = start_span('db.query', 'client', **{'db.alias': context['connection'].alias, 'db.statement': sql[:500]})
+    if child is None:
+        return execute(sql, params, many, context)
+    with activate(child):
+        return execute(sql, params, many, context)
+
+
+def _install_db_wrapper(sender, connection, **kwargs):
+    if _db_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_db_wrapper)
+
+
+def install_db_tracing():
+    connection_created.connect(_install_db_wrapper, dispatch_uid='utils.tracing.db')
+
+
+def blob_client_options():
+    """kwargs for BlobServiceClient that trace every HTTP call it makes"""
+    return {'per_call_policies': [BlobTracingPolicy()]}
+
+
+try:
+    from azure.core.pipeline.policies import SansIOHTTPPolicy
+except ImportError:  # pragma: no cover - azure-core ships with azure-storage-blob
+    SansIOHTTPPolicy = object
+
+
+class BlobTracingPolicy(SansIOHTTPPolicy):
+    """azure-core pipeline policy: one client span per Blob Storage request"""
+
+    def on_request(self, request):
+        http_request = request.http_request
+        request.context['tracing_span'] = start_span(
+            f'blob {http_request.method}', 'client',
+            **{'http.method': http_request.method, 'http.url': http_request.url.split('?')[0]},
+        )
+
+    def on_response(self, request, response):
+        child = request.context.get('tracing_span')
+        if child is not None:
+            child.set_attribute('http.status_code', response.http_response.status_code)
+            child.finish()
+
+    def on_exception(self, request):
+        child = request.context.get('tracing_span')
+        if child is not None:
+            child.finish(RuntimeError('blob request failed'))
+
+
+# Celery propagation
+
+def _inject_task_context(headers=None, **kwargs):
+    traceparent = current_traceparent()
+    if traceparent and headers is not None:
+        headers['traceparent'] = traceparent
+
+
+_task_roots = {}
+
+
+def _start_task_span(task_id=None, task=None, **kwargs):
+    traceparent = getattr(task.request, 'traceparent', None) if task is not None else None
+    root = start_root(f'celery {task.name}', 'consumer', traceparent=traceparent, **{'celery.task_id': task_id})
+    if root is not None:
+        _task_roots[task_id] = (root, _current.set(root))
+
+
+def _finish_task_span(task_id=None, **kwargs):
+    entry = _task_roots.pop(task_id, None)
+    if entry is None:
+        return
+    root, token = entry
+    _current.reset(token)
+    root.finish()
+    export(root.trace)
+
+
+def install_celery_hooks():
+    """Carry trace context on task messages and trace task execution"""
+    from celery import signals
+
+    signals.before_task_publish.connect(_inject_task_context, weak=False, dispatch_uid='utils.tracing.publish')
+    signals.task_prerun.connect(_start_task_span, weak=False, dispatch_uid='utils.tracing.prerun')
+    signals.task_postrun.connect(_finish_task_span, weak=False, dispatch_uid='utils.tracing.postrun')